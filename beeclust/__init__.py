@@ -1,5 +1,15 @@
 from beeclust.beeclustClass import BeeClust
-from beeclust.gui import main
+from beeclust.ensemble import BeeClustEnsemble
+from beeclust.tracking import SwarmTracker
+from beeclust.recording import TrajectoryRecorder, Trajectory
 
 
-__all__ = ['main']
\ No newline at end of file
+def main():
+    """
+    Run the GUI, PyQt5 is imported only now, so the simulation can be used without it.
+    """
+    from beeclust.gui import main
+    return main()
+
+
+__all__ = ['BeeClust', 'BeeClustEnsemble', 'SwarmTracker', 'TrajectoryRecorder', 'Trajectory', 'main']
\ No newline at end of file
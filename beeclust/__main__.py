@@ -1,3 +1,9 @@
-from beeclust.gui import main
+import sys
 
-main()
\ No newline at end of file
+if sys.argv[1:2] == ['run']:
+    # headless batch runs, Qt is not imported
+    from beeclust.batch import main
+    main(sys.argv[2:])
+else:
+    from beeclust.gui import main
+    main()
\ No newline at end of file
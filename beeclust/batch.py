@@ -0,0 +1,179 @@
+import argparse
+import csv
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from beeclust.beeclustClass import BeeClust
+from beeclust.helpers import check_bound, check_type
+from beeclust.io import PARAMETERS, is_map_file, load_text
+
+
+COLUMNS = ('seed', 'ticks', 'score', 'bees', 'moved', 'swarms', 'largest_swarm', 'mean_swarm')
+"""Statistics of one run saved by run_batch, columns of the varied parameters are added before them"""
+
+
+def configurations(seeds, grid=None):
+    """
+    List of keyword arguments of BeeClust for all combinations of values of parameters and seeds.
+
+    seeds - list of seeds
+
+    grid - dictionary of parameter name and list of its values
+    """
+    grid = grid or {}
+    names = list(grid)
+    return [dict(zip(names, values), seed=seed)
+            for values in itertools.product(*(grid[name] for name in names)) for seed in seeds]
+
+
+def simulate(path, parameters, ticks, every=None, stop_moved=None, stop_score=None):
+    """
+    Run one simulation on the map from the file (binary map file or text map). Return tuple (statistics, moved,
+    scores), statistics is dictionary of COLUMNS, moved is numpy array with number of bees which moved
+    in each tick and scores are scores after every `every` ticks.
+
+    parameters - keyword arguments of BeeClust, they replace parameters saved in the binary map file
+
+    ticks - maximal number of simulation steps
+
+    every - number of steps between the checks of stop conditions (None for only one check at the end)
+
+    stop_moved - stop when at most this number of bees moved in the last step
+
+    stop_score - stop when the score is at least this value
+    """
+    check_type(ticks, [int], "ticks")
+    check_bound(ticks, 0, None, "ticks must be positive.")
+    if every is not None:
+        check_type(every, [int], "every")
+        check_bound(every, 1, None, "every must be positive.")
+    if is_map_file(path):
+        b = BeeClust.from_file(path, **parameters)
+    else:
+        b = BeeClust(load_text(path), **parameters)
+
+    step = ticks if every is None else every
+    moved, scores = [], []
+    done = 0
+    while done < ticks:
+        moved.append(b.run(min(step, ticks - done)))
+        done += len(moved[-1])
+        scores.append(b.score)
+        if stop_moved is not None and moved[-1][-1] <= stop_moved:
+            break
+        if stop_score is not None and b.score >= stop_score:
+            break
+    moved = np.concatenate(moved) if moved else np.zeros(0, dtype=np.int64)
+
+    _, offsets, _ = b.swarm_labels()
+    sizes = np.diff(offsets)
+    statistics = {
+        'seed': b.seed,
+        'ticks': done,
+        'score': b.score,
+        'bees': b.bee_count,
+        'moved': int(moved[-1]) if len(moved) else 0,
+        'swarms': len(sizes),
+        'largest_swarm': int(sizes.max()) if len(sizes) else 0,
+        'mean_swarm': float(sizes.mean()) if len(sizes) else 0.,
+    }
+    return statistics, moved, np.array(scores)
+
+
+def run_batch(path, configurations, ticks, every=None, stop_moved=None, stop_score=None, workers=None):
+    """
+    Run simulation (see simulate) for each of the configurations (list of keyword arguments of BeeClust,
+    see configurations) in the pool of worker processes. Return dictionary of columns (numpy arrays
+    with one item for each run): parameters of configurations and COLUMNS, moved_per_tick (runs x ticks,
+    -1 after the run stopped) and score_samples (runs x samples, nan after the run stopped).
+
+    workers - number of processes (None for number of CPUs), with 1 the runs are done in this process
+    """
+    configurations = list(configurations)
+    arguments = ([path] * len(configurations), configurations, [ticks] * len(configurations),
+                 [every] * len(configurations), [stop_moved] * len(configurations),
+                 [stop_score] * len(configurations))
+    if workers == 1:
+        results = list(map(simulate, *arguments))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(simulate, *arguments))
+
+    names = [name for name in dict.fromkeys(itertools.chain.from_iterable(configurations)) if name != 'seed']
+    columns = {name: np.array([c.get(name) for c in configurations]) for name in names}
+    for name in COLUMNS:
+        columns[name] = np.array([statistics[name] for statistics, _, _ in results])
+    columns['moved_per_tick'] = _pad([moved for _, moved, _ in results], -1, np.int64)
+    columns['score_samples'] = _pad([scores for _, _, scores in results], np.nan, np.float64)
+    return columns
+
+
+def save_results(path, columns):
+    """
+    Save columns returned by run_batch. File with .csv suffix has only the columns with one value for each run,
+    other files are saved as compressed numpy .npz file with all columns.
+    """
+    if str(path).endswith('.csv'):
+        names = [name for name, column in columns.items() if column.ndim == 1]
+        with open(path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(names)
+            writer.writerows(zip(*(columns[name].tolist() for name in names)))
+    else:
+        np.savez_compressed(path, **columns)
+
+
+def main(argv=None):
+    """
+    Command line interface of batch runs, python -m beeclust run --help shows the usage.
+    """
+    parser = argparse.ArgumentParser(prog='python -m beeclust run',
+                                     description='Run BeeClust simulations without GUI and save their statistics.')
+    parser.add_argument('map', help='binary map file or text file with map')
+    parser.add_argument('-o', '--output', required=True, help='output file, .csv or .npz')
+    parser.add_argument('-t', '--ticks', type=int, default=1000, help='maximal number of steps (default 1000)')
+    seeds = parser.add_mutually_exclusive_group()
+    seeds.add_argument('-s', '--seeds', type=int, nargs='+', help='seeds of runs')
+    seeds.add_argument('-n', '--runs', type=int, default=1, help='number of runs with seeds 0, 1, ... (default 1)')
+    parser.add_argument('-p', '--parameter', action='append', default=[], metavar='NAME=VALUE[,VALUE...]',
+                        help='parameter of simulation, runs are done for all combinations of values')
+    parser.add_argument('-e', '--every', type=int, default=100,
+                        help='steps between checks of stop conditions and score samples (default 100)')
+    parser.add_argument('--stop-moved', type=int, help='stop when at most this number of bees moved')
+    parser.add_argument('--stop-score', type=float, help='stop when the score is at least this value')
+    parser.add_argument('-j', '--workers', type=int, help='number of processes (default number of CPUs)')
+    args = parser.parse_args(argv)
+
+    grid = {}
+    for parameter in args.parameter:
+        name, _, values = parameter.partition('=')
+        if name not in PARAMETERS or name == 'seed' or not values:
+            parser.error("wrong parameter {}, use NAME=VALUE[,VALUE...] with NAME from {}.".format(
+                parameter, ', '.join(name for name in PARAMETERS if name != 'seed')))
+        grid[name] = [_value(value) for value in values.split(',')]
+    if args.every < 1:
+        parser.error("every must be positive.")
+    seeds = args.seeds if args.seeds is not None else list(range(args.runs))
+
+    columns = run_batch(args.map, configurations(seeds, grid), args.ticks, args.every,
+                        args.stop_moved, args.stop_score, args.workers)
+    save_results(args.output, columns)
+
+
+def _value(text):
+    # number or string value of parameter given on the command line
+    for t in (int, float):
+        try:
+            return t(text)
+        except ValueError:
+            pass
+    return text
+
+
+def _pad(arrays, fill, dtype):
+    # rows of different lengths as 2D array
+    padded = np.full((len(arrays), max((len(a) for a in arrays), default=0)), fill, dtype=dtype)
+    for row, a in zip(padded, arrays):
+        row[:len(a)] = a
+    return padded
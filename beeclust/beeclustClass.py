@@ -1,8 +1,11 @@
 import numpy as np
+from collections.abc import Sequence
 from enum import Enum, IntEnum
 import random
-from beeclust.fastbee import fast_tick, fast_recalculate_heat, fast_swarms
-from beeclust.helpers import check_bound, check_type
+from beeclust.fastbee import fast_tick_sparse, fast_tick_parallel, fast_run, fast_swarm_labels, fast_swarm_labels_uf, \
+    fast_forget, fast_distances, fast_heat, fast_heat_cells, fast_repair_distances, rng_state, rng_split, parallel_bands
+from beeclust.helpers import check_bound, check_type, check_parameters
+from beeclust.io import PARAMETERS, load_map, save_map, simulation_parameters
 
 
 class MapConst:
@@ -34,7 +37,9 @@ class BeeClust:
     Beeclust class which simulated beeclust algorithm. 
     Class can be imported and simulation used in practice for working with simple autonomous robots. 
 
-    map - 2D numpy array of simulation map
+    map - 2D numpy array of simulation map, the simulation works on its own copy of it; memory-mapped map
+    (numpy.memmap, see load_map) is used without copy when it has type dtype and is writable, so the changes
+    are written to the file opened with mode 'r+' (mode 'c' keeps them in memory, read-only map is copied)
 
     p_changedir - probability that bee change the direction of move
 
@@ -55,33 +60,58 @@ class BeeClust:
     T_env - temperature of enviroment (temperature when there is no heaters and coolers)
     
     min_wait - minimum wait time when bee stop
+
+    engine - tick engine, 'raster' scan whole map every tick, 'sparse' keep list of bees positions
+    and update only them (faster for big maps with few bees)
+
+    seed - seed of the random number generator of this simulation (None for random seed),
+    simulations with the same seed and map are reproducible
+
+    threads - number of threads used by 'raster' engine, the map is split to row bands with own random streams,
+    which are shared by the threads, so result does not depend on the number of threads (only on seed);
+    heatmap is also computed by more threads
+
+    swarm_engine - algorithm used to find swarms, 'union_find' (two-pass labelling) or 'bfs'
+
+    dtype - integer type of map values ('int8', 'int16' or 'int64'), smaller type needs less memory and makes
+    passes over big maps faster, but the longest wait time (k_stay or min_wait) must fit to it
+    (at most 128 for 'int8'), results are the same for all types
     """
+
+    ENGINES = ('raster', 'sparse')
+    """Available tick engines"""
+
+    SWARM_ENGINES = ('union_find', 'bfs')
+    """Available swarm engines"""
+
+    MAP_DTYPES = ('int8', 'int16', 'int64')
+    """Available types of map values"""
+
+    BULK_REPAIR_LIMIT = 64
+    """Maximal number of walls, heaters and coolers changed by set_cells, which are repaired one by one,
+    for more changes the heatmap is recalculated at once"""
+
     def __init__(self, map, p_changedir=0.2, p_wall=0.8, p_meet=0.8, k_temp=0.9,
-                 k_stay=50, T_ideal=35, T_heater=40, T_cooler=5, T_env=22, min_wait=2):
+                 k_stay=50, T_ideal=35, T_heater=40, T_cooler=5, T_env=22, min_wait=2, engine='raster',
+                 seed=None, threads=1, swarm_engine='union_find', dtype='int64'):
 
-        check_type(map, [np.ndarray], "map")
+        check_type(map, [np.ndarray, np.memmap], "map")
         if len(map.shape) != 2:
             raise ValueError("map dim error, not 2D array")
-        check_type(p_changedir, [float, int], "p_changedir")
-        check_bound(p_changedir, 0, 1, "p_changedir must be positive value between 0-1 -> represent probability.")
-        check_type(p_wall, [float, int], "p_wall")
-        check_bound(p_wall, 0, 1, "p_wall must be positive value between 0-1 -> represent probability.")
-        check_type(p_meet, [float, int], "p_meet")
-        check_bound(p_meet, 0, 1, "p_meet must be positive value between 0-1 -> represent probability.")
-        check_type(k_temp, [float, int], "k_temp")
-        check_bound(k_temp, 0, None, "k_temp must be positive.")
-        check_type(k_stay, [float, int], "k_stay")
-        check_bound(k_stay, 0, None, "k_stay must be positive.")
-        check_type(T_ideal, [float, int], "T_ideal")
-        check_type(T_heater, [float, int], "T_heater")
-        check_type(T_cooler, [float, int], "T_cooler")
-        check_type(T_env, [float, int], "T_env")
-        check_type(min_wait, [float, int], "min_wait")
-        check_bound(min_wait, 0, None, "min_wait must be positive.")
-        if T_heater < T_env:
-            raise ValueError("T_heater must be greater or equal than T_env.")
-        if T_cooler > T_env:
-            raise ValueError("T_cooler must be lower or equal than T_env.")
+        check_parameters(p_changedir, p_wall, p_meet, k_temp, k_stay, T_ideal, T_heater, T_cooler, T_env, min_wait)
+        check_type(engine, [str], "engine")
+        if engine not in self.ENGINES:
+            raise ValueError("engine must be one of {}.".format(self.ENGINES))
+        check_type(seed, [int, type(None)], "seed")
+        check_type(threads, [int], "threads")
+        check_bound(threads, 1, None, "threads must be positive.")
+        if threads > 1 and engine != 'raster':
+            raise ValueError("threads are supported only by 'raster' engine.")
+        check_type(swarm_engine, [str], "swarm_engine")
+        if swarm_engine not in self.SWARM_ENGINES:
+            raise ValueError("swarm_engine must be one of {}.".format(self.SWARM_ENGINES))
+        if np.dtype(dtype).name not in self.MAP_DTYPES:
+            raise ValueError("dtype must be one of {}.".format(self.MAP_DTYPES))
 
         self.p_changedir = p_changedir
         self.p_wall = p_wall
@@ -93,64 +123,537 @@ class BeeClust:
         self.T_cooler = T_cooler
         self.T_env = T_env
         self.min_wait = min_wait
-        self.map = map.astype(np.int64)
+        self.engine = engine
+        self.threads = threads
+        self.swarm_engine = swarm_engine
+        self.dtype = np.dtype(dtype)
+        """Type of map values."""
+        self._check_wait()
+        self.seed = seed
+        self.rng = rng_state(seed)
+        """State of the random number generator used by the simulation kernels."""
+        self._bee_positions = None
+        self._band_rngs = None
+        # buffers for positions changed by tick and the positions changed by the last modification of map,
+        # _revision counts the modifications (ticks, runs, set_cell, new map)
+        self._changes = None
+        self._change_counts = None
+        self._changed_flat = None
+        self._revision = 0
+        # number of bees and sum of temperatures on their positions kept by ticks and set_cell,
+        # None when they must be counted again from the map
+        self._bee_count = None
+        self._heat_sum = 0.
+        self._observers = []
+        self._workspace = Workspace()
+        # geometry (walls, heaters, coolers) version, distances are valid for _distances_version
+        self._geometry_version = 0
+        self._distances_version = None
+        # heatmap version, changed with every new or recalculated heatmap (views cache the colors by it)
+        self._heat_version = 0
+        # the simulation works on its own copy of the map, memory-mapped map is not read whole to memory
+        # (the setter copies it only when it is read-only or of other type)
+        self.map = map if isinstance(map, np.memmap) or map.dtype != self.dtype else map.copy(order='C')
         self.heatmap = None
+        self._dist_heater = None
+        self._dist_cooler = None
         self.recalculate_heat()
 
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        """
+        Create simulation from the binary map file (see beeclust.io). Parameters saved in the file
+        are used, parameters given as keyword arguments replace them. Unless dtype is given, the smallest
+        of MAP_DTYPES which holds the file data and the wait times is used, so the memory-mapped map is not copied.
+        """
+        map, parameters = load_map(path)
+        parameters = {name: value for name, value in parameters.items() if name in PARAMETERS}
+        parameters.update(kwargs)
+        if 'dtype' not in kwargs:
+            # map is kept in the type of the file, so it is not copied (defaults of waits are from __init__)
+            parameters['dtype'] = _compact_dtype(map.dtype, max(parameters.get('k_stay', 50),
+                                                                parameters.get('min_wait', 2)))
+        return cls(map, **parameters)
+
+    def to_file(self, path):
+        """
+        Save the map and the parameters of simulation to the binary map file (see beeclust.io).
+        """
+        save_map(path, self.map, simulation_parameters(self))
+
+    @property
+    def map(self):
+        """
+        2D numpy array of simulation map. The map is stored as C-contiguous array of type dtype,
+        assigned array in other format is converted once, compatible array is used without copy.
+        """
+        return self._map
+
+    @map.setter
+    def map(self, map):
+        if not isinstance(map, np.ndarray):
+            raise TypeError("map is not type {}.".format(str([np.ndarray])))
+        if len(map.shape) != 2:
+            raise ValueError("map dim error, not 2D array")
+        if map.dtype != self.dtype and map.size and not np.can_cast(map.dtype, self.dtype):
+            info = np.iinfo(self.dtype)
+            if map.min() < info.min or map.max() > info.max:
+                raise ValueError("map values must be between {} and {} for dtype {}.".format(info.min, info.max,
+                                                                                          self.dtype))
+        self._map = np.require(map, dtype=self.dtype, requirements=['C', 'W', 'E'])
+        self._bee_positions = None
+        self._band_rngs = None
+        self._changes = None
+        self._bee_count = None
+        self._modified(None)
+        self._geometry_version += 1
+
     @property
     def bees(self):
         """
-        Return list of bees positions in map as python list of lists.
+        Return positions of bees in map as numpy array n x 2 (rows sorted).
+        """
+        return np.argwhere(_bees(self.map))
+
+    @property
+    def bee_count(self):
+        """
+        Number of bees in map. It is kept by ticks and set_cell, so it is not counted again.
         """
-        indices = np.where((self.map < 0)
-                              | ((1 <= self.map) & (self.map <= 4)))
-        return list(zip(indices[0], indices[1]))
+        if self._bee_count is None:
+            self._count_bees()
+        return self._bee_count
 
     @property
     def score(self):
         """
-        Compute and return bees score. Score is represent as the average temperature of bees.
+        Return bees score. Score is represent as the average temperature of bees.
+        Sum of the temperatures is kept by ticks and set_cell, so the score is not computed from the whole map.
+        After the bees were placed or removed directly in the map, call sync_bees or recalculate_heat.
         """
-        score = 0.
-        cnt = 0
-        for bee in self.bees:
-            score += self.heatmap[bee]
-            cnt += 1
-        return score / cnt if cnt > 0 else 0
+        cnt = self.bee_count
+        return self._heat_sum / cnt if cnt > 0 else 0
+
+    def _count_bees(self):
+        bees = _bees(self.map)
+        self._bee_count = int(np.count_nonzero(bees))
+        self._heat_sum = float(self.heatmap[bees].sum())
 
     @property
     def swarms(self):
         """
         Return swarms of bees in map. This is clums of bees. Is returned as list of lists of tuples. 
         Swarms are clumps of bees in four direction.
+        The list is lazy view on swarm_labels, swarm is converted to tuples only when it is accessed.
+        """
+        return Swarms(*self.swarm_labels())
+
+    def swarm_labels(self):
+        """
+        Find swarms of bees and return them as numpy arrays (labels, offsets, coords).
+        labels is int32 map with swarm number (from 1) on bees positions and 0 elsewhere.
+        Positions of bees in swarm i (from 0) are coords[offsets[i]:offsets[i + 1]], coords is n x 2 int32 array.
+        """
+        if self.swarm_engine == 'bfs':
+            return fast_swarm_labels(self.map)
+        return fast_swarm_labels_uf(self.map)
+
+    @property
+    def changed_cells(self):
         """
-        self.map = self.map.astype(np.int64)
-        return fast_swarms(self.map)
+        Positions (n x 2 numpy array, sorted by rows) changed by the last tick or set_cell,
+        None if they are not known (after run, forget, assigning new map or too many changes).
+        """
+        if self._changed_flat is None:
+            return None
+        return np.column_stack(np.unravel_index(_unique(self._changed_flat), self.map.shape))
 
     def tick(self):
         """
         Do one simulation step. Bees move or stop. Return number of bees which moded.
         """
-        self.map = self.map.astype(np.int64)
-        moved, self.map = fast_tick(self.map, self.heatmap, 
-            self.p_changedir, self.p_wall, 
-            self.p_meet, self.T_ideal, 
-            self.k_stay, self.min_wait)
+        self._check_wait()
+        if self.engine == 'sparse' and self._bee_positions is None:
+            self.sync_bees()
+        changes, counts = self._change_log()
+        heat = self._workspace.get('heat', len(counts), np.float64)
+        heat[:] = 0
+        if self.engine == 'sparse':
+            moved = fast_tick_sparse(self.map, self.heatmap, self._bee_positions,
+                                     self.p_changedir, self.p_wall,
+                                     self.p_meet, self.T_ideal,
+                                     self.k_stay, self.min_wait, self.rng, changes, counts, heat)
+        else:
+            moved = fast_tick_parallel(self.map, self.heatmap,
+                                       self.p_changedir, self.p_wall,
+                                       self.p_meet, self.T_ideal,
+                                       self.k_stay, self.min_wait,
+                                       self._parallel_rngs(), self.threads, changes, counts, heat,
+                                       *self._done_marks())
+        self._heat_sum += heat.sum()
+        if counts.max() > changes.shape[1]:
+            self._modified(None)
+        elif len(counts) == 1:
+            self._modified(changes[0, :counts[0]])
+        else:
+            changed = self._workspace.get('changed', changes.size, np.int64)
+            self._modified(np.concatenate([band[:count] for band, count in zip(changes, counts)],
+                                          out=changed[:counts.sum()]))
+        for observer in self._observers:
+            observer.update()
         return moved
 
+    def attach(self, observer):
+        """
+        Attach observer (for example TrajectoryRecorder or SwarmTracker), its method update()
+        is called after every tick, also during run.
+        """
+        if observer not in self._observers:
+            self._observers.append(observer)
+
+    def detach(self, observer):
+        """
+        Detach observer attached by attach.
+        """
+        self._observers.remove(observer)
+
+    def _change_log(self):
+        # buffers for positions changed by one tick, bee is recorded at most twice (when it moves),
+        # for parallel tick each band has own buffer and may overflow when bees are not spread evenly
+        if self._changes is None:
+            bees = self.bee_count
+            bands, capacity = 1, 2 * bees
+            if self.engine == 'raster':
+                bands = parallel_bands(self.map.shape[0])
+                height = -(-self.map.shape[0] // bands)
+                capacity = min(2 * height * self.map.shape[1], 4 * -(-bees // bands) + 2 * self.map.shape[1])
+            self._changes = np.empty((bands, max(capacity, 1)), dtype=np.int64)
+            self._change_counts = np.zeros(bands, dtype=np.int64)
+        return self._changes, self._change_counts
+
+    def _done_marks(self):
+        # marks of moved bees for tick kernels and their generation, they are not cleared between ticks
+        return (self._workspace.get('done', self.map.shape, np.uint32, zero=True),
+                self._workspace.get('stamp', 1, np.uint32, zero=True))
+
+    def _check_wait(self):
+        # waiting bees are stored as negative wait times, so the longest wait must fit to the map type
+        limit = -int(np.iinfo(self.dtype).min)
+        if max(int(self.k_stay), int(self.min_wait)) > limit:
+            raise ValueError("k_stay and min_wait must be at most {} for dtype {}.".format(limit, self.dtype))
+
+    def _modified(self, changed_flat):
+        # map was modified, changed_flat are flat indices of changed positions or None if unknown
+        self._changed_flat = changed_flat
+        self._revision += 1
+
+    def run(self, n_ticks, callback=None, every=1):
+        """
+        Do n_ticks simulation steps in compiled code. Return numpy array with number of bees which moved in each step.
+        When observers are attached, the steps are done one by one by tick.
+
+        callback - optional function called as callback(beeclust, ticks) after every `every` steps,
+        where ticks is number of steps done in this run. If it returns True, the run stops
+        and only the done steps are returned.
+        """
+        check_type(n_ticks, [int], "n_ticks")
+        check_bound(n_ticks, 0, None, "n_ticks must be positive.")
+        check_type(every, [int], "every")
+        check_bound(every, 1, None, "every must be positive.")
+        self._check_wait()
+
+        moved = np.zeros(n_ticks, dtype=np.int64)
+        step = n_ticks if callback is None else every
+        done = 0
+        if self._observers:
+            # observers must see every tick
+            while done < n_ticks:
+                moved[done] = self.tick()
+                done += 1
+                if callback is not None and (done % every == 0 or done == n_ticks) and callback(self, done):
+                    return moved[:done]
+            return moved
+        while done < n_ticks:
+            if self.engine == 'sparse' and self._bee_positions is None:
+                self.sync_bees()
+            bees = self._bee_positions if self.engine == 'sparse' else None
+            band_rngs = self._parallel_rngs() if bees is None else None
+            heat = self._workspace.get('heat', 1 if band_rngs is None else len(band_rngs), np.float64)
+            heat[:] = 0
+            chunk = min(step, n_ticks - done)
+            fast_run(self.map, self.heatmap, bees,
+                     self.p_changedir, self.p_wall,
+                     self.p_meet, self.T_ideal,
+                     self.k_stay, self.min_wait, self.rng, moved[done:done + chunk],
+                     band_rngs, self.threads, heat, *(self._done_marks() if bees is None else (None, None)))
+            self._heat_sum += heat.sum()
+            done += chunk
+            self._modified(None)
+            if callback is not None and callback(self, done):
+                return moved[:done]
+        return moved
+
+    def _parallel_rngs(self):
+        # random streams of row bands, derived from the simulation rng
+        bands = parallel_bands(self.map.shape[0])
+        if self._band_rngs is None or len(self._band_rngs) != bands:
+            self._band_rngs = rng_split(self.rng, bands)
+        return self._band_rngs
+
+    def sync_bees(self):
+        """
+        Rebuild the list of bees positions used by the 'sparse' engine from the map.
+        Call it after the bees were placed or removed directly in the map (it also counts bees and score again).
+        """
+        self._bee_positions = self.bees.astype(np.int64)
+        self._bee_count = None
+        self._changes = None
+
     def recalculate_heat(self):
         """
         Forcing recalculating of heatmap (for example, after creating new map and place to the old simulation)
         """
-        self.map = self.map.astype(np.int64)
-        self.heatmap = fast_recalculate_heat(self.map, self.T_env, self.T_cooler, self.T_heater, self.k_temp)
+        self._update_distances()
+        self.heatmap = fast_heat(self.map, self._dist_heater, self._dist_cooler,
+                                 self.T_env, self.T_cooler, self.T_heater, self.k_temp, self.threads)
+        self._heat_version += 1
+        self._bee_positions = None
+        self._changes = None
+        self._bee_count = None
+
+    def update_heat(self):
+        """
+        Update heatmap after change of temperature parameters (T_env, T_heater, T_cooler, k_temp).
+        Distances from heaters and coolers are kept, they are recomputed only if a new map was assigned.
+        After direct changes of walls, heaters or coolers in map use recalculate_heat.
+        """
+        self.heatmap = self.heatmap_for()
+        self._heat_version += 1
+        self._bee_count = None
+
+    def _update_distances(self, dtype=None):
+        # distances are computed again to the old arrays when the shape of map did not change,
+        # they are uint16 until some distance does not fit (then uint32 is kept)
+        workspace = self._workspace
+        if dtype is None:
+            dtype = np.uint16 if self._dist_heater is None else self._dist_heater.dtype
+        self._dist_heater, self._dist_cooler = fast_distances(
+            self.map, self._queue(), workspace.get('dist_heater', self.map.shape, dtype),
+            workspace.get('dist_cooler', self.map.shape, dtype), self.threads)
+        self._distances_version = self._geometry_version
+
+    def _queue(self):
+        # BFS from heaters and coolers run at once with more threads, each needs own queue
+        return self._workspace.get('queue', self.map.size * (2 if self.threads > 1 else 1), np.int32)
+
+    def heatmap_for(self, T_env=None, T_cooler=None, T_heater=None, k_temp=None):
+        """
+        Return new heatmap of this map for other temperature parameters (None is the simulation value).
+        The simulation is not changed, so it is cheap to sweep over temperatures on one geometry.
+        """
+        if self._distances_version != self._geometry_version:
+            self._update_distances()
+        return heat_from_distances(self.map, self._dist_heater, self._dist_cooler,
+                                   self.T_env if T_env is None else T_env,
+                                   self.T_cooler if T_cooler is None else T_cooler,
+                                   self.T_heater if T_heater is None else T_heater,
+                                   self.k_temp if k_temp is None else k_temp)
+
+    def set_cell(self, row, column, value):
+        """
+        Set value of one position in map and keep the heatmap in sync.
+        Bees and empty positions do not change the heatmap, for walls, heaters and coolers
+        only the region of heatmap affected by the change is recalculated.
+        """
+        value = int(value)
+        check_bound(value, np.iinfo(self.dtype).min, MapConst.COOLER,
+                    "value must be map constant or wait time (between {} and {}).".format(np.iinfo(self.dtype).min,
+                                                                                        MapConst.COOLER))
+        if not (0 <= row < self.map.shape[0] and 0 <= column < self.map.shape[1]):
+            raise IndexError("position ({}, {}) is out of map.".format(row, column))
+        old = int(self.map[row, column])
+        if old == value:
+            return
+        cell = row * self.map.shape[1] + column
+        counted = self._bee_count is not None
+        if counted and _is_bee(old):
+            self._bee_count -= 1
+            self._heat_sum -= self.heatmap[row, column]
+        self.map[row, column] = value
+        self._update_bee_positions(row, column, old, value)
+        self._modified(np.array([cell], dtype=np.int64))
+        if old >= MapConst.WALL or value >= MapConst.WALL:
+            queue = self._queue()
+            try:
+                touched = _unique(np.concatenate([
+                    fast_repair_distances(self.map, self._dist_heater, MapConst.HEATER, row, column, queue),
+                    fast_repair_distances(self.map, self._dist_cooler, MapConst.COOLER, row, column, queue),
+                ]))
+            except OverflowError:
+                # some distance does not fit to uint16
+                self._update_distances(np.uint32)
+                touched = np.arange(self.map.size)
+            before = self.heatmap.ravel()[touched]
+            fast_heat_cells(self.map, self._dist_heater, self._dist_cooler, self.heatmap, touched,
+                            self.T_env, self.T_cooler, self.T_heater, self.k_temp)
+            if counted:
+                # temperature changed also under other bees
+                bees = _bees(self.map.ravel()[touched]) & (touched != cell)
+                self._heat_sum += (self.heatmap.ravel()[touched[bees]] - before[bees]).sum()
+            # distances were repaired in place, so they stay valid for the new geometry
+            self._geometry_version += 1
+            self._distances_version = self._geometry_version
+            self._heat_version += 1
+        if counted and _is_bee(value):
+            self._bee_count += 1
+            self._heat_sum += self.heatmap[row, column]
+
+    def set_cells(self, rows, columns, values):
+        """
+        Set values of more positions in map (sequences of rows, columns and values) and keep the heatmap in sync.
+        When more than BULK_REPAIR_LIMIT walls, heaters or coolers change, heatmap is recalculated at once.
+        """
+        rows, columns, values = np.broadcast_arrays(np.asarray(rows), np.asarray(columns), np.asarray(values))
+        if rows.size == 0:
+            return
+        if values.max() > MapConst.COOLER or values.min() < np.iinfo(self.dtype).min:
+            raise ValueError("value must be map constant or wait time (between {} and {}).".format(
+                np.iinfo(self.dtype).min, MapConst.COOLER))
+        geometry = (self.map[rows, columns] >= MapConst.WALL) | (values >= MapConst.WALL)
+        if np.count_nonzero(geometry) > self.BULK_REPAIR_LIMIT:
+            self.map[rows, columns] = values
+            self._modified(None)
+            self.recalculate_heat()
+            return
+        for row, column, value in zip(rows.ravel(), columns.ravel(), values.ravel()):
+            self.set_cell(int(row), int(column), value)
+
+    def _update_bee_positions(self, row, column, old, value):
+        # keep the bees list of the 'sparse' engine in sync with one changed position
+        if _is_bee(old) == _is_bee(value):
+            return
+        # number of bees changed, so the buffers for changes are allocated again
+        self._changes = None
+        if self._bee_positions is None:
+            return
+        if _is_bee(value):
+            self._bee_positions = np.append(self._bee_positions, [[row, column]], axis=0)
+        else:
+            keep = (self._bee_positions[:, 0] != row) | (self._bee_positions[:, 1] != column)
+            self._bee_positions = self._bee_positions[keep]
 
     def forget(self):
         """
         All bees will forget their waiting times and the direction they were going through.
         The next step they randomly select the direction.
         """
-        self.map = self.map.astype(np.int64)
-        self.map[((self.map <= -1) | (self.map == MapConst.UP) |
-                  (self.map == MapConst.DOWN) | (self.map == MapConst.RIGHT) | (self.map == MapConst.LEFT))] = -1
+        fast_forget(self.map)
+        self._modified(None)
+
+
+class Workspace:
+    """
+    Buffers reused by the compiled kernels of one simulation (done marks of tick, BFS queues, distances),
+    so the ticks do not allocate memory. Buffer is allocated when it is used first time
+    and again only when its shape changes (for example the map has new shape).
+    """
+
+    def __init__(self):
+        self._buffers = {}
+
+    def get(self, name, shape, dtype, zero=False):
+        """
+        Buffer with the name, shape and dtype. Its content is kept from the last use,
+        new buffer is filled with zeros if zero is True, otherwise its content is not defined.
+        """
+        shape = tuple(shape) if isinstance(shape, (tuple, list)) else (shape,)
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = self._buffers[name] = (np.zeros if zero else np.empty)(shape, dtype=dtype)
+        return buffer
+
+    def clear(self):
+        """
+        Release all buffers.
+        """
+        self._buffers.clear()
+
+    @property
+    def nbytes(self):
+        """
+        Memory used by the buffers in bytes.
+        """
+        return sum(buffer.nbytes for buffer in self._buffers.values())
+
+
+class Swarms(Sequence):
+    """
+    Swarms as read-only list of lists of positions tuples, created lazily from the arrays of BeeClust.swarm_labels.
+    """
+
+    def __init__(self, labels, offsets, coords):
+        self.labels = labels
+        self.offsets = offsets
+        self.coords = coords
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("swarm index out of range")
+        return [tuple(position) for position in self.coords[self.offsets[index]:self.offsets[index + 1]].tolist()]
+
+    def __eq__(self, other):
+        if isinstance(other, Swarms):
+            return np.array_equal(self.offsets, other.offsets) and np.array_equal(self.coords, other.coords)
+        if isinstance(other, Sequence):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+def heat_from_distances(map, dist_heater, dist_cooler, T_env, T_cooler, T_heater, k_temp):
+    """
+    Compute heatmap from the map and distances from the nearest heater and cooler
+    (maximal value of their type if unreachable, see fast_distances).
+    """
+    heating = np.divide(1., dist_heater, out=np.zeros(map.shape),
+                        where=(dist_heater > 0) & (dist_heater != _unreachable(dist_heater))) * (T_heater - T_env)
+    cooling = np.divide(1., dist_cooler, out=np.zeros(map.shape),
+                        where=(dist_cooler > 0) & (dist_cooler != _unreachable(dist_cooler))) * (T_env - T_cooler)
+    return np.select([map == MapConst.HEATER, map == MapConst.COOLER, map == MapConst.WALL],
+                     [T_heater, T_cooler, 9999999], T_env + k_temp * (heating - cooling))
+
+
+def _compact_dtype(dtype, wait):
+    # smallest of BeeClust.MAP_DTYPES which holds values of dtype and waits up to wait
+    for name in BeeClust.MAP_DTYPES:
+        if np.can_cast(dtype, name) and -int(np.iinfo(name).min) >= wait:
+            return name
+    return BeeClust.MAP_DTYPES[-1]
+
+
+def _unreachable(dist):
+    return np.iinfo(dist.dtype).max
+
+
+def _is_bee(value):
+    return value < 0 or MapConst.UP <= value <= MapConst.LEFT
+
+
+def _unique(values):
+    # sorted unique values, np.unique may use hashing which is slow for big arrays of positions
+    values = np.sort(values)
+    return values[np.concatenate(([True], values[1:] != values[:-1]))] if len(values) else values
+
 
+def _bees(values):
+    # mask of bees in numpy array of map values
+    return (values < 0) | ((MapConst.UP <= values) & (values <= MapConst.LEFT))
@@ -0,0 +1,146 @@
+import numpy as np
+from beeclust.beeclustClass import BeeClust, MapConst
+from beeclust.fastbee import fast_run_ensemble, fast_recalculate_heat, parallel_bands, rng_split, rng_state
+from beeclust.helpers import check_bound, check_type, check_parameters
+
+
+class BeeClustEnsemble:
+    """
+    Ensemble of independent BeeClust simulations (replicas) on the same arena.
+    Maps of all replicas are stored in one 3D numpy array (replicas x rows x columns),
+    heatmap is computed once for the shared geometry and all replicas are ticked in one compiled call.
+
+    maps - 3D numpy array of replicas maps, or 2D map which is copied to all replicas;
+    walls, heaters and coolers must be on the same positions in all replicas
+
+    replicas - number of replicas when maps is 2D
+
+    seed - None for random seeds, int for independent random streams derived from one seed,
+    or list of ints with seed for each replica (replica with seed s is the same as BeeClust with seed s)
+
+    threads - number of threads, replicas are simulated in parallel, so results do not depend on it
+
+    dtype - integer type of maps values ('int8', 'int16' or 'int64'), the longest wait time (k_stay
+    or min_wait) must fit to it as in BeeClust
+
+    Other parameters are the same as in BeeClust.
+    """
+
+    def __init__(self, maps, replicas=None, p_changedir=0.2, p_wall=0.8, p_meet=0.8, k_temp=0.9,
+                 k_stay=50, T_ideal=35, T_heater=40, T_cooler=5, T_env=22, min_wait=2, seed=None,
+                 threads=1, dtype='int64'):
+
+        check_type(maps, [np.ndarray], "maps")
+        if len(maps.shape) == 2:
+            check_type(replicas, [int], "replicas")
+            check_bound(replicas, 1, None, "replicas must be positive.")
+            maps = np.broadcast_to(maps, (replicas,) + maps.shape)
+        elif len(maps.shape) != 3:
+            raise ValueError("maps dim error, not 2D or 3D array")
+        check_parameters(p_changedir, p_wall, p_meet, k_temp, k_stay, T_ideal, T_heater, T_cooler, T_env, min_wait)
+        check_type(threads, [int], "threads")
+        check_bound(threads, 1, None, "threads must be positive.")
+        if np.dtype(dtype).name not in BeeClust.MAP_DTYPES:
+            raise ValueError("dtype must be one of {}.".format(BeeClust.MAP_DTYPES))
+        self.dtype = np.dtype(dtype)
+        """Type of maps values."""
+        if maps.size and not np.can_cast(maps.dtype, self.dtype):
+            info = np.iinfo(self.dtype)
+            if maps.min() < info.min or maps.max() > info.max:
+                raise ValueError("maps values must be between {} and {} for dtype {}.".format(info.min, info.max,
+                                                                                           self.dtype))
+
+        # the ensemble works on its own copy of the maps
+        self.maps = np.array(maps, dtype=self.dtype, order='C')
+        """3D numpy array of replicas maps (replicas x rows x columns)"""
+        geometry = self.maps >= MapConst.WALL
+        if not (geometry == geometry[0]).all():
+            raise ValueError("maps geometry error, walls, heaters and coolers must be the same in all replicas")
+
+        if seed is None or type(seed) == int:
+            self.rngs = rng_state(seed, len(self))
+        else:
+            if len(seed) != len(self):
+                raise ValueError("seed must be int or list of seeds for each replica.")
+            for s in seed:
+                check_type(s, [int], "seed")
+            self.rngs = np.array([rng_state(s) for s in seed], dtype=np.uint64)
+
+        self.p_changedir = p_changedir
+        self.p_wall = p_wall
+        self.p_meet = p_meet
+        self.k_temp = k_temp
+        self.k_stay = k_stay
+        self.T_ideal = T_ideal
+        self.T_heater = T_heater
+        self.T_cooler = T_cooler
+        self.T_env = T_env
+        self.min_wait = min_wait
+        self.threads = threads
+        self._check_wait()
+        self._band_rngs = None
+        self.heatmap = None
+        self.recalculate_heat()
+
+    def __len__(self):
+        return self.maps.shape[0]
+
+    @property
+    def bee_counts(self):
+        """
+        Return numpy array with number of bees in each replica.
+        """
+        return np.count_nonzero(self._bees_mask(), axis=(1, 2))
+
+    @property
+    def scores(self):
+        """
+        Return numpy array with score (average temperature of bees) of each replica, 0 if there are no bees.
+        """
+        mask = self._bees_mask()
+        counts = np.count_nonzero(mask, axis=(1, 2))
+        sums = (mask * self.heatmap).sum(axis=(1, 2))
+        return np.divide(sums, counts, out=np.zeros(len(self)), where=counts > 0)
+
+    def tick(self):
+        """
+        Do one simulation step in all replicas. Return numpy array with number of moved bees in each replica.
+        """
+        return self.run(1)[0]
+
+    def run(self, n_ticks):
+        """
+        Do n_ticks simulation steps in all replicas.
+        Return numpy array (n_ticks x replicas) with number of bees which moved in each step.
+        """
+        check_type(n_ticks, [int], "n_ticks")
+        check_bound(n_ticks, 0, None, "n_ticks must be positive.")
+        self._check_wait()
+        moved = np.zeros((n_ticks, len(self)), dtype=np.int64)
+        fast_run_ensemble(self.maps, self.heatmap,
+                          self.p_changedir, self.p_wall,
+                          self.p_meet, self.T_ideal,
+                          self.k_stay, self.min_wait, self._parallel_rngs(), moved, self.threads)
+        return moved
+
+    def _check_wait(self):
+        # waiting bees are stored as negative wait times, so the longest wait must fit to the maps type
+        limit = -int(np.iinfo(self.dtype).min)
+        if max(int(self.k_stay), int(self.min_wait)) > limit:
+            raise ValueError("k_stay and min_wait must be at most {} for dtype {}.".format(limit, self.dtype))
+
+    def _parallel_rngs(self):
+        # random streams of row bands of each replica, derived from its rng as in BeeClust
+        if self._band_rngs is None:
+            bands = parallel_bands(self.maps.shape[1])
+            self._band_rngs = np.array([rng_split(rng, bands) for rng in self.rngs], dtype=np.uint64)
+        return self._band_rngs
+
+    def recalculate_heat(self):
+        """
+        Forcing recalculating of the shared heatmap (geometry is taken from the first replica).
+        """
+        self.heatmap = fast_recalculate_heat(self.maps[0], self.T_env, self.T_cooler, self.T_heater, self.k_temp)
+
+    def _bees_mask(self):
+        return (self.maps < 0) | ((MapConst.UP <= self.maps) & (self.maps <= MapConst.LEFT))
@@ -2,13 +2,27 @@ import random
 import numpy as np
 cimport numpy as np
 cimport cython
+from cython.parallel cimport prange, threadid
 
 from cpython cimport array
-from libc.stdlib cimport rand, RAND_MAX
+from libc.stdint cimport uint32_t, uint64_t
+from libc.stdlib cimport qsort
+from libc.string cimport memset
 from collections import deque
 import time
 from cpython.mem cimport PyMem_Malloc, PyMem_Realloc, PyMem_Free
 
+# Integer types of map values, the kernels are compiled for each of them
+ctypedef fused cell_t:
+    np.int8_t
+    np.int16_t
+    np.int64_t
+
+# Integer types of distances from heaters and coolers
+ctypedef fused dist_t:
+    np.uint16_t
+    np.uint32_t
+
 # Map constants
 cdef int CHOOSE = -1
 cdef int EMPTY = 0
@@ -25,92 +39,551 @@ cdef int BEE_MEET = 9
 cdef int MOVE = 10
 cdef int WAIT = 11
 
+# Random number generator xoshiro256** (state is numpy array of four uint64)
+cdef uint64_t SPLITMIX_GAMMA = 0x9E3779B97F4A7C15ULL
+cdef uint64_t[4] RNG_JUMP = [0x180EC6D33CFD0ABAULL, 0xD5A61266F0C9392CULL,
+                             0xA9582618E03FC9AAULL, 0x39ABDC4529B1661CULL]
+
+
+cdef inline uint64_t _rotl(uint64_t x, int k) noexcept nogil:
+    return (x << k) | (x >> (64 - k))
+
+
+cdef inline uint64_t _rng_next(uint64_t* s) noexcept nogil:
+    """Next 64 random bits, state is updated."""
+    cdef uint64_t result = _rotl(s[1] * 5, 7) * 9
+    cdef uint64_t t = s[1] << 17
+    s[2] ^= s[0]
+    s[3] ^= s[1]
+    s[1] ^= s[2]
+    s[0] ^= s[3]
+    s[2] ^= t
+    s[3] = _rotl(s[3], 45)
+    return result
+
+
+cdef inline uint32_t _rng_below(uint64_t* s, uint32_t n) noexcept nogil:
+    """Random integer from 0 to n - 1 (multiply and shift, without division)."""
+    return <uint32_t>(((_rng_next(s) >> 32) * n) >> 32)
+
+
+cdef inline bint _rng_chance(uint64_t* s, uint64_t threshold) noexcept nogil:
+    """True with probability threshold / 2^32, see _probability_threshold."""
+    return (_rng_next(s) >> 32) < threshold
+
+
+cdef uint64_t _probability_threshold(double p):
+    """Convert probability to integer threshold compared with 32 random bits."""
+    return <uint64_t>(p * 4294967296.0)
+
+
+cdef void _rng_jump(uint64_t* s) noexcept nogil:
+    """Jump the state 2^128 steps ahead, used to create independent streams."""
+    cdef uint64_t s0 = 0, s1 = 0, s2 = 0, s3 = 0
+    cdef int i, bit
+    for i in range(4):
+        for bit in range(64):
+            if RNG_JUMP[i] & (<uint64_t>1 << bit):
+                s0 ^= s[0]
+                s1 ^= s[1]
+                s2 ^= s[2]
+                s3 ^= s[3]
+            _rng_next(s)
+    s[0] = s0
+    s[1] = s1
+    s[2] = s2
+    s[3] = s3
+
+
+def rng_split(rng, streams):
+    """Derive array of independent rng states (streams x 4) from rng state (rng is advanced)."""
+    cdef np.uint64_t[::1] _rng = rng
+    return rng_state(_rng_next(<uint64_t*>&_rng[0]), streams)
+
+
+def rng_state(seed=None, streams=None):
+    """Create state of random number generator from seed (random seed if None).
+        If streams is number, return array of so many independent states (streams x 4)"""
+    if seed is None:
+        seed = random.SystemRandom().getrandbits(64)
+    cdef uint64_t x = <uint64_t>(seed & 0xFFFFFFFFFFFFFFFF)
+    cdef uint64_t z
+    cdef Py_ssize_t i
+    cdef np.uint64_t[:, ::1] states = np.empty((1 if streams is None else streams, 4), dtype=np.uint64)
+    # seed the first state by splitmix64
+    for i in range(4):
+        x += SPLITMIX_GAMMA
+        z = x
+        z = (z ^ (z >> 30)) * 0xBF58476D1CE4E5B9ULL
+        z = (z ^ (z >> 27)) * 0x94D049BB133111EBULL
+        states[0, i] = z ^ (z >> 31)
+    for i in range(1, states.shape[0]):
+        states[i, :] = states[i - 1, :]
+        _rng_jump(<uint64_t*>&states[i, 0])
+    if streams is None:
+        return np.asarray(states[0])
+    return np.asarray(states)
+
+
+cdef struct tick_params:
+    uint64_t p_changedir
+    uint64_t p_wall
+    uint64_t p_meet
+    float T_ideal
+    float k_stay
+    int min_wait
+    uint64_t* rng
+
+
+cdef tick_params _tick_params(p_changedir, p_wall, p_meet, T_ideal, k_stay, min_wait, np.uint64_t[::1] rng):
+    """Pack the simulation parameters to C struct used by tick kernels.
+        The rng state must live until the parameters are used."""
+    cdef tick_params params
+    params.p_changedir = _probability_threshold(p_changedir)
+    params.p_wall = _probability_threshold(p_wall)
+    params.p_meet = _probability_threshold(p_meet)
+    params.T_ideal = T_ideal
+    params.k_stay = k_stay
+    params.min_wait = min_wait
+    params.rng = <uint64_t*>&rng[0]
+    return params
+
+
 @cython.boundscheck(False)
+@cython.wraparound(False)
 @cython.cdivision(True)
-def fast_tick(map, heatmap, p_changedir, p_wall, p_meet, T_ideal, k_stay, min_wait):
-    """Do one epoch in the map, for each bee do the operation"""
-    cdef np.ndarray[np.int64_t, ndim=2] _map = map
-    cdef np.ndarray[np.double_t, ndim=2] _heatmap = heatmap
+cdef inline int _step_bee(cell_t[:, ::1] _map, double[:, ::1] _heatmap, tick_params* params,
+                          int r, int c, int* nr, int* nc) noexcept nogil:
+    """Do the operation of the bee on position (r, c). Return 1 if bee moved to (nr, nc), else 0."""
+    cdef int a = _map.shape[0]
+    cdef int b = _map.shape[1]
+    cdef int next_dir, offset_r, offset_c, movement, wait_time
+    cdef float delta
 
-    cdef int a, b
-    a = _map.shape[0]
-    b = _map.shape[1]
+    if _map[r, c] == -1:
+        _map[r, c] = _rng_below(params.rng, 4) + 1
+        return 0
+    if _map[r, c] < 0:
+        _map[r, c] += 1
+        return 0
+    if _map[r, c] < 1 or _map[r, c] > 4:
+        return 0
+
+    if _rng_chance(params.rng, params.p_changedir):
+        next_dir = _rng_below(params.rng, 3) + 1
+        if next_dir == _map[r, c]:
+            next_dir = 4
+        _map[r, c] = next_dir
+    # bee can moved in four direction
+    if _map[r, c] == UP:
+        offset_r = -1
+        offset_c = 0
+    elif _map[r, c] == RIGHT:
+        offset_r = 0
+        offset_c = 1
+    elif _map[r, c] == DOWN:
+        offset_r = 1
+        offset_c = 0
+    else:
+        offset_r = 0
+        offset_c = -1
+
+    nr[0] = offset_r + r
+    nc[0] = offset_c + c
+
+    movement = WALL_HIT
+    if 0 <= nr[0] < a and 0 <= nc[0] < b:
+        if 1 <= _map[nr[0], nc[0]] <= 4 or _map[nr[0], nc[0]] < 0:
+            movement = BEE_MEET
+        elif _map[nr[0], nc[0]] == EMPTY:
+            movement = MOVE
+
+    if movement == WALL_HIT:
+        if _rng_chance(params.rng, params.p_wall):
+            movement = WAIT
+        else:
+            _map[r, c] = (_map[r, c] + 1) % 4 + 1
+    elif (movement == BEE_MEET
+            and _rng_chance(params.rng, params.p_meet)):
+        movement = WAIT
+
+    if movement == WAIT:
+        delta = abs(_heatmap[r, c] - params.T_ideal)
+        wait_time = int(params.k_stay / (1 + delta))
+        wait_time = max(params.min_wait, wait_time)
+        _map[r, c] = -wait_time
+    elif movement == MOVE:
+        _map[nr[0], nc[0]] = _map[r, c]
+        _map[r, c] = EMPTY
+        return 1
+    return 0
+
+
+cdef struct change_log:
+    np.int64_t* cells
+    Py_ssize_t capacity
+    Py_ssize_t count
+
+
+cdef inline void _log_change(change_log* log, Py_ssize_t cell) noexcept nogil:
+    """Record flat index of changed position, count keeps growing after the log is full (overflow)."""
+    if log.count < log.capacity:
+        log.cells[log.count] = cell
+    log.count += 1
+
+
+cdef change_log* _change_logs(np.int64_t[:, ::1] changes) except NULL:
+    """One change log for each row of changes array, the logs must be freed by PyMem_Free."""
+    cdef change_log* logs = <change_log*>PyMem_Malloc(changes.shape[0] * sizeof(change_log))
+    cdef Py_ssize_t k
+    if logs == NULL:
+        raise MemoryError()
+    for k in range(changes.shape[0]):
+        logs[k].cells = &changes[k, 0]
+        logs[k].capacity = changes.shape[1]
+        logs[k].count = 0
+    return logs
+
+
+cdef void _store_counts(change_log* logs, np.int64_t[::1] counts):
+    cdef Py_ssize_t k
+    for k in range(counts.shape[0]):
+        counts[k] = logs[k].count
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef int _raster_tick(cell_t[:, ::1] _map, double[:, ::1] _heatmap, tick_params* params,
+                      np.uint32_t[:, ::1] done, np.uint32_t stamp, change_log* log, double* heat) noexcept nogil:
+    """One epoch over the whole map, done must not contain stamp (see _next_stamp)."""
+    return _band_tick(_map, _heatmap, params, params.rng, done, stamp, 0, _map.shape[0], log, heat)
 
-    cdef np.ndarray[np.uint8_t, ndim=2] done = np.full((a, b), 0, dtype=np.uint8)
 
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef int _band_tick(cell_t[:, ::1] _map, double[:, ::1] _heatmap, tick_params* params, uint64_t* rng,
+                    np.uint32_t[:, ::1] done, np.uint32_t stamp, int r0, int r1, change_log* log,
+                    double* heat) noexcept nogil:
+    """One epoch over rows r0 to r1 - 1 with given rng, bees may move one row out of the band.
+        Position where bee moved is marked by stamp in done, so the bee is not moved again in this epoch.
+        Positions are processed in order, so only bees have to be checked and no other marks are needed.
+        If log is not NULL, positions with changed value are recorded to it.
+        Change of the sum of temperatures on bees positions is added to heat.
+        The log and heat are updated once at the end (they are next to the ones of other bands in memory)."""
+    cdef tick_params band_params = params[0]
+    cdef change_log band_log
+    cdef double band_heat = 0
+    cdef int b = _map.shape[1]
     cdef int moved = 0
-    cdef int r, c, next_dir, nr, nc
-    cdef float _p_changedir = p_changedir
-    cdef float _p_wall = p_wall
-    cdef float _p_meet = p_meet
-    cdef float _T_ideal = T_ideal
-    cdef float _k_stay = k_stay
-    cdef int _min_wait = min_wait
-    cdef float delta
-    cdef int offset_r, offset_c, movement, wait_time
+    cdef int r, c, nr, nc
+    cdef cell_t old
 
-    for r in range(a):
+    band_params.rng = rng
+    if log != NULL:
+        band_log = log[0]
+    for r in range(r0, r1):
         for c in range(b):
-    
-            if done[r, c] == 1:
+            old = _map[r, c]
+            if not _is_bee(old) or done[r, c] == stamp:
                 continue
+            if _step_bee(_map, _heatmap, &band_params, r, c, &nr, &nc):
+                moved += 1
+                done[nr, nc] = stamp
+                band_heat += _heatmap[nr, nc] - _heatmap[r, c]
+                if log != NULL:
+                    _log_change(&band_log, <Py_ssize_t>r * b + c)
+                    _log_change(&band_log, <Py_ssize_t>nr * b + nc)
+            elif log != NULL and _map[r, c] != old:
+                _log_change(&band_log, <Py_ssize_t>r * b + c)
+    if log != NULL:
+        log[0] = band_log
+    heat[0] += band_heat
+    return moved
+
+
+cdef int PARALLEL_BANDS = 64
+
+
+def parallel_bands(int rows):
+    """Number of row bands used by parallel tick on map with given number of rows.
+        Bands are at least two rows high, so bands of the same parity never touch the same row."""
+    return max(1, min(PARALLEL_BANDS, rows // 2))
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef int _parallel_tick(cell_t[:, ::1] _map, double[:, ::1] _heatmap, tick_params* params,
+                        np.uint64_t[:, ::1] band_rngs, np.uint32_t[:, ::1] done, np.uint32_t stamp, int threads,
+                        change_log* logs, double* band_heat) noexcept nogil:
+    """One epoch split to row bands, each band has own rng stream (band_rngs is bands x 4).
+        Even bands are done in parallel first, then odd bands. Bee may only leave its band to the neighbour
+        band, which is not processed in the same phase. Bee moved to other band is marked as done, so it is
+        not moved twice. The result does not depend on the number of threads.
+        If logs is not NULL, each band records changed positions to its own log.
+        Each band adds change of the sum of temperatures on bees positions to its item of band_heat,
+        so the sum does not depend on the order of bands."""
+    cdef int a = _map.shape[0]
+    cdef int bands = band_rngs.shape[0]
+    cdef int height = (a + bands - 1) // bands
+    cdef int moved = 0
+    cdef int parity, k, r0
+
+    for parity in range(2):
+        for k in prange(parity, bands, 2, num_threads=threads, schedule='dynamic'):
+            r0 = k * height
+            if r0 < a:
+                moved += _band_tick(_map, _heatmap, params, <uint64_t*>&band_rngs[k, 0],
+                                    done, stamp, r0, min(r0 + height, a), &logs[k] if logs != NULL else NULL,
+                                    &band_heat[k])
+    return moved
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef int _sparse_tick(cell_t[:, ::1] _map, double[:, ::1] _heatmap, tick_params* params,
+                      np.int64_t[:, :] _bees, change_log* log, double* heat) noexcept nogil:
+    """One epoch over the bees in the list of positions, moved bees are updated in the list.
+        If log is not NULL, positions with changed value are recorded to it.
+        Change of the sum of temperatures on bees positions is added to heat."""
+    cdef int b = _map.shape[1]
+    cdef int moved = 0
+    cdef Py_ssize_t i
+    cdef int r, c, nr, nc
+    cdef cell_t old
+
+    for i in range(_bees.shape[0]):
+        r = <int>_bees[i, 0]
+        c = <int>_bees[i, 1]
+        if _is_bee(_map[r, c]) == 0:
+            # position is not in sync with map (changed from outside), skip it
+            continue
+        old = _map[r, c]
+        if _step_bee(_map, _heatmap, params, r, c, &nr, &nc):
+            moved += 1
+            _bees[i, 0] = nr
+            _bees[i, 1] = nc
+            heat[0] += _heatmap[nr, nc] - _heatmap[r, c]
+            if log != NULL:
+                _log_change(log, <Py_ssize_t>r * b + c)
+                _log_change(log, <Py_ssize_t>nr * b + nc)
+        elif log != NULL and _map[r, c] != old:
+            _log_change(log, <Py_ssize_t>r * b + c)
+    return moved
+
+
+cdef np.uint32_t STAMP_MAX = 0xFFFFFFFF
+
+
+cdef inline np.uint32_t _next_stamp(np.uint32_t[:, ::1] done, np.uint32_t* stamp) noexcept nogil:
+    """Advance the generation of done marks and return it. Marks of older generations are different
+        from the new one, so done is cleared only when the generation overflows."""
+    if stamp[0] == STAMP_MAX:
+        done[:, :] = 0
+        stamp[0] = 0
+    stamp[0] += 1
+    return stamp[0]
+
+
+cdef np.uint32_t[:, ::1] _done_marks(done, Py_ssize_t a, Py_ssize_t b):
+    """Done marks (uint32 array) for epochs on a x b map, given buffer is reused, if it is None new one is allocated."""
+    cdef np.uint32_t[:, ::1] _done
+    if done is None:
+        return np.zeros((a, b), dtype=np.uint32)
+    _done = done
+    if _done.shape[0] != a or _done.shape[1] != b:
+        raise ValueError("done must have the same shape as map.")
+    return _done
+
+
+def fast_tick(cell_t[:, ::1] map, heatmap, p_changedir, p_wall, p_meet, T_ideal, k_stay, min_wait, rng=None,
+              changes=None, counts=None, heat=None, done=None, stamp=None):
+    """Do one epoch in the map, for each bee do the operation. rng is state from rng_state (updated in place).
+        If changes (1 x capacity int64 array) is given, flat indices of positions with changed value are written
+        to it and their number to counts[0]. The position may be recorded more times, if counts[0] is bigger
+        than capacity, the log overflowed and only the first capacity positions were recorded.
+        If heat (float64 array with one item) is given, change of the sum of temperatures on bees positions
+        is added to it. Map may be int8, int16 or int64 array, wait times must fit to its type.
+        GIL is released during the epoch.
+        done (uint32 array of the map shape) and stamp (uint32 array with one item) are optional buffers of marks
+        of moved bees. Epoch marks positions by the next stamp, so the buffers can be used for the next epochs
+        without clearing. They are used instead of allocating new ones, done must be filled with zeros
+        when it is used first time."""
+    if rng is None:
+        rng = rng_state()
+    cdef tick_params params = _tick_params(p_changedir, p_wall, p_meet, T_ideal, k_stay, min_wait, rng)
+    cdef double[:, ::1] _heatmap = heatmap
+    cdef double[::1] _heat = np.zeros(1) if heat is None else heat
+    cdef np.uint32_t[:, ::1] _done = _done_marks(done, map.shape[0], map.shape[1])
+    cdef np.uint32_t[::1] _stamp = np.zeros(1, dtype=np.uint32) if stamp is None else stamp
+    cdef np.uint32_t generation = _next_stamp(_done, &_stamp[0])
+    cdef change_log* logs = NULL
+    cdef int moved
+    if changes is None:
+        with nogil:
+            moved = _raster_tick(map, _heatmap, &params, _done, generation, NULL, &_heat[0])
+        return moved, map.base
+    logs = _change_logs(changes)
+    try:
+        with nogil:
+            moved = _raster_tick(map, _heatmap, &params, _done, generation, logs, &_heat[0])
+        _store_counts(logs, counts)
+    finally:
+        PyMem_Free(logs)
+    return moved, map.base
+
+
+def fast_tick_parallel(cell_t[:, ::1] map, heatmap, p_changedir, p_wall, p_meet, T_ideal, k_stay, min_wait, band_rngs, threads,
+                       changes=None, counts=None, heat=None, done=None, stamp=None):
+    """Do one epoch in the map by threads, map is split to row bands (see parallel_bands),
+        band_rngs are rng states of bands (bands x 4 array). GIL is released during the epoch.
+        Changed positions are recorded as in fast_tick, changes is bands x capacity array, one row for each band.
+        Change of the sum of temperatures on bees positions is added to heat as in fast_tick,
+        heat has one item for each band. done and stamp buffers are used as in fast_tick."""
+    cdef tick_params params = _tick_params(p_changedir, p_wall, p_meet, T_ideal, k_stay, min_wait, band_rngs[0])
+    cdef double[:, ::1] _heatmap = heatmap
+    cdef np.uint64_t[:, ::1] _band_rngs = band_rngs
+    cdef np.uint32_t[:, ::1] _done = _done_marks(done, map.shape[0], map.shape[1])
+    cdef np.uint32_t[::1] _stamp = np.zeros(1, dtype=np.uint32) if stamp is None else stamp
+    cdef np.uint32_t generation = _next_stamp(_done, &_stamp[0])
+    cdef double[::1] _heat = np.zeros(_band_rngs.shape[0]) if heat is None else heat
+    cdef int _threads = threads
+    cdef int moved
+    cdef change_log* logs = NULL
+    if _heat.shape[0] != _band_rngs.shape[0]:
+        raise ValueError("heat must have one item for each band.")
+    if changes is not None:
+        if changes.shape[0] != _band_rngs.shape[0]:
+            raise ValueError("changes must have one row for each band.")
+        logs = _change_logs(changes)
+    try:
+        with nogil:
+            moved = _parallel_tick(map, _heatmap, &params, _band_rngs, _done, generation, _threads, logs, &_heat[0])
+        if logs != NULL:
+            _store_counts(logs, counts)
+    finally:
+        PyMem_Free(logs)
+    return moved
+
+
+def fast_tick_sparse(cell_t[:, ::1] map, heatmap, bees, p_changedir, p_wall, p_meet, T_ideal, k_stay, min_wait, rng=None,
+                     changes=None, counts=None, heat=None):
+    """Do one epoch only over the bees from the list of positions (n x 2 array).
+        Positions of moved bees are updated in the list, so the work depends on number of bees, not size of map.
+        Changed positions and the change of the sum of temperatures are recorded as in fast_tick.
+        GIL is released during the epoch."""
+    if rng is None:
+        rng = rng_state()
+    cdef tick_params params = _tick_params(p_changedir, p_wall, p_meet, T_ideal, k_stay, min_wait, rng)
+    cdef double[:, ::1] _heatmap = heatmap
+    cdef np.int64_t[:, :] _bees = bees
+    cdef double[::1] _heat = np.zeros(1) if heat is None else heat
+    cdef change_log* logs = NULL
+    cdef int moved
+    if changes is None:
+        with nogil:
+            moved = _sparse_tick(map, _heatmap, &params, _bees, NULL, &_heat[0])
+        return moved
+    logs = _change_logs(changes)
+    try:
+        with nogil:
+            moved = _sparse_tick(map, _heatmap, &params, _bees, logs, &_heat[0])
+        _store_counts(logs, counts)
+    finally:
+        PyMem_Free(logs)
+    return moved
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def fast_run(cell_t[:, ::1] map, heatmap, bees, p_changedir, p_wall, p_meet, T_ideal, k_stay, min_wait, rng, moved,
+             band_rngs=None, threads=1, heat=None, done=None, stamp=None):
+    """Do len(moved) epochs without returning to python and without GIL, number of moved bees in each epoch
+        is saved to moved.
+        If bees (n x 2 array of positions) is not None, the sparse engine is used.
+        If band_rngs is not None, epochs are done in parallel by threads (see fast_tick_parallel).
+        Change of the sum of temperatures on bees positions is added to heat as in fast_tick
+        (one item for each band in parallel run). done and stamp buffers are used as in fast_tick."""
+    cdef cell_t[:, ::1] _map = map
+    cdef double[:, ::1] _heatmap = heatmap
+    cdef np.int64_t[:] _moved = moved
+    cdef tick_params params = _tick_params(p_changedir, p_wall, p_meet, T_ideal, k_stay, min_wait, rng)
+    cdef double[::1] _heat
+    cdef np.int64_t[:, :] _bees
+    cdef np.uint64_t[:, ::1] _band_rngs
+    cdef np.uint32_t[:, ::1] _done
+    cdef np.uint32_t[::1] _stamp
+    cdef int _threads = threads
+    cdef Py_ssize_t t
+
+    if heat is None:
+        heat = np.zeros(1 if band_rngs is None else len(band_rngs))
+    _heat = heat
+    if bees is not None:
+        _bees = bees
+        with nogil:
+            for t in range(_moved.shape[0]):
+                _moved[t] = _sparse_tick(_map, _heatmap, &params, _bees, NULL, &_heat[0])
+    elif band_rngs is not None:
+        _band_rngs = band_rngs
+        if _heat.shape[0] != _band_rngs.shape[0]:
+            raise ValueError("heat must have one item for each band.")
+        _done = _done_marks(done, _map.shape[0], _map.shape[1])
+        _stamp = np.zeros(1, dtype=np.uint32) if stamp is None else stamp
+        with nogil:
+            for t in range(_moved.shape[0]):
+                _moved[t] = _parallel_tick(_map, _heatmap, &params, _band_rngs, _done, _next_stamp(_done, &_stamp[0]),
+                                           _threads, NULL, &_heat[0])
+    else:
+        _done = _done_marks(done, _map.shape[0], _map.shape[1])
+        _stamp = np.zeros(1, dtype=np.uint32) if stamp is None else stamp
+        with nogil:
+            for t in range(_moved.shape[0]):
+                _moved[t] = _raster_tick(_map, _heatmap, &params, _done, _next_stamp(_done, &_stamp[0]),
+                                         NULL, &_heat[0])
+    return moved
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def fast_run_ensemble(cell_t[:, :, ::1] maps, heatmap, p_changedir, p_wall, p_meet, T_ideal, k_stay, min_wait,
+                      band_rngs, moved, threads=1):
+    """Do moved.shape[0] epochs on each of the maps (N x a x b) sharing one heatmap.
+        Each map use own rng states of row bands (band_rngs is N x bands x 4, see parallel_bands),
+        so replica is the same as the simulation by fast_tick_parallel. Moved bees are saved to moved (ticks x N).
+        Replicas are independent, so they are done in parallel by threads without GIL, each thread has
+        its own done marks."""
+    cdef double[:, ::1] _heatmap = heatmap
+    cdef np.uint64_t[:, :, ::1] _band_rngs = band_rngs
+    cdef np.int64_t[:, :] _moved = moved
+    cdef tick_params params = _tick_params(p_changedir, p_wall, p_meet, T_ideal, k_stay, min_wait, band_rngs[0, 0])
+    cdef int _threads = max(1, min(threads, maps.shape[0]))
+    cdef np.uint32_t[:, :, ::1] done = np.zeros((_threads, maps.shape[1], maps.shape[2]), dtype=np.uint32)
+    cdef np.uint32_t[::1] stamps = np.zeros(_threads, dtype=np.uint32)
+    cdef double[:, ::1] heat = np.zeros((maps.shape[0], _band_rngs.shape[1]))
+    cdef Py_ssize_t i, t
+    cdef int thread
+
+    # whole run of one replica is done at once (map stays in cache), bands of the replica are done by one thread
+    with nogil:
+        for i in prange(maps.shape[0], num_threads=_threads, schedule='dynamic'):
+            thread = threadid()
+            for t in range(_moved.shape[0]):
+                _moved[t, i] = _parallel_tick(maps[i], _heatmap, &params, _band_rngs[i], done[thread],
+                                              _next_stamp(done[thread], &stamps[thread]), 1, NULL, &heat[i, 0])
+    return moved
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def fast_forget(cell_t[:, ::1] map):
+    """All bees in map (in place) forget direction and waiting time, they will choose new direction."""
+    cdef Py_ssize_t i, j
+    for i in range(map.shape[0]):
+        for j in range(map.shape[1]):
+            if _is_bee(map[i, j]):
+                map[i, j] = CHOOSE
 
-            if _map[r, c] == -1:
-                _map[r, c] = rand() % 4 + 1;
-
-            elif 1 <= _map[r, c] <= 4:
-                if  rand()/<float>RAND_MAX < _p_changedir:
-                    next_dir = rand() % 3 + 1;
-                    if next_dir == _map[r, c]:
-                        next_dir = 4
-                    _map[r, c] = next_dir
-                # bee can moved in four direction
-                if _map[r,c] == UP:
-                    offset_r = -1
-                    offset_c = 0
-                elif _map[r,c] == RIGHT:
-                    offset_r = 0
-                    offset_c = 1
-                elif _map[r,c] == DOWN:
-                    offset_r = 1
-                    offset_c = 0
-                else:
-                    offset_r = 0
-                    offset_c = -1
-        
-                nr = offset_r + r
-                nc = offset_c + c
-
-                movement = WALL_HIT
-                if 0 <= nr < a and 0 <= nc < b:
-                    if 1 <= _map[nr, nc] <= 4 or _map[nr, nc] < 0:
-                        movement = BEE_MEET
-                    elif _map[nr, nc] == EMPTY:
-                        movement = MOVE
-
-                if movement == WALL_HIT:
-                    if rand()/<float>RAND_MAX < _p_wall:
-                        movement = WAIT
-                    else:
-                        _map[r, c] = (_map[r, c] + 1) % 4 + 1
-                elif (movement == BEE_MEET
-                        and rand()/<float>RAND_MAX < _p_meet):
-                    movement = WAIT
-
-                if movement == WAIT:
-                    delta = abs(_heatmap[r, c] - _T_ideal)
-                    wait_time = int(_k_stay / (1 + delta))
-                    wait_time = max(_min_wait, wait_time)
-                    _map[r, c] = -wait_time
-                elif movement == MOVE:
-                    moved += 1
-                    _map[nr, nc] = _map[r, c]
-                    _map[r, c] = EMPTY
-                    done[nr, nc] = 1
-            elif _map[r, c] < 0:
-                _map[r, c] += 1
-            done[r, c] = 1
-    return moved, _map
 
 cdef struct cord:
     int x
@@ -189,99 +662,678 @@ def fast_swarms(map):
     return swarms
 
 
-cdef int _is_bee(int value):
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def fast_swarm_labels(cell_t[:, ::1] map):
+    """Label swarms of bees on map by BFS. Return tuple (labels, offsets, coords):
+        labels - int32 map with swarm number (from 1) on bees positions and 0 elsewhere,
+        offsets, coords - positions of bees of swarm i are coords[offsets[i]:offsets[i + 1]] (n x 2 int32).
+        Coords array is used as the BFS queue, so no other memory is needed."""
+    cdef int a = map.shape[0]
+    cdef int b = map.shape[1]
+    cdef np.int32_t[:, ::1] labels = np.zeros((a, b), dtype=np.int32)
+    cdef Py_ssize_t bees = 0
+    cdef int i, j, x, y, nx, ny, k
+    for i in range(a):
+        for j in range(b):
+            if _is_bee(map[i, j]):
+                bees += 1
+    cdef np.int32_t[:, ::1] coords = np.empty((bees, 2), dtype=np.int32)
+    cdef np.int64_t[::1] offsets = np.empty(bees + 1, dtype=np.int64)
+    cdef Py_ssize_t queue_get = 0, queue_put = 0
+    cdef int label = 0
+    cdef int[4] dx = [1, -1, 0, 0]
+    cdef int[4] dy = [0, 0, 1, -1]
+
+    for i in range(a):
+        for j in range(b):
+            if labels[i, j] != 0 or not _is_bee(map[i, j]):
+                continue
+            label += 1
+            labels[i, j] = label
+            coords[queue_put, 0] = i
+            coords[queue_put, 1] = j
+            queue_put += 1
+            while queue_get != queue_put:
+                x = coords[queue_get, 0]
+                y = coords[queue_get, 1]
+                queue_get += 1
+                for k in range(4):
+                    nx = x + dx[k]
+                    ny = y + dy[k]
+                    if is_in(nx, ny, a, b) and labels[nx, ny] == 0 and _is_bee(map[nx, ny]):
+                        labels[nx, ny] = label
+                        coords[queue_put, 0] = nx
+                        coords[queue_put, 1] = ny
+                        queue_put += 1
+            offsets[label] = queue_put
+    offsets[0] = 0
+    return np.asarray(labels), np.array(offsets[:label + 1]), np.asarray(coords)
+
+
+cdef inline np.int32_t _find_root(np.int32_t* parent, np.int32_t x) noexcept nogil:
+    """Root of label in union-find table (with path halving)."""
+    while parent[x] != x:
+        parent[x] = parent[parent[x]]
+        x = parent[x]
+    return x
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def fast_swarm_labels_uf(cell_t[:, ::1] map):
+    """Label swarms of bees on map by two-pass union-find, return the same arrays as fast_swarm_labels.
+        First pass gives each bee provisional label from upper or left neighbour and records equal labels
+        in small union-find table (one item per provisional label), second pass replaces labels by final numbers.
+        Bees in coords are in raster order inside each swarm."""
+    cdef int a = map.shape[0]
+    cdef int b = map.shape[1]
+    cdef np.int32_t[:, ::1] labels = np.zeros((a, b), dtype=np.int32)
+    cdef Py_ssize_t capacity = 1024
+    cdef np.int32_t* parent = <np.int32_t*>PyMem_Malloc(capacity * sizeof(np.int32_t))
+    cdef np.int32_t* grown
+    cdef np.int32_t n = 0, count = 0, up, left, root_up, root_left
+    cdef np.int32_t[::1] rename
+    cdef np.int64_t[::1] offsets
+    cdef np.int32_t[:, ::1] coords
+    cdef int i, j, label
+    if parent == NULL:
+        raise MemoryError()
+    try:
+        # first pass, provisional labels
+        for i in range(a):
+            for j in range(b):
+                if not _is_bee(map[i, j]):
+                    continue
+                up = labels[i - 1, j] if i > 0 else 0
+                left = labels[i, j - 1] if j > 0 else 0
+                if up == 0 and left == 0:
+                    n += 1
+                    if n >= capacity:
+                        capacity *= 2
+                        grown = <np.int32_t*>PyMem_Realloc(parent, capacity * sizeof(np.int32_t))
+                        if grown == NULL:
+                            raise MemoryError()
+                        parent = grown
+                    parent[n] = n
+                    labels[i, j] = n
+                elif up == 0:
+                    labels[i, j] = left
+                elif left == 0 or left == up:
+                    labels[i, j] = up
+                else:
+                    labels[i, j] = left
+                    root_up = _find_root(parent, up)
+                    root_left = _find_root(parent, left)
+                    # the smaller label stays root, so it is the first in raster order
+                    if root_up < root_left:
+                        parent[root_left] = root_up
+                    elif root_left < root_up:
+                        parent[root_up] = root_left
+
+        # second pass, final labels numbered in raster order and sizes of swarms
+        rename = np.zeros(n + 1, dtype=np.int32)
+        offsets = np.zeros(n + 2, dtype=np.int64)
+        for i in range(a):
+            for j in range(b):
+                if labels[i, j] == 0:
+                    continue
+                up = _find_root(parent, labels[i, j])
+                if rename[up] == 0:
+                    count += 1
+                    rename[up] = count
+                labels[i, j] = rename[up]
+                offsets[rename[up] + 1] += 1
+    finally:
+        PyMem_Free(parent)
+
+    for label in range(1, count + 1):
+        offsets[label + 1] += offsets[label]
+    coords = np.empty((offsets[count + 1] if count > 0 else 0, 2), dtype=np.int32)
+    # offsets[label] is used as cursor of the swarm label - 1 while coords are filled
+    for i in range(a):
+        for j in range(b):
+            label = labels[i, j]
+            if label != 0:
+                coords[offsets[label], 0] = i
+                coords[offsets[label], 1] = j
+                offsets[label] += 1
+    return np.asarray(labels), np.asarray(offsets[:count + 1]).copy(), np.asarray(coords)
+
+
+cdef struct swarm_match:
+    np.int64_t count
+    np.int32_t old
+    np.int32_t swarm
+
+
+cdef int _compare_matches(const void* x, const void* y) noexcept nogil:
+    """Order of matches, more bees first, then smaller old id."""
+    cdef swarm_match* a = <swarm_match*>x
+    cdef swarm_match* b = <swarm_match*>y
+    if a.count != b.count:
+        return (a.count < b.count) - (a.count > b.count)
+    return (a.old > b.old) - (a.old < b.old)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def fast_track_swarms(cell_t[:, ::1] map, np.int32_t[:, ::1] labels, np.int64_t[::1] sizes,
+                      np.int64_t[::1] candidates, np.int32_t next_id):
+    """Update swarm labels (ids) after bees moved, labels are ids of swarms before the change.
+        candidates are flat indices of positions which may have changed (may repeat), all positions
+        where bee arrived or left must be in them. sizes are numbers of bees of swarms by id,
+        it must have space for at least next_id + 4 * len(candidates) ids.
+        Only swarms which lost or got a bee are flooded again. Bee which arrived to the neighbour of left position
+        takes its id. Flooded swarm takes the old id with the most bees in it (smaller id for equal counts),
+        every old id is used at most once, swarms without id get new ids from next_id.
+        Return tuple (born, died, change of number of swarms), born and died are arrays of ids."""
+    cdef int a = map.shape[0]
+    cdef int b = map.shape[1]
+    cdef Py_ssize_t n = candidates.shape[0]
+    cdef np.int64_t[::1] left = np.empty(n, dtype=np.int64)
+    cdef np.int64_t[::1] seeds = np.empty(4 * n + 1, dtype=np.int64)
+    cdef np.int64_t[::1] affected, died
+    cdef Py_ssize_t n_left = 0, n_seeds = 0, n_died = 0, capacity, queue_get = 0, queue_put = 0, i, j
+    cdef np.int64_t* cells = NULL
+    cdef np.int32_t* old = NULL
+    cdef swarm_match* matches = NULL
+    cdef void* grown
+    cdef np.int64_t cell
+    cdef np.int32_t count = 0, label, new_id = next_id
+    cdef Py_ssize_t n_matches = 0
+    cdef np.int64_t change = 0
+    cdef np.int32_t[::1] ids
+    cdef np.int64_t[::1] offsets
+    cdef int x, y, nx, ny, k
+    cdef int[4] dx = [1, -1, 0, 0]
+    cdef int[4] dy = [0, 0, 1, -1]
+
+    # left positions get negative old id, so arrived bees can find it
+    for i in range(n):
+        cell = candidates[i]
+        x = <int>(cell // b)
+        y = <int>(cell % b)
+        if labels[x, y] > 0 and not _is_bee(map[x, y]):
+            labels[x, y] = -labels[x, y]
+            left[n_left] = cell
+            n_left += 1
+    for i in range(n):
+        cell = candidates[i]
+        x = <int>(cell // b)
+        y = <int>(cell % b)
+        if labels[x, y] != 0 or not _is_bee(map[x, y]):
+            continue
+        for k in range(4):
+            nx = x + dx[k]
+            ny = y + dy[k]
+            if is_in(nx, ny, a, b) and labels[nx, ny] < 0:
+                labels[x, y] = -labels[nx, ny]
+                break
+        seeds[n_seeds] = cell
+        n_seeds += 1
+    # old ids of left positions are affected, rest of their swarms is found from neighbours
+    affected = np.empty(n_left, dtype=np.int64)
+    for i in range(n_left):
+        x = <int>(left[i] // b)
+        y = <int>(left[i] % b)
+        affected[i] = -labels[x, y]
+        labels[x, y] = 0
+    for i in range(n_left):
+        x = <int>(left[i] // b)
+        y = <int>(left[i] % b)
+        for k in range(4):
+            nx = x + dx[k]
+            ny = y + dy[k]
+            if is_in(nx, ny, a, b) and _is_bee(map[nx, ny]):
+                seeds[n_seeds] = <np.int64_t>nx * b + ny
+                n_seeds += 1
+
+    offsets = np.empty(n_seeds + 1, dtype=np.int64)
+    offsets[0] = 0
+    capacity = max(1024, 4 * n_seeds)
+    try:
+        cells = <np.int64_t*>PyMem_Malloc(capacity * sizeof(np.int64_t))
+        old = <np.int32_t*>PyMem_Malloc(capacity * sizeof(np.int32_t))
+        if cells == NULL or old == NULL:
+            raise MemoryError()
+        # flood affected swarms, k-th swarm gets label -(k + 1), cells are the BFS queue
+        for i in range(n_seeds):
+            x = <int>(seeds[i] // b)
+            y = <int>(seeds[i] % b)
+            if labels[x, y] < 0:
+                continue
+            count += 1
+            cells[queue_put] = seeds[i]
+            old[queue_put] = labels[x, y]
+            labels[x, y] = -count
+            queue_put += 1
+            while queue_get != queue_put:
+                x = <int>(cells[queue_get] // b)
+                y = <int>(cells[queue_get] % b)
+                queue_get += 1
+                for k in range(4):
+                    nx = x + dx[k]
+                    ny = y + dy[k]
+                    if not (is_in(nx, ny, a, b) and labels[nx, ny] >= 0 and _is_bee(map[nx, ny])):
+                        continue
+                    if queue_put == capacity:
+                        capacity *= 2
+                        grown = PyMem_Realloc(cells, capacity * sizeof(np.int64_t))
+                        if grown == NULL:
+                            raise MemoryError()
+                        cells = <np.int64_t*>grown
+                        grown = PyMem_Realloc(old, capacity * sizeof(np.int32_t))
+                        if grown == NULL:
+                            raise MemoryError()
+                        old = <np.int32_t*>grown
+                    cells[queue_put] = <np.int64_t>nx * b + ny
+                    old[queue_put] = labels[nx, ny]
+                    labels[nx, ny] = -count
+                    queue_put += 1
+            offsets[count] = queue_put
+
+        # affected ids are released, number of bees of each (swarm, old id) pair is counted
+        for i in range(n_left):
+            if sizes[affected[i]] > 0:
+                change -= 1
+            sizes[affected[i]] = 0
+        matches = <swarm_match*>PyMem_Malloc(max(queue_put, 1) * sizeof(swarm_match))
+        if matches == NULL:
+            raise MemoryError()
+        for i in range(queue_put):
+            if old[i] > 0:
+                if sizes[old[i]] > 0:
+                    change -= 1
+                sizes[old[i]] = 0
+        # released sizes count (negatively) bees of the old id in the current swarm
+        for label in range(count):
+            for i in range(offsets[label], offsets[label + 1]):
+                if old[i] > 0:
+                    sizes[old[i]] -= 1
+            for i in range(offsets[label], offsets[label + 1]):
+                if old[i] > 0 and sizes[old[i]] < 0:
+                    matches[n_matches].count = -sizes[old[i]]
+                    matches[n_matches].old = old[i]
+                    matches[n_matches].swarm = label
+                    n_matches += 1
+                    sizes[old[i]] = 0
+        qsort(matches, n_matches, sizeof(swarm_match), _compare_matches)
+
+        # greedy matching, used old id is marked by -1 in sizes
+        ids = np.zeros(count, dtype=np.int32)
+        for j in range(n_matches):
+            if ids[matches[j].swarm] == 0 and sizes[matches[j].old] == 0:
+                ids[matches[j].swarm] = matches[j].old
+                sizes[matches[j].old] = -1
+        for label in range(count):
+            if ids[label] == 0:
+                ids[label] = new_id
+                new_id += 1
+            sizes[ids[label]] = offsets[label + 1] - offsets[label]
+            for i in range(offsets[label], offsets[label + 1]):
+                labels[cells[i] // b, cells[i] % b] = ids[label]
+        change += count
+
+        # ids which were not used anymore died, they are marked by -2 while collected
+        died = np.empty(n_left + n_matches, dtype=np.int64)
+        for i in range(n_left):
+            if sizes[affected[i]] == 0:
+                died[n_died] = affected[i]
+                sizes[affected[i]] = -2
+                n_died += 1
+        for j in range(n_matches):
+            if sizes[matches[j].old] == 0:
+                died[n_died] = matches[j].old
+                sizes[matches[j].old] = -2
+                n_died += 1
+        for i in range(n_died):
+            sizes[died[i]] = 0
+    finally:
+        PyMem_Free(cells)
+        PyMem_Free(old)
+        PyMem_Free(matches)
+    return np.arange(next_id, new_id, dtype=np.int64), np.sort(died[:n_died]), change
+
+
+cdef inline int _is_bee(int value) noexcept nogil:
     """True if the value is bee"""
     return value < 0 or 1 <= value <= 4
 
 
 @cython.boundscheck(False)
 @cython.cdivision(True)
-def fast_recalculate_heat(map, double _T_env, double _T_cooler, double _T_heater, double _k_temp):
+def fast_recalculate_heat(map, double _T_env, double _T_cooler, double _T_heater, double _k_temp, int threads=1):
     """Method for recalculating heatmap, it runs two BFS for creating distances from heaters and coolers.
-        Next for each position calculate temp."""
-    cdef np.ndarray[np.int64_t, ndim=2] _map = map
-    cdef int a, b, i, j
-    a = _map.shape[0]
-    b = _map.shape[1]
-    cdef np.ndarray[np.double_t, ndim=2] heatmap = np.zeros((a, b), dtype=np.double)
-    cdef np.ndarray[np.int64_t, ndim=2] points = np.full((2, a*b+1), -1, dtype=np.int64)
-    cdef np.ndarray[np.int64_t, ndim=2] dist_from_heater = np.full((a, b), -1, dtype=np.int64)
-    cdef np.ndarray[np.int64_t, ndim=2] dist_from_cooler = np.full((a, b), -1, dtype=np.int64)
-    cdef size = _find_points(_map, points, HEATER, a, b)
-    _bfs_from_points(_map, a, b, HEATER, points, dist_from_heater, size)
-    size = _find_points(_map, points, COOLER, a, b)
-    _bfs_from_points(_map, a, b, COOLER, points, dist_from_cooler, size)
-
-    cdef double head_const = _T_heater - _T_env
-    cdef double cool_const = _T_env - _T_cooler
-    for i in range(a):
-        for j in range(b):
-            if _map[i, j] == HEATER:
-                heatmap[i, j] = _T_heater
-                continue
-            if _map[i, j] == COOLER:
-                heatmap[i, j] = _T_cooler
-                continue
-            if _map[i, j] == WALL:
-                # non define add some bullshit
-                heatmap[i, j] = 9999999
-                continue
-            heatmap[i, j] = _T_env + _k_temp * (max((1/<double>dist_from_heater[i, j])*head_const, 0) - max((1/<double>dist_from_cooler[i, j])*cool_const, 0))
-    return heatmap
+        Next for each position calculate temp. With more threads the BFS run at once and the rows
+        of heatmap are split among threads."""
+    dist_from_heater, dist_from_cooler = fast_distances(map, threads=threads)
+    return fast_heat(map, dist_from_heater, dist_from_cooler, _T_env, _T_cooler, _T_heater, _k_temp, threads)
+
+
+def queue_buffer(a, b, threads=1):
+    """Queue buffer for fast_distances and fast_repair_distances on a x b map,
+        fast_distances with more threads needs a queue for each BFS."""
+    return np.empty(max(a * b, 1) * (2 if threads > 1 else 1), dtype=np.int32)
+
+
+def fast_distances(_map, queue=None, dist_heater=None, dist_cooler=None, int threads=1):
+    """Run BFS for creating distances from heaters and coolers, return both distances maps.
+        Distances are uint16, uint32 is used only when some distance does not fit. Positions which are not
+        reachable have the maximal value of the type.
+        Passable positions are kept in bit-packed mask (1 bit per position), which is allocated for the call.
+        With more threads the BFS from heaters and from coolers run at once, each with own mask and queue.
+        Optional buffers are used instead of allocating new ones: queue is int32 array of a*b items
+        (2*a*b with more threads, see queue_buffer), dist_heater and dist_cooler are uint16 or uint32 arrays
+        of the map shape, which are overwritten and returned."""
+    a, b = _map.shape[0], _map.shape[1]
+    if a * b >= 2 ** 31:
+        raise ValueError("map must have less than 2^31 positions.")
+    queue = queue_buffer(a, b, threads) if queue is None else queue
+    if dist_heater is None or dist_cooler is None:
+        dist_heater = np.empty((a, b), dtype=np.uint16)
+        dist_cooler = np.empty((a, b), dtype=np.uint16)
+    if queue.shape[0] < a * b * (2 if threads > 1 else 1):
+        raise ValueError("queue must have at least a*b items (2*a*b with more threads).")
+    if dist_heater.shape != (a, b) or dist_cooler.shape != (a, b):
+        raise ValueError("distances must have the same shape as map.")
+    # one bit per position and the border, one more byte is read after the last bit
+    mask = np.empty((((a + 2) * (b + 2) + 7) // 8 + 1) * (2 if threads > 1 else 1), dtype=np.uint8)
+    if not _fill_distances(_map, dist_heater, dist_cooler, queue, mask, threads):
+        dist_heater = np.empty((a, b), dtype=np.uint32)
+        dist_cooler = np.empty((a, b), dtype=np.uint32)
+        _fill_distances(_map, dist_heater, dist_cooler, queue, mask, threads)
+    return dist_heater, dist_cooler
 
 
 @cython.boundscheck(False)
-cdef int _find_points(np.int64_t[:, :] map, np.int64_t[:, :] points, int value, int a, int b):
-    """Function for find point with values in map and add it to array. (for example heaters)"""
-    cdef int maxSize = a * b
-    cdef int size = 1
-    cdef int i, j
-    for i in range(a):
-        for j in range(b):
-            if map[i, j] == value:
-                points[0, size] = i
-                points[1, size] = j
-                size += 1
+@cython.wraparound(False)
+def _fill_distances(cell_t[:, ::1] map, dist_t[:, ::1] dist_heater, dist_t[:, ::1] dist_cooler,
+                    np.int32_t[::1] queue, np.uint8_t[::1] mask, int threads):
+    """Fill both distances maps, return False if some distance does not fit to their type."""
+    cdef Py_ssize_t a = map.shape[0], b = map.shape[1]
+    cdef Py_ssize_t mask_bytes = ((a + 2) * (b + 2) + 7) // 8 + 1
+    cdef int[2] ok
+    cdef int k
+    if a == 0 or b == 0:
+        return True
+    if threads > 1:
+        for k in prange(2, nogil=True, num_threads=2, schedule='static', chunksize=1):
+            if k == 0:
+                ok[0] = _bfs_from_sources(map, &mask[0], &dist_heater[0, 0], &queue[0], HEATER)
+            else:
+                ok[1] = _bfs_from_sources(map, &mask[mask_bytes], &dist_cooler[0, 0], &queue[a * b], COOLER)
+    else:
+        with nogil:
+            ok[0] = _bfs_from_sources(map, &mask[0], &dist_heater[0, 0], &queue[0], HEATER)
+            ok[1] = ok[0] and _bfs_from_sources(map, &mask[0], &dist_cooler[0, 0], &queue[0], COOLER)
+    return ok[0] and ok[1]
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void _passability_mask(cell_t[:, ::1] map, np.uint8_t* mask) noexcept nogil:
+    """Bit for each position of map with border of one position, bit is set where the heat spreads.
+        Bit of position (x, y) is (x + 1) * (b + 2) + y + 1, the border bits are not set."""
+    cdef Py_ssize_t a = map.shape[0], b = map.shape[1]
+    cdef Py_ssize_t x, y, p
+    memset(mask, 0, ((a + 2) * (b + 2) + 7) // 8 + 1)
+    for x in range(a):
+        p = (x + 1) * (b + 2) + 1
+        for y in range(b):
+            mask[p >> 3] |= <np.uint8_t>_passable(map[x, y]) << (p & 7)
+            p += 1
+
+
+cdef inline unsigned int _mask_bits(np.uint8_t* mask, Py_ssize_t p) noexcept nogil:
+    """Three bits of mask from bit p."""
+    return ((mask[p >> 3] | (mask[(p >> 3) + 1] << 8)) >> (p & 7)) & 7
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef bint _bfs_from_sources(cell_t[:, ::1] map, np.uint8_t* mask, dist_t* dist, np.int32_t* queue,
+                            int source) noexcept nogil:
+    """BFS from all positions with source value over the passable positions, distances are saved to flat dist.
+        mask is filled by passability mask, bits of reached positions are cleared, so the mask is also the set
+        of not visited positions. Return False if some distance does not fit to dist_t."""
+    cdef Py_ssize_t a = map.shape[0], b = map.shape[1]
+    cdef Py_ssize_t size = a * b, w = b + 2
+    cdef dist_t unreachable = <dist_t>~(<dist_t>0)
+    cdef cell_t* cells = &map[0, 0]
+    cdef double row_of = 1. / b
+    cdef Py_ssize_t[9] cell_step
+    cdef Py_ssize_t[9] mask_step
+    cdef Py_ssize_t i, p, q, x, get = 0, put = 0
+    cdef unsigned int around
+    cdef int k
+    cdef np.uint32_t d
+    # k-th bit of around is the neighbour in row k // 3 - 1 and column k % 3 - 1
+    for k in range(9):
+        cell_step[k] = (k // 3 - 1) * b + k % 3 - 1
+        mask_step[k] = (k // 3 - 1) * w + k % 3 - 1
+    _passability_mask(map, mask)
+    memset(dist, 0xFF, size * sizeof(dist_t))
+    for i in range(size):
+        if cells[i] == source:
+            dist[i] = 0
+            queue[put] = <np.int32_t>i
+            put += 1
+    while get < put:
+        i = queue[get]
+        get += 1
+        # row without integer division, which is slow
+        x = <Py_ssize_t>(i * row_of)
+        if (x + 1) * b <= i:
+            x += 1
+        elif x * b > i:
+            x -= 1
+        p = i + 2 * x + w + 1
+        around = _mask_bits(mask, p - w - 1) | (_mask_bits(mask, p - 1) << 3) | (_mask_bits(mask, p + w - 1) << 6)
+        if around == 0:
             continue
-    points[0, 0] = size
-    points[1, 0] = size
-    return size
+        d = <np.uint32_t>dist[i] + 1
+        if d >= unreachable:
+            return False
+        for k in range(9):
+            if (around >> k) & 1:
+                q = p + mask_step[k]
+                mask[q >> 3] &= ~(1 << (q & 7))
+                dist[i + cell_step[k]] = <dist_t>d
+                queue[put] = <np.int32_t>(i + cell_step[k])
+                put += 1
+    return True
+
+
+cdef struct heat_params:
+    double T_env
+    double T_cooler
+    double T_heater
+    double k_temp
+
+
+@cython.cdivision(True)
+cdef inline double _heat_value(np.int64_t value, np.uint32_t dist_heater, np.uint32_t dist_cooler,
+                               np.uint32_t unreachable, heat_params* params) noexcept nogil:
+    """Temperature of one position from distances to the nearest heater and cooler."""
+    cdef double heating = 0, cooling = 0
+    if value == HEATER:
+        return params.T_heater
+    if value == COOLER:
+        return params.T_cooler
+    if value == WALL:
+        # non define add some bullshit
+        return 9999999
+    if dist_heater != unreachable:
+        heating = max((1/<double>dist_heater)*(params.T_heater - params.T_env), 0)
+    if dist_cooler != unreachable:
+        cooling = max((1/<double>dist_cooler)*(params.T_env - params.T_cooler), 0)
+    return params.T_env + params.k_temp * (heating - cooling)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def fast_heat(cell_t[:, ::1] map, dist_t[:, ::1] dist_heater, dist_t[:, ::1] dist_cooler,
+              double T_env, double T_cooler, double T_heater, double k_temp, int threads=1):
+    """Calculate heatmap from distances maps (see fast_distances), rows are split among threads."""
+    cdef heat_params params = heat_params(T_env, T_cooler, T_heater, k_temp)
+    cdef double[:, ::1] heatmap = np.empty((map.shape[0], map.shape[1]), dtype=np.double)
+    cdef dist_t unreachable = <dist_t>~(<dist_t>0)
+    cdef Py_ssize_t i, j
+    for i in prange(map.shape[0], nogil=True, num_threads=threads, schedule='static'):
+        for j in range(map.shape[1]):
+            heatmap[i, j] = _heat_value(map[i, j], dist_heater[i, j], dist_cooler[i, j], unreachable, &params)
+    return np.asarray(heatmap)
 
 
 @cython.boundscheck(False)
+@cython.wraparound(False)
+def fast_heat_cells(cell_t[:, ::1] map, dist_t[:, ::1] dist_heater, dist_t[:, ::1] dist_cooler,
+                    double[:, ::1] heatmap, np.int64_t[::1] cells,
+                    double T_env, double T_cooler, double T_heater, double k_temp):
+    """Recalculate heatmap (in place) only on positions given by flat indices in cells."""
+    cdef heat_params params = heat_params(T_env, T_cooler, T_heater, k_temp)
+    cdef dist_t unreachable = <dist_t>~(<dist_t>0)
+    cdef int b = map.shape[1]
+    cdef Py_ssize_t k
+    cdef int i, j
+    for k in range(cells.shape[0]):
+        i = cells[k] // b
+        j = cells[k] % b
+        heatmap[i, j] = _heat_value(map[i, j], dist_heater[i, j], dist_cooler[i, j], unreachable, &params)
+
+
+cdef inline bint _passable(np.int64_t value) noexcept nogil:
+    """True if the heat spreads through the position."""
+    return value != WALL and value != HEATER and value != COOLER
+
+
+cdef int _compare_keys(const void* x, const void* y) noexcept nogil:
+    cdef np.int64_t a = (<np.int64_t*>x)[0]
+    cdef np.int64_t b = (<np.int64_t*>y)[0]
+    return (a > b) - (a < b)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
 @cython.cdivision(True)
-cdef void _bfs_from_points(np.int64_t[:, :] map, int a, int b, int value, np.int64_t[:, :] points, np.int64_t[:, :] dist_from_points, int size):
-    """BFS from find points, it save distances from points to new map of distances."""
-    size = size % (a*b+1)
-    cdef int queue_point = 1
-    cdef int x, y, dx, dy
-    while True:
-        if queue_point != size:
-            x = points[0][queue_point]
-            y = points[1][queue_point]
-            queue_point = (queue_point + 1) % (a*b+1)
-            dx = -1
-            dy = -1
-            if map[x,y] == value:
-                dist_from_points[x, y] = 0
-            for i in range(3):
-                for j in range(3):
-                    if dx == 0 and dy == 0:
-                        dy += 1
-                        continue
-                    if (is_in(x + dx, y + dy, a, b) and map[x + dx, y + dy] != WALL and
-                                map[x + dx, y + dy] != HEATER and map[x + dx, y + dy] != COOLER and dist_from_points[x+dx,y+dy] == -1):
-                        dist_from_points[x+dx,y+dy] = dist_from_points[x, y] + 1
-                        points[0, size] = x+dx
-                        points[1, size] = y+dy
-                        size = (size + 1) % (a*b+1)
-                    dy += 1
-                dx += 1
-                dy = -1
+def fast_repair_distances(cell_t[:, ::1] map, dist_t[:, ::1] dist, int source, int r, int c, buffer=None):
+    """Repair distances from sources (HEATER or COOLER) after the position (r, c) in map was changed.
+        Only the affected region is recomputed:
+        1. cells whose all shortest paths go through (r, c) are invalidated (level by level from (r, c)),
+        2. valid cells around the invalidated region are sorted by distance and used as BFS seeds,
+        3. BFS from seeds lowers distances, so also shorter paths through new source or passage are found.
+        Return flat indices of positions whose distance could change.
+        buffer is optional queue buffer (see queue_buffer), which is used instead of allocating new array.
+        Raise OverflowError if some distance does not fit to the type of dist (distances must be computed
+        again by fast_distances)."""
+    cdef int a = map.shape[0]
+    cdef int b = map.shape[1]
+    cdef np.int32_t[::1] _buffer = queue_buffer(a, b) if buffer is None else buffer
+    cdef dist_t unreachable = <dist_t>~(<dist_t>0)
+    cdef dist_t* flat = &dist[0, 0]
+    cdef np.int64_t[::1] seeds
+    cdef Py_ssize_t n_invalid = 0, n_seeds = 0, seed_get = 0, queue_get = 0, queue_put = 0
+    cdef Py_ssize_t i, n, level_start, level_end
+    cdef np.int64_t d, key, head = 0
+    cdef np.int64_t d_old = dist[r, c]
+    cdef bint is_source = map[r, c] == source
+    cdef bint has_parent
+    cdef int x, y, dx, dy, nx, ny, px, py
+
+    if _buffer.shape[0] < a * b:
+        raise ValueError("buffer must have at least a*b items.")
+    # 1. invalidate, invalid cells are unreachable, so they are not parents of the next level
+    if d_old != unreachable and not is_source:
+        _buffer[0] = r * b + c
+        dist[r, c] = unreachable
+        n_invalid = 1
+        level_start = 0
+        d = d_old
+        while level_start < n_invalid and d + 1 < unreachable:
+            level_end = n_invalid
+            for i in range(level_start, level_end):
+                x = _buffer[i] // b
+                y = _buffer[i] % b
+                for dx in range(-1, 2):
+                    for dy in range(-1, 2):
+                        nx = x + dx
+                        ny = y + dy
+                        if not is_in(nx, ny, a, b) or dist[nx, ny] != d + 1:
+                            continue
+                        has_parent = False
+                        for px in range(nx - 1, nx + 2):
+                            for py in range(ny - 1, ny + 2):
+                                if is_in(px, py, a, b) and dist[px, py] == d:
+                                    has_parent = True
+                        if not has_parent:
+                            dist[nx, ny] = unreachable
+                            _buffer[n_invalid] = nx * b + ny
+                            n_invalid += 1
+            level_start = level_end
+            d += 1
+
+    # 2. seeds are valid cells around invalidated region and changed position, key is distance and index
+    seeds = np.empty(8 * (n_invalid + 1) + 1, dtype=np.int64)
+    if is_source:
+        dist[r, c] = 0
+        seeds[n_seeds] = r * b + c
+        n_seeds += 1
+    for i in range(-1, n_invalid):
+        if i < 0:
+            x = r
+            y = c
+        else:
+            x = _buffer[i] // b
+            y = _buffer[i] % b
+        for dx in range(-1, 2):
+            for dy in range(-1, 2):
+                nx = x + dx
+                ny = y + dy
+                if (dx != 0 or dy != 0) and is_in(nx, ny, a, b) and dist[nx, ny] != unreachable:
+                    seeds[n_seeds] = (<np.int64_t>dist[nx, ny] << 32) | (nx * b + ny)
+                    n_seeds += 1
+    qsort(&seeds[0], n_seeds, sizeof(np.int64_t), _compare_keys)
+    # the buffer is queue from now, invalid cells are kept for the result
+    touched = np.empty(n_invalid + 1, dtype=np.int64)
+    touched[0] = r * b + c
+    touched[1:] = _buffer[:n_invalid]
+
+    # 3. BFS from seeds, seeds and queue are merged by distance; queue is sorted by distance
+    # and its cells are not changed after they were added
+    while seed_get < n_seeds or queue_get < queue_put:
+        if queue_get < queue_put:
+            head = (<np.int64_t>flat[_buffer[queue_get]] << 32) | _buffer[queue_get]
+        if queue_get < queue_put and (seed_get == n_seeds or head <= seeds[seed_get]):
+            key = head
+            queue_get += 1
         else:
-            break
+            key = seeds[seed_get]
+            seed_get += 1
+        d = key >> 32
+        i = key & 0xFFFFFFFF
+        if flat[i] != d:
+            continue
+        x = i // b
+        y = i % b
+        for dx in range(-1, 2):
+            for dy in range(-1, 2):
+                nx = x + dx
+                ny = y + dy
+                n = nx * b + ny
+                if (is_in(nx, ny, a, b) and _passable(map[nx, ny])
+                        and (flat[n] == unreachable or flat[n] > d + 1)):
+                    if d + 1 >= unreachable:
+                        raise OverflowError("distance does not fit to {}.".format(np.asarray(dist).dtype))
+                    flat[n] = <dist_t>(d + 1)
+                    _buffer[queue_put] = <np.int32_t>n
+                    queue_put += 1
+
+    return np.concatenate([touched, np.asarray(_buffer[:queue_put])])
 
 
-cdef int is_in(int x, int y, int maxX, int maxY):
+cdef inline int is_in(int x, int y, int maxX, int maxY) noexcept nogil:
     """True if point is in map."""
     return 0 <= x < maxX and 0 <= y < maxY
@@ -1,12 +1,156 @@
 from PyQt5 import QtWidgets, QtCore, QtGui, QtSvg, uic
-from beeclust.beeclustClass import MapConst, BeeClust
+from beeclust.beeclustClass import MapConst, BeeClust, _bees, _compact_dtype
 from beeclust.About import ABOUT
+from beeclust.io import is_map_file, load_text, simulation_parameters
 import numpy
 import os
 import sys
+import threading
+import time
 
 PICTURES = {'grass': 0, 'wall': 5, 'heater': 6, 'cooler': 7, 'bee': -1, 'up': 1, 'down': 3, 'right': 2, 'left': 4}
 
+# colors of map values from -1 (waiting bee) to 7 used instead of icons for small cells
+MAP_COLORS = numpy.array([(251, 188, 4), (46, 204, 113), (251, 188, 4), (251, 188, 4), (251, 188, 4), (251, 188, 4),
+                          (148, 177, 180), (244, 4, 4), (4, 130, 251)], dtype=numpy.uint8)
+# color of bees in heat map when their icons are not drawn
+BEE_HEAT_COLOR = (4, 4, 4)
+# heat map colors of positions which do not depend on temperature
+FIXED_HEAT_COLORS = {MapConst.HEATER: (255, 0, 0), MapConst.COOLER: (0, 0, 255), MapConst.WALL: (100, 100, 100)}
+
+
+def heat_colors(map, heatmap, T_env, T_cooler, T_heater, n_colors=9, color_steps=510):
+    """
+    Colors of heat map as rows x columns x 3 array (RGB). Temperatures between T_cooler and T_env
+    go from blue to green, between T_env and T_heater from green to red, in n_colors steps.
+    """
+    step = color_steps / (n_colors + 1)
+    hot_add, hot_remove = _color_split(heatmap, T_heater, T_env, n_colors, step)
+    cold_add, cold_remove = _color_split(heatmap, T_env, T_cooler, n_colors, step)
+    hot = heatmap > T_env
+    cold = heatmap < T_env
+    colors = numpy.empty(map.shape + (3,), dtype=numpy.uint8)
+    colors[..., 0] = numpy.where(hot, hot_add, 0)
+    colors[..., 1] = numpy.where(hot, 255 - hot_remove, numpy.where(cold, cold_add, 255))
+    colors[..., 2] = numpy.where(cold, 255 - cold_remove, 0)
+    for value, color in FIXED_HEAT_COLORS.items():
+        colors[map == value] = color
+    return colors
+
+
+def merge_cells(cells):
+    """
+    Merge positions (n x 2 array sorted by rows, see BeeClust.changed_cells) to rectangles
+    as m x 4 array (row, column, rows, columns). Neighbour positions in a row are merged first,
+    then the same runs of positions in the next rows.
+    """
+    cells = numpy.asarray(cells, dtype=numpy.int64).reshape(-1, 2)
+    if len(cells) == 0:
+        return numpy.empty((0, 4), dtype=numpy.int64)
+    rows, columns = cells[:, 0], cells[:, 1]
+    # runs of positions in one row
+    first = numpy.flatnonzero(numpy.concatenate(([True], (rows[1:] != rows[:-1]) | (columns[1:] != columns[:-1] + 1))))
+    last = numpy.append(first[1:], len(cells)) - 1
+    run_rows, starts, ends = rows[first], columns[first], columns[last]
+    # runs with the same columns in the next rows
+    order = numpy.lexsort((run_rows, ends, starts))
+    run_rows, starts, ends = run_rows[order], starts[order], ends[order]
+    first = numpy.flatnonzero(numpy.concatenate(([True], (starts[1:] != starts[:-1]) | (ends[1:] != ends[:-1])
+                                                 | (run_rows[1:] != run_rows[:-1] + 1))))
+    last = numpy.append(first[1:], len(run_rows)) - 1
+    return numpy.column_stack((run_rows[first], starts[first], run_rows[last] - run_rows[first] + 1,
+                               ends[first] - starts[first] + 1))
+
+
+def _color_split(temp, base, minus, n_colors, step):
+    # color interval of temperatures between minus and base, as amount of color added and removed
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        split = numpy.trunc((numpy.trunc((temp - minus) / ((base - minus) / n_colors)) + 1) * step)
+    split = numpy.nan_to_num(numpy.clip(split, 0, 510)).astype(numpy.int16)
+    return numpy.minimum(split, 255), numpy.maximum(split - 255, 0)
+
+
+class SimulationThread(QtCore.QThread):
+    """
+    Runs ticks of BeeClust simulation continuously in other thread. Ticks are done in chunks by BeeClust.run,
+    which releases GIL, so the UI stays responsive. Copy of the map (read-only numpy array) is made
+    at most fps times per second and the UI is notified by frame_ready signal, it takes the newest one by take.
+    The simulation may be changed from other thread only while holding lock.
+
+    bee_clust - BeeClust simulation
+
+    fps - max number of snapshots per second
+    """
+
+    frame_ready = QtCore.pyqtSignal()
+    failed = QtCore.pyqtSignal(str)
+
+    def __init__(self, bee_clust, fps=30):
+        super().__init__()
+        self.bee_clust = bee_clust
+        self.fps = fps
+        self.lock = threading.Lock()
+        self.ticks = 0
+        """Number of ticks done by the thread."""
+        self._chunk = 1
+        self._running = False
+        self._snapshot = None
+        self._snapshot_lock = threading.Lock()
+
+    def start(self):
+        self._running = True
+        super().start()
+
+    def stop(self):
+        """
+        Stop the thread after the current chunk of ticks and wait for it.
+        """
+        self._running = False
+        self.wait()
+        with self._snapshot_lock:
+            self._snapshot = None
+
+    def take(self):
+        """
+        The newest snapshot of the map not taken yet, None if there is no new one.
+        """
+        with self._snapshot_lock:
+            snapshot, self._snapshot = self._snapshot, None
+        return snapshot
+
+    def run(self):
+        # exception must not leave run, it would abort the application
+        try:
+            self.play()
+        except Exception as e:
+            self.failed.emit(str(e))
+        finally:
+            self._running = False
+
+    def play(self):
+        interval = 1 / self.fps
+        shown = 0
+        while self._running:
+            start = time.perf_counter()
+            with self.lock:
+                self.bee_clust.run(self._chunk)
+            self.ticks += self._chunk
+            elapsed = time.perf_counter() - start
+            # chunk takes between eighth and half of frame, so the lock is not held long
+            if elapsed < interval / 8:
+                self._chunk *= 2
+            elif elapsed > interval / 2 and self._chunk > 1:
+                self._chunk //= 2
+            now = time.perf_counter()
+            if now - shown >= interval:
+                with self.lock:
+                    snapshot = self.bee_clust.map.copy()
+                snapshot.flags.writeable = False
+                with self._snapshot_lock:
+                    self._snapshot = snapshot
+                shown = now
+                self.frame_ready.emit()
+
 
 class GridWidget(QtWidgets.QWidget):
 
@@ -15,7 +159,9 @@ class GridWidget(QtWidgets.QWidget):
         # start zoom
         self.CELL_SIZE = 40
         # min zoom when scroll
-        self.MIN_SIZE = 20
+        self.MIN_SIZE = 2
+        # smaller cells are drawn only by colors, without icons
+        self.ICON_MIN_SIZE = 12
         # max zoom whe scroll
         self.MAX_SIZE = 100
         # scroll step
@@ -30,6 +176,26 @@ class GridWidget(QtWidgets.QWidget):
         self.N_COLORS = 9
         # how many values are between the colors
         self.COLOR_STEPS = 510
+        # more changed rectangles are not repainted one by one, but whole widget at once
+        self.MAX_DIRTY_RECTS = 1000
+        # icons rasterized to pixmaps of the cell size they were made for
+        self._sprites = {}
+        self._sprites_size = None
+        # heat map colors and the heatmap version they were computed for
+        self._heat_colors = None
+        self._heat_key = None
+        # simulation running in other thread and the last map it handed over
+        self.worker = SimulationThread(bee_clust)
+        self.worker.frame_ready.connect(self.show_snapshot)
+        self.snapshot = None
+
+    def set_simulation(self, bee_clust):
+        # show other simulation, the thread must be stopped
+        self.bee_clust = bee_clust
+        self.worker.bee_clust = bee_clust
+        self._heat_key = None
+        self.recalculate_sizes(*bee_clust.map.shape)
+        self.update()
 
     def pixels_to_logical(self, x, y):
         return y // self.CELL_SIZE, x // self.CELL_SIZE
@@ -38,8 +204,64 @@ class GridWidget(QtWidgets.QWidget):
         return column * self.CELL_SIZE, row * self.CELL_SIZE
 
     def tick(self):
+        if self.playing:
+            return
         self.bee_clust.tick()
-        self.update()
+        self.update_cells(self.bee_clust.changed_cells)
+
+    @property
+    def playing(self):
+        return self.worker.isRunning()
+
+    def play(self):
+        # run the simulation in other thread, the widget shows its snapshots
+        if not self.playing:
+            self.snapshot = self.bee_clust.map.copy()
+            self.worker.start()
+
+    def pause(self):
+        # stop the thread, the widget shows the map of simulation again
+        if self.playing:
+            self.worker.stop()
+        if self.snapshot is not None:
+            self.show_map(self.bee_clust.map)
+            self.snapshot = None
+
+    def show_snapshot(self):
+        # repaint cells changed since the last snapshot, the newest is taken when more were made
+        snapshot = self.worker.take()
+        if snapshot is not None and self.snapshot is not None:
+            self.show_map(snapshot)
+            self.snapshot = snapshot
+
+    def show_map(self, map):
+        if map.shape != self.snapshot.shape:
+            self.update()
+        else:
+            self.update_cells(numpy.argwhere(map != self.snapshot))
+
+    def shown_map(self):
+        # map which is drawn, snapshot when the simulation runs in other thread
+        return self.bee_clust.map if self.snapshot is None else self.snapshot
+
+    def update_cells(self, cells):
+        # repaint only rectangles of changed positions, whole widget if they are not known
+        region = self.dirty_region(cells)
+        if region is None:
+            self.update()
+        else:
+            self.update(region)
+
+    def dirty_region(self, cells):
+        # region of widget covering the positions, None when they are not known or there are too many rectangles
+        rects = None if cells is None else merge_cells(cells)
+        if rects is None or len(rects) > self.MAX_DIRTY_RECTS:
+            return None
+        region = QtGui.QRegion()
+        for row, column, rows, columns in rects.tolist():
+            region += QtCore.QRect(*self.logical_to_pixels(row, column),
+                                   columns * self.CELL_SIZE, rows * self.CELL_SIZE)
+        return region
 
     def recalculate_sizes(self, rows, cols):
         size = self.logical_to_pixels(rows, cols)
@@ -47,76 +269,91 @@ class GridWidget(QtWidgets.QWidget):
         self.setMaximumSize(*size)
         self.resize(*size)
 
-    def get_color_for_position(self, row, column):
-        # generate color based on position and temp
-        if self.bee_clust.map[row, column] == MapConst.HEATER:
-            return QtGui.QColor(255, 0, 0)
-        elif self.bee_clust.map[row, column] == MapConst.COOLER:
-            return QtGui.QColor(0, 0, 255)
-        elif self.bee_clust.map[row, column] == MapConst.WALL:
-            return QtGui.QColor(100, 100, 100)
-        elif self.bee_clust.heatmap[row, column] == self.bee_clust.T_env:
-            return QtGui.QColor(0, 255, 0)
-        # calculate colors between
-        elif self.bee_clust.heatmap[row, column] < self.bee_clust.T_env:
-            add, remove = self.calculate_color(self.bee_clust.heatmap[row, column], self.bee_clust.T_env,
-                                               self.bee_clust.T_cooler, self.COLOR_STEPS / (self.N_COLORS+1))
-
-            return QtGui.QColor(0, add, 255 - remove)
-        elif self.bee_clust.heatmap[row, column] > self.bee_clust.T_env:
-            add, remove = self.calculate_color(self.bee_clust.heatmap[row, column], self.bee_clust.T_heater,
-                                               self.bee_clust.T_env, self.COLOR_STEPS / (self.N_COLORS+1))
-            return QtGui.QColor(add, 255-remove, 0)
-
-    def calculate_color(self, temp, base, minus, t_const):
-        # some compute magic to generate colors intervals
-        split = (int((temp-minus) / ((base - minus) / self.N_COLORS)) + 1) * t_const
-        return min(255, int(split)), max(0, int(split) - 255)
+    def heat_colors(self):
+        # colors of heat map, computed again only for new heatmap or temperatures
+        b = self.bee_clust
+        key = (id(b.heatmap), b._heat_version, b._geometry_version, b.T_env, b.T_cooler, b.T_heater,
+               self.N_COLORS, self.COLOR_STEPS)
+        if key != self._heat_key:
+            self._heat_colors = heat_colors(self.shown_map(), b.heatmap, b.T_env, b.T_cooler, b.T_heater,
+                                            self.N_COLORS, self.COLOR_STEPS)
+            self._heat_key = key
+        return self._heat_colors
+
+    def sprites(self):
+        # icons as pixmaps of cell size, they are rasterized again only after zoom
+        if self._sprites_size != self.CELL_SIZE:
+            self._sprites = {name: self.rasterize(image) for name, image in self.images.items()}
+            self._sprites_size = self.CELL_SIZE
+        return self._sprites
+
+    def rasterize(self, image):
+        # render svg to transparent pixmap of cell size
+        pixmap = QtGui.QPixmap(self.CELL_SIZE, self.CELL_SIZE)
+        pixmap.fill(QtCore.Qt.transparent)
+        painter = QtGui.QPainter(pixmap)
+        image.render(painter, QtCore.QRectF(0, 0, self.CELL_SIZE, self.CELL_SIZE))
+        painter.end()
+        return pixmap
 
-    def paintEvent(self, event):
-        rect = event.rect()
+    def get_color_for_position(self, row, column):
+        # color of position in heat map
+        return QtGui.QColor(*self.heat_colors()[row, column].tolist())
 
-        # We find out what area of our matrix it is
-        # we can not get out of the nut out
+    def visible_cells(self, rect):
+        # ranges of rows and columns of map in the rectangle of widget
         row_min, col_min = self.pixels_to_logical(rect.left(), rect.top())
-        row_min = max(row_min, 0)
-        col_min = max(col_min, 0)
         row_max, col_max = self.pixels_to_logical(rect.right(), rect.bottom())
-        row_max = min(row_max + 1, self.bee_clust.map.shape[0])
-        col_max = min(col_max + 1, self.bee_clust.map.shape[1])
+        rows, cols = self.bee_clust.map.shape
+        return range(max(row_min, 0), min(row_max + 1, rows)), range(max(col_min, 0), min(col_max + 1, cols))
 
+    def paintEvent(self, event):
         painter = QtGui.QPainter(self)
+        for rect in event.region().rects():
+            self.draw_rect(painter, rect)
 
-        for row in range(row_min, row_max):
-            for column in range(col_min, col_max):
-                # get place in map to color
-                x, y = self.logical_to_pixels(row, column)
-
-                rect = QtCore.QRectF(x, y, self.CELL_SIZE, self.CELL_SIZE)
-
-                # if heat map render colors else grass
-                if self.heat_map:
-                    painter.fillRect(rect, QtGui.QBrush(self.get_color_for_position(row, column)))
-                else:
-                    self.images['grass'].render(painter, rect)
-
-                # Place right images on positions
-                if self.bee_clust.map[row, column] == PICTURES["wall"]:
-                    self.images['wall'].render(painter, rect)
-                elif self.bee_clust.map[row, column] <= PICTURES["bee"]:
-                    self.images['bee'].render(painter, rect)
-                elif self.bee_clust.map[row, column] == PICTURES["up"]:
-                    self.images['up'].render(painter, rect)
-                elif self.bee_clust.map[row, column] == PICTURES["down"]:
-                    self.images['down'].render(painter, rect)
-                elif self.bee_clust.map[row, column] == PICTURES["right"]:
-                    self.images['right'].render(painter, rect)
-                elif self.bee_clust.map[row, column] == PICTURES["left"]:
-                    self.images['left'].render(painter, rect)
-                elif self.bee_clust.map[row, column] == PICTURES["heater"]:
-                    self.images['heater'].render(painter, rect)
-                elif self.bee_clust.map[row, column] == PICTURES["cooler"]:
-                    self.images['cooler'].render(painter, rect)
+    def draw_rect(self, painter, rect):
+        # draw cells in one rectangle of the dirty region, so far apart changes do not repaint cells between them
+        rows, columns = self.visible_cells(rect)
+        if not rows or not columns:
+            return
+        icons = self.CELL_SIZE >= self.ICON_MIN_SIZE
+        if self.heat_map or not icons:
+            self.draw_colors(painter, rows, columns, bees=not icons)
+        if icons:
+            self.draw_icons(painter, rows, columns)
+
+    def draw_colors(self, painter, rows, columns, bees):
+        # visible part of map as one image scaled to cells, heat map colors or colors of icons
+        block = self.shown_map()[rows.start:rows.stop, columns.start:columns.stop]
+        if self.heat_map:
+            colors = self.heat_colors()[rows.start:rows.stop, columns.start:columns.stop]
+            if bees:
+                colors = colors.copy()
+                colors[_bees(block)] = BEE_HEAT_COLOR
+        else:
+            colors = MAP_COLORS[numpy.clip(block, -1, MapConst.COOLER) + 1]
+        colors = numpy.ascontiguousarray(colors)
+        image = QtGui.QImage(colors.data, colors.shape[1], colors.shape[0], colors.strides[0],
+                             QtGui.QImage.Format_RGB888)
+        x, y = self.logical_to_pixels(rows.start, columns.start)
+        painter.drawImage(QtCore.QRectF(x, y, len(columns) * self.CELL_SIZE, len(rows) * self.CELL_SIZE), image)
+
+    def draw_icons(self, painter, rows, columns):
+        # grass is one tiled fill when heat map is off, icons are drawn grouped by sprite
+        sprites = self.sprites()
+        if not self.heat_map:
+            x, y = self.logical_to_pixels(rows.start, columns.start)
+            painter.fillRect(QtCore.QRect(x, y, len(columns) * self.CELL_SIZE, len(rows) * self.CELL_SIZE),
+                             QtGui.QBrush(sprites['grass']))
+        # waiting bees have the icon of bee
+        block = numpy.maximum(self.shown_map()[rows.start:rows.stop, columns.start:columns.stop], PICTURES['bee'])
+        for name, value in PICTURES.items():
+            if value == PICTURES['grass']:
+                continue
+            sprite = sprites[name]
+            for row, column in numpy.argwhere(block == value).tolist():
+                painter.drawPixmap(*self.logical_to_pixels(rows.start + row, columns.start + column), sprite)
 
     def mousePressEvent(self, event):
         # Convert to matrix from click
@@ -127,13 +364,17 @@ class GridWidget(QtWidgets.QWidget):
             if event.button() == QtCore.Qt.LeftButton:
                 if self.selected is None:
                     return
-                self.bee_clust.map[row, column] = self.selected
-                self.bee_clust.recalculate_heat()
+                value = self.selected
             elif event.button() == QtCore.Qt.RightButton:
-                self.bee_clust.map[row, column] = PICTURES['grass']
-                self.bee_clust.recalculate_heat()
+                value = PICTURES['grass']
             else:
                 return
+            with self.worker.lock:
+                self.bee_clust.set_cell(row, column, value)
+                if self.snapshot is not None:
+                    # the cell is shown before the next snapshot
+                    self.snapshot = self.snapshot.copy()
+                    self.snapshot[row, column] = self.bee_clust.map[row, column]
             # rerender the widget
             if self.heat_map:
                 self.update()
@@ -144,15 +385,14 @@ class GridWidget(QtWidgets.QWidget):
         modifiers = QtGui.QGuiApplication.keyboardModifiers()
         if modifiers == QtCore.Qt.ControlModifier:
             if event.angleDelta().y() < 0:
-                if not self.CELL_SIZE < self.MIN_SIZE:
-                    self.CELL_SIZE -= self.STEP
-                    self.recalculate_sizes(*self.bee_clust.map.shape)
-                    self.update()
+                size = max(self.CELL_SIZE - self.STEP, self.MIN_SIZE)
             else:
-                if not self.CELL_SIZE > self.MAX_SIZE:
-                    self.CELL_SIZE += self.STEP
-                    self.recalculate_sizes(*self.bee_clust.map.shape)
-                    self.update()
+                size = min(self.CELL_SIZE + self.STEP, self.MAX_SIZE)
+            if size != self.CELL_SIZE:
+                self.CELL_SIZE = size
+                self.sprites()
+                self.recalculate_sizes(*self.bee_clust.map.shape)
+                self.update()
 
 
 class myWindow(QtWidgets.QMainWindow):
@@ -204,8 +444,10 @@ class App:
         self.action_bind('actionSave', lambda: self.save_dialog())
         self.action_bind('actionAbout', lambda: self.about())
         self.action_bind('actionTick', lambda: self.tick())
+        self.action_bind('actionPlay', lambda: self.play())
         self.action_bind('actionHeat', lambda: self.heatMap())
         self.action_bind('actionParameters', lambda: self.change_dialog())
+        self.grid.worker.failed.connect(lambda message: self.play_failed(message))
 
     def action_bind(self, name, func):
         action = self.window.findChild(QtWidgets.QAction, name)
@@ -263,67 +505,91 @@ class App:
             return
 
         # load from spins box
-        self.bee_clust.p_changedir = dialog.findChild(QtWidgets.QDoubleSpinBox, 'p_changedir').value()
-        self.bee_clust.p_wall = dialog.findChild(QtWidgets.QDoubleSpinBox, 'p_wall').value()
-        self.bee_clust.p_meet = dialog.findChild(QtWidgets.QDoubleSpinBox, 'p_meet').value()
-        self.bee_clust.k_temp = dialog.findChild(QtWidgets.QDoubleSpinBox, 'k_temp').value()
-        self.bee_clust.k_stay = dialog.findChild(QtWidgets.QDoubleSpinBox, 'k_stay').value()
-        self.bee_clust.T_ideal = dialog.findChild(QtWidgets.QDoubleSpinBox, 'T_ideal').value()
-        T_heater = dialog.findChild(QtWidgets.QDoubleSpinBox, 'T_heater').value()
-
-        T_cooler = dialog.findChild(QtWidgets.QDoubleSpinBox, 'T_cooler').value()
-        T_env = dialog.findChild(QtWidgets.QDoubleSpinBox, 'T_env').value()
-
-        if T_heater < T_env or T_cooler > T_env:
+        parameters = {name: dialog.findChild(QtWidgets.QDoubleSpinBox, name).value()
+                      for name in ('p_changedir', 'p_wall', 'p_meet', 'k_temp', 'k_stay', 'T_ideal',
+                                   'T_heater', 'T_cooler', 'T_env')}
+        parameters['min_wait'] = dialog.findChild(QtWidgets.QSpinBox, 'min_wait').value()
+
+        # message is shown before the simulation is locked, so the simulation thread is not stopped by it
+        if parameters['T_heater'] < parameters['T_env'] or parameters['T_cooler'] > parameters['T_env']:
             QtWidgets.QMessageBox.critical(self.window, "Temperature error", "Temperatures should be:<br>"
                                                                              "<b>T_heater</b> >= <b>T_env</b> >= "
                                                                              "<b>T_cooler</b><br>"
                                                                              "Temp values not change.")
-        else:
-            self.bee_clust.T_heater = T_heater
-            self.bee_clust.T_cooler = T_cooler
-            self.bee_clust.T_env = T_env
-
-        self.bee_clust.min_wait = dialog.findChild(QtWidgets.QSpinBox, 'min_wait').value()
-        self.bee_clust.recalculate_heat()
+            for name in ('T_heater', 'T_cooler', 'T_env'):
+                del parameters[name]
+
+        with self.grid.worker.lock:
+            # waiting bees are stored in the map, so longer waits than its type holds need wider map
+            dtype = _compact_dtype(self.bee_clust.dtype, max(parameters['k_stay'], parameters['min_wait']))
+            if dtype != self.bee_clust.dtype:
+                self.bee_clust.dtype = numpy.dtype(dtype)
+                self.bee_clust.map = self.bee_clust.map.astype(dtype)
+            for name, value in parameters.items():
+                setattr(self.bee_clust, name, value)
+            self.bee_clust.update_heat()
         self.grid.update()
 
     def open_dialog(self):
-        # load from file dialog
-        file = QtWidgets.QFileDialog.getOpenFileName(self.window)
+        # load from file dialog, binary map file is memory-mapped with its parameters, text file is converted,
+        # map is kept in the smallest type which holds it
+        path = QtWidgets.QFileDialog.getOpenFileName(self.window)[0]
+        if not path:
+            return
+        self.stop()
         try:
-            file = open(file[0], 'r')
+            if is_map_file(path):
+                bee_clust = BeeClust.from_file(path)
+            else:
+                array = load_text(path)
+                parameters = simulation_parameters(self.bee_clust)
+                parameters['dtype'] = _compact_dtype(array.dtype, max(self.bee_clust.k_stay, self.bee_clust.min_wait))
+                bee_clust = BeeClust(array, **parameters)
         except OSError as e:
             QtWidgets.QMessageBox.critical(self.window, "Open error", e.strerror)
+        except ValueError:
+            QtWidgets.QMessageBox.critical(self.window, "File format error",
+                                           "Bad format, need beeclust map file or text file with numbers.")
         else:
-            with file:
-                try:
-                    array = numpy.loadtxt(file, dtype=numpy.int8)
-                    if array.max() > 7:
-                        raise TypeError()
-                    self.bee_clust.map = array
-                    self.bee_clust.recalculate_heat()
-                    self.grid.recalculate_sizes(*array.shape)
-                    self.grid.update()
-                except (TypeError, ValueError) as e:
-                    QtWidgets.QMessageBox.critical(self.window, "File format error",
-                                                   "Bad format, need numpy 2D array fill with numbers.")
+            self.bee_clust = bee_clust
+            self.grid.set_simulation(bee_clust)
 
     def save_dialog(self):
-        # save map to file
-        file = QtWidgets.QFileDialog.getSaveFileName(self.window)
+        # save map to binary file, file with .txt suffix is saved as text
+        path = QtWidgets.QFileDialog.getSaveFileName(self.window)[0]
+        if not path:
+            return
         try:
-            file = open(file[0], 'w')
+            with self.grid.worker.lock:
+                if path.endswith('.txt'):
+                    numpy.savetxt(path, self.bee_clust.map, fmt='%d')
+                else:
+                    self.bee_clust.to_file(path)
         except OSError as e:
             QtWidgets.QMessageBox.critical(self.window, "Save error", e.strerror)
-        else:
-            with file:
-                numpy.savetxt(file, self.bee_clust.map.astype(numpy.int8))
 
     def tick(self):
         # button tick
         self.grid.tick()
 
+    def play(self):
+        # button play, simulation runs in other thread until it is pressed again
+        playing = self.window.findChild(QtWidgets.QAction, 'actionPlay').isChecked()
+        self.window.findChild(QtWidgets.QAction, 'actionTick').setEnabled(not playing)
+        if playing:
+            self.grid.play()
+        else:
+            self.grid.pause()
+
+    def stop(self):
+        # stop the simulation thread before the map is replaced
+        self.window.findChild(QtWidgets.QAction, 'actionPlay').setChecked(False)
+        self.play()
+
+    def play_failed(self, message):
+        self.stop()
+        QtWidgets.QMessageBox.critical(self.window, "Simulation error", message)
+
     def about(self):
         # show about dialog
         QtWidgets.QMessageBox.about(self.window, "BeeClust", ABOUT)
@@ -352,6 +618,7 @@ class App:
         cols = dialog.findChild(QtWidgets.QSpinBox, 'widthBox').value()
         rows = dialog.findChild(QtWidgets.QSpinBox, 'heightBox').value()
 
+        self.stop()
         self.grid.bee_clust.map = numpy.zeros((rows, cols), dtype=numpy.int8)
         self.bee_clust.recalculate_heat()
         self.grid.recalculate_sizes(rows, cols)
@@ -359,7 +626,9 @@ class App:
 
     def run(self):
         self.window.show()
-        return self.app.exec()
+        result = self.app.exec()
+        self.grid.pause()
+        return result
 
 
 def main():
@@ -12,3 +12,27 @@ def check_bound(value, min_v, max_v, text):
     if max_v is not None:
         if value > max_v:
             raise ValueError(text)
+
+
+# Check simulation parameters of BeeClust.
+def check_parameters(p_changedir, p_wall, p_meet, k_temp, k_stay, T_ideal, T_heater, T_cooler, T_env, min_wait):
+    check_type(p_changedir, [float, int], "p_changedir")
+    check_bound(p_changedir, 0, 1, "p_changedir must be positive value between 0-1 -> represent probability.")
+    check_type(p_wall, [float, int], "p_wall")
+    check_bound(p_wall, 0, 1, "p_wall must be positive value between 0-1 -> represent probability.")
+    check_type(p_meet, [float, int], "p_meet")
+    check_bound(p_meet, 0, 1, "p_meet must be positive value between 0-1 -> represent probability.")
+    check_type(k_temp, [float, int], "k_temp")
+    check_bound(k_temp, 0, None, "k_temp must be positive.")
+    check_type(k_stay, [float, int], "k_stay")
+    check_bound(k_stay, 0, None, "k_stay must be positive.")
+    check_type(T_ideal, [float, int], "T_ideal")
+    check_type(T_heater, [float, int], "T_heater")
+    check_type(T_cooler, [float, int], "T_cooler")
+    check_type(T_env, [float, int], "T_env")
+    check_type(min_wait, [float, int], "min_wait")
+    check_bound(min_wait, 0, None, "min_wait must be positive.")
+    if T_heater < T_env:
+        raise ValueError("T_heater must be greater or equal than T_env.")
+    if T_cooler > T_env:
+        raise ValueError("T_cooler must be lower or equal than T_env.")
@@ -0,0 +1,142 @@
+import json
+import struct
+
+import numpy as np
+
+
+MAGIC = b'BEECLMAP'
+"""First bytes of the map file"""
+
+VERSION = 1
+"""Version of the map file format"""
+
+PARAMETERS = ('p_changedir', 'p_wall', 'p_meet', 'k_temp', 'k_stay', 'T_ideal', 'T_heater', 'T_cooler',
+              'T_env', 'min_wait', 'engine', 'seed', 'threads', 'swarm_engine', 'dtype')
+"""Parameters of the simulation saved in the header of the file"""
+
+ALIGNMENT = 64
+"""Map data starts on the multiple of this offset, so it can be memory-mapped"""
+
+# magic, version, length of json header
+_HEADER = struct.Struct('<8sII')
+_TYPES = (np.int8, np.int16, np.int32, np.int64)
+
+
+def simulation_parameters(simulation):
+    """
+    Dictionary of PARAMETERS of BeeClust simulation, which can be saved as json.
+    """
+    parameters = {name: getattr(simulation, name) for name in PARAMETERS}
+    parameters['dtype'] = parameters['dtype'].name
+    return parameters
+
+
+def save_map(path, map, parameters=None):
+    """
+    Save 2D map to binary file. The file has short header (shape, data type and parameters of the simulation
+    as json) followed by the raw map in C order. Map is saved as int8, wider type is used only when
+    the values do not fit (very long waiting bees).
+
+    path - path of the file
+
+    map - 2D numpy array
+
+    parameters - dictionary of simulation parameters saved in the header (must be json serializable)
+    """
+    map = np.asarray(map)
+    if len(map.shape) != 2:
+        raise ValueError("map dim error, not 2D array")
+    dtype = _smallest_type(map)
+    header = json.dumps({
+        'shape': list(map.shape),
+        'dtype': np.dtype(dtype).str,
+        'parameters': parameters or {},
+    }).encode()
+    offset = _data_offset(len(header))
+    with open(path, 'wb') as file:
+        file.write(_HEADER.pack(MAGIC, VERSION, len(header)) + header)
+        file.write(b'\0' * (offset - _HEADER.size - len(header)))
+        np.ascontiguousarray(map, dtype=dtype).tofile(file)
+
+
+def read_header(path):
+    """
+    Read only the header of the map file. Return dictionary with shape, dtype, parameters
+    and offset of the map data in the file.
+    """
+    with open(path, 'rb') as file:
+        data = file.read(_HEADER.size)
+        if len(data) < _HEADER.size:
+            raise ValueError("{} is not map file.".format(path))
+        magic, version, length = _HEADER.unpack(data)
+        if magic != MAGIC:
+            raise ValueError("{} is not map file.".format(path))
+        if version != VERSION:
+            raise ValueError("map file version {} is not supported.".format(version))
+        header = json.loads(file.read(length).decode())
+    return {
+        'shape': tuple(header['shape']),
+        'dtype': np.dtype(header['dtype']),
+        'parameters': header['parameters'],
+        'offset': _data_offset(length),
+    }
+
+
+def is_map_file(path):
+    """
+    True if the file starts with the magic of the binary map file.
+    """
+    with open(path, 'rb') as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def load_map(path, mode='c'):
+    """
+    Load map saved by save_map. Return tuple (map, parameters).
+
+    The map is memory-mapped, so only the header is read and the data are read by the system
+    when they are accessed.
+
+    mode - numpy.memmap mode, 'c' (default) is copy-on-write (changes of the map are not written to the file),
+    'r' is read-only, 'r+' writes changes to the file, None reads whole map to memory
+    """
+    header = read_header(path)
+    shape, dtype, offset = header['shape'], header['dtype'], header['offset']
+    if mode is None:
+        with open(path, 'rb') as file:
+            file.seek(offset)
+            map = np.fromfile(file, dtype=dtype, count=int(np.prod(shape)))
+        if map.size != int(np.prod(shape)):
+            raise ValueError("{} is truncated.".format(path))
+        return map.reshape(shape), header['parameters']
+    if 0 in shape:
+        return np.zeros(shape, dtype=dtype), header['parameters']
+    return np.memmap(path, dtype=dtype, mode=mode, offset=offset, shape=shape), header['parameters']
+
+
+def load_text(path):
+    """
+    Load map saved as text (numbers separated by whitespace, one row of map per line),
+    numbers may be written as floats (numpy.savetxt default).
+    """
+    values = np.loadtxt(path, ndmin=2)
+    map = values.astype(np.int64)
+    if (map != values).any():
+        raise ValueError("{} contains numbers which are not integers.".format(path))
+    return map.astype(_smallest_type(map))
+
+
+def convert_text(source, destination, parameters=None):
+    """
+    Convert the text map file to the binary map file.
+    """
+    save_map(destination, load_text(source), parameters)
+
+
+def _smallest_type(map):
+    low, high = (int(map.min()), int(map.max())) if map.size else (0, 0)
+    return next(t for t in _TYPES if np.iinfo(t).min <= low and high <= np.iinfo(t).max)
+
+
+def _data_offset(length):
+    return -(-(_HEADER.size + length) // ALIGNMENT) * ALIGNMENT
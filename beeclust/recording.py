@@ -0,0 +1,359 @@
+import json
+import struct
+import zlib
+from bisect import bisect_right
+
+import numpy as np
+from beeclust.beeclustClass import BeeClust, _unique
+from beeclust.helpers import check_bound, check_type
+from beeclust.io import simulation_parameters
+
+
+MAGIC = b'BEECLREC'
+"""First bytes of the trajectory file"""
+
+INDEX_MAGIC = b'BEECLIDX'
+"""Last bytes of the trajectory file, when the index of chunks was written by close"""
+
+VERSION = 1
+"""Version of the trajectory file format"""
+
+# header: magic, version, length of json header; chunk: first frame, number of frames, compressed length;
+# footer: offset of the index, magic
+_HEADER = struct.Struct('<8sII')
+_CHUNK = struct.Struct('<qqq')
+_FOOTER = struct.Struct('<q8s')
+# frame in chunk: number of changed positions (-1 for keyframe), type codes of positions and values
+_FRAME = struct.Struct('<qcc')
+_SIGNED = (np.int8, np.int16, np.int32, np.int64)
+_UNSIGNED = (np.uint8, np.uint16, np.uint32, np.uint64)
+
+
+class TrajectoryRecorder:
+    """
+    Records the map of BeeClust simulation after every tick to compressed binary file.
+
+    The file is made of chunks, every chunk starts with the whole map (keyframe) followed by the changes
+    (positions and new values) of the next frames. Chunk is compressed by zlib and written when it has
+    keyframe_every frames, so the memory does not grow with the length of run. Frame 0 is the map when
+    the recorder was created, frame t is the map after t-th tick. The index of chunks is written by close.
+
+    Positions and values are saved in the smallest integer type which holds them and each frame is compressed
+    as soon as it is recorded, so only compressed data of the current chunk are kept in memory.
+
+    The recorder attaches to the simulation (see BeeClust.attach), so it records also the ticks of run.
+    Positions changed by the tick are taken from the simulation, whole map is compared with the last frame
+    only after other changes of map (set_cell, new map) or when most of the map changed.
+
+    simulation - BeeClust simulation to record
+
+    path - path of the file
+
+    keyframe_every - number of frames in one chunk
+
+    level - zlib compression level (0-9)
+    """
+
+    def __init__(self, simulation, path, keyframe_every=100, level=1):
+        check_type(simulation, [BeeClust], "simulation")
+        check_type(keyframe_every, [int], "keyframe_every")
+        check_bound(keyframe_every, 1, None, "keyframe_every must be positive.")
+        check_type(level, [int], "level")
+        check_bound(level, 0, 9, "level must be between 0-9.")
+
+        self.simulation = simulation
+        self.keyframe_every = keyframe_every
+        self.level = level
+        self.frames = 0
+        """Number of recorded frames."""
+        # the last recorded frame
+        self._shadow = simulation.map.copy()
+        self._revision = simulation._revision
+        self._pending = []
+        self._pending_frames = 0
+        self._compressor = None
+        self._index = []
+        self._file = open(path, 'wb')
+        header = json.dumps({
+            'shape': list(self._shadow.shape),
+            'dtype': self._shadow.dtype.str,
+            'keyframe_every': keyframe_every,
+            'parameters': simulation_parameters(simulation),
+        }).encode()
+        self._file.write(_HEADER.pack(MAGIC, VERSION, len(header)) + header)
+        self._add_frame(np.empty(0, dtype=np.int64), self._shadow.ravel()[:0])
+        simulation.attach(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def closed(self):
+        """
+        True after close.
+        """
+        return self._file is None
+
+    def update(self):
+        """
+        Record the current map of the simulation as the next frame (called by the simulation after tick).
+        """
+        if self._file is None:
+            raise ValueError("recorder is closed.")
+        simulation = self.simulation
+        if simulation.map.shape != self._shadow.shape:
+            raise ValueError("map of the simulation changed its shape.")
+        current = simulation.map.ravel()
+        last = self._shadow.ravel()
+        candidates = simulation._changed_flat
+        if (simulation._revision == self._revision + 1 and candidates is not None
+                and len(candidates) < current.size // 16):
+            candidates = _unique(candidates)
+            changed = candidates[current[candidates] != last[candidates]]
+        else:
+            changed = np.flatnonzero(current != last)
+        self._revision = simulation._revision
+        values = current[changed].astype(last.dtype)
+        last[changed] = values
+        self._add_frame(changed, values)
+
+    def _add_frame(self, changed, values):
+        if self._compressor is None:
+            self._compressor = zlib.compressobj(self.level)
+            keyframe = _narrow(self._shadow.ravel(), _SIGNED)
+            frame = _FRAME.pack(-1, b'-', keyframe.dtype.char.encode()) + keyframe.tobytes()
+        else:
+            # sorted positions are saved as differences, which are small numbers and compress well
+            positions = _narrow(np.diff(changed, prepend=0), _UNSIGNED)
+            values = _narrow(values, _SIGNED)
+            frame = (_FRAME.pack(len(changed), positions.dtype.char.encode(), values.dtype.char.encode())
+                     + positions.tobytes() + values.tobytes())
+        self._pending.append(self._compressor.compress(frame))
+        self._pending_frames += 1
+        self.frames += 1
+        if self._pending_frames == self.keyframe_every:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the frames which are not written yet (they form shorter chunk).
+        """
+        if self._file is None or self._compressor is None:
+            return
+        self._pending.append(self._compressor.flush())
+        data = b''.join(self._pending)
+        first = self.frames - self._pending_frames
+        self._index.append((first, self._pending_frames, self._file.tell()))
+        self._file.write(_CHUNK.pack(first, self._pending_frames, len(data)) + data)
+        self._file.flush()
+        self._pending = []
+        self._pending_frames = 0
+        self._compressor = None
+
+    def close(self):
+        """
+        Write the rest of frames and the index of chunks, close the file and detach from the simulation.
+        """
+        if self._file is None:
+            return
+        self.flush()
+        offset = self._file.tell()
+        self._file.write(np.array(self._index, dtype=np.int64).reshape(-1, 3).tobytes()
+                         + _FOOTER.pack(offset, INDEX_MAGIC))
+        self._file.close()
+        self._file = None
+        self.simulation.detach(self)
+
+
+class Trajectory:
+    """
+    Reader of the file written by TrajectoryRecorder. Only the header and the index of chunks is read
+    when the file is opened, frames are read and decompressed when they are accessed. Reader keeps map
+    of the last accessed frame, so access to the next frames of the same chunk only applies their changes.
+    File without index (recorder was not closed) is read by skipping over the chunks.
+
+    trajectory[t] is map of frame t (numpy array), len(trajectory) is number of frames.
+
+    path - path of the file
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        try:
+            magic, version, length = _HEADER.unpack(self._file.read(_HEADER.size))
+            if magic != MAGIC:
+                raise ValueError("{} is not trajectory file.".format(path))
+            if version != VERSION:
+                raise ValueError("trajectory file version {} is not supported.".format(version))
+            header = json.loads(self._file.read(length).decode())
+            self._index = self._read_index(_HEADER.size + length)
+        except Exception:
+            self._file.close()
+            raise
+        self.shape = tuple(header['shape'])
+        """Shape of the map."""
+        self.dtype = np.dtype(header['dtype'])
+        """Data type of the map."""
+        self.keyframe_every = header['keyframe_every']
+        """Number of frames in one chunk."""
+        self.parameters = header['parameters']
+        """Parameters of the recorded simulation."""
+        self._size = int(np.prod(self.shape))
+        self._cursor = None
+
+    def _read_index(self, start):
+        end = self._file.seek(0, 2)
+        if end - start >= _FOOTER.size:
+            self._file.seek(end - _FOOTER.size)
+            offset, magic = _FOOTER.unpack(self._file.read(_FOOTER.size))
+            if magic == INDEX_MAGIC:
+                self._file.seek(offset)
+                return np.frombuffer(self._file.read(end - _FOOTER.size - offset), dtype=np.int64).reshape(-1, 3)
+        index = []
+        position = start
+        while position + _CHUNK.size <= end:
+            self._file.seek(position)
+            first, frames, length = _CHUNK.unpack(self._file.read(_CHUNK.size))
+            if position + _CHUNK.size + length > end:
+                break
+            index.append((first, frames, position))
+            position += _CHUNK.size + length
+        return np.array(index, dtype=np.int64).reshape(-1, 3)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """
+        Close the file.
+        """
+        self._file.close()
+
+    def __len__(self):
+        if len(self._index) == 0:
+            return 0
+        return int(self._index[-1, 0] + self._index[-1, 1])
+
+    def _frame(self, t):
+        if t < 0:
+            t += len(self)
+        if not 0 <= t < len(self):
+            raise IndexError("frame index out of range")
+        return t
+
+    def _locate(self, t):
+        # chunk number and position of frame in the chunk
+        k = bisect_right(self._index[:, 0], t) - 1
+        return k, t - int(self._index[k, 0])
+
+    def _seek(self, t):
+        # move the cursor to frame t, forward inside one chunk the frames are decompressed one by one
+        k, i = self._locate(t)
+        if self._cursor is None or self._cursor.chunk != k or self._cursor.frame > i:
+            self._cursor = _ChunkCursor(self._file, k, int(self._index[k, 2]), self._size, self.dtype)
+        while self._cursor.frame < i:
+            self._cursor.advance()
+        return self._cursor
+
+    def __getitem__(self, t):
+        return self._seek(self._frame(t)).state.reshape(self.shape).copy()
+
+    def changes(self, t):
+        """
+        Positions (n x 2 array) and new values of the map changed in frame t against frame t - 1.
+        """
+        t = self._frame(t)
+        if self._locate(t)[1] > 0:
+            positions, values = self._seek(t).changes
+        else:
+            # keyframe, it is compared with the previous frame
+            current = self[t].ravel()
+            positions = np.flatnonzero(current != self[t - 1].ravel()) if t > 0 else np.arange(self._size)
+            values = current[positions]
+        return np.column_stack(np.unravel_index(positions, self.shape)), values
+
+    def replay(self, start=0, stop=None):
+        """
+        Generator of (t, map) from frame start to stop - 1, frames are decompressed when they are needed.
+        The map is changed in place by the next frame, copy it to keep the frame.
+        """
+        start = self._frame(start)
+        stop = len(self) if stop is None else min(stop, len(self))
+        for t in range(start, stop):
+            yield t, self._seek(t).state.reshape(self.shape)
+
+
+class _ChunkCursor:
+    """
+    Map of one frame of the chunk, which is decompressed only up to this frame.
+    """
+
+    BLOCK = 1 << 20
+
+    def __init__(self, file, chunk, position, size, dtype):
+        self.chunk = chunk
+        self._file = file
+        self._position = position + _CHUNK.size
+        self._remaining = _CHUNK.unpack(self._read_file(position, _CHUNK.size))[2]
+        self._decompressor = zlib.decompressobj()
+        self._buffer = b''
+        self._offset = 0
+        self._size = size
+        self._dtype = dtype
+        self.frame = -1
+        self.state = None
+        self.changes = None
+        self.advance()
+
+    def _read_file(self, position, length):
+        self._file.seek(position)
+        return self._file.read(length)
+
+    def _take(self, length):
+        # next length bytes of decompressed data
+        while len(self._buffer) - self._offset < length:
+            block = self._read_file(self._position, min(self.BLOCK, self._remaining))
+            self._position += len(block)
+            self._remaining -= len(block)
+            data = self._decompressor.decompress(block)
+            if self._remaining == 0:
+                data += self._decompressor.flush()
+            if not data and self._remaining == 0:
+                raise ValueError("trajectory file is damaged.")
+            self._buffer = self._buffer[self._offset:] + data
+            self._offset = 0
+        taken = self._buffer[self._offset:self._offset + length]
+        self._offset += length
+        return taken
+
+    def _array(self, type_code, count):
+        dtype = np.dtype(type_code.decode())
+        return np.frombuffer(self._take(count * dtype.itemsize), dtype=dtype)
+
+    def advance(self):
+        n, positions_type, values_type = _FRAME.unpack(self._take(_FRAME.size))
+        if n < 0:
+            self.state = self._array(values_type, self._size).astype(self._dtype)
+        else:
+            positions = np.cumsum(self._array(positions_type, n), dtype=np.int64)
+            values = self._array(values_type, n).astype(self._dtype)
+            self.state[positions] = values
+            self.changes = (positions, values)
+        self.frame += 1
+
+
+def _narrow(values, types):
+    # values in the smallest of the integer types which holds them
+    if len(values) == 0:
+        return values.astype(types[0])
+    low, high = values.min(), values.max()
+    for t in types:
+        if np.iinfo(t).min <= low and high <= np.iinfo(t).max:
+            return values.astype(t)
+    return values
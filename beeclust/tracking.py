@@ -0,0 +1,124 @@
+import numpy as np
+from beeclust.beeclustClass import BeeClust, _bees
+from beeclust.fastbee import fast_swarm_labels_uf, fast_track_swarms
+from beeclust.helpers import check_type
+
+
+class SwarmTracker:
+    """
+    Swarms of one BeeClust simulation followed over time, every swarm has persistent id.
+
+    After ticks call update, only the swarms around the positions changed by the simulation
+    (BeeClust.changed_cells) are labelled again, so the work depends on the number of moved bees
+    and the size of swarms they touch, not on the size of map. Stopped bees do not move,
+    so the big swarms of waiting bees are not visited again until some bee joins or leaves them.
+
+    When swarms merge, the new swarm keeps the id of the swarm which had the most bees in it,
+    when swarm splits, the id stays with the biggest part and the other parts get new ids.
+
+    simulation - BeeClust simulation to track
+    """
+
+    def __init__(self, simulation):
+        check_type(simulation, [BeeClust], "simulation")
+        self.simulation = simulation
+        labels, offsets, _ = fast_swarm_labels_uf(simulation.map)
+        self._labels = labels
+        # number of bees of swarms by id, 0 for ids which are not used (anymore)
+        self._sizes = np.zeros(max(1024, 2 * len(offsets)), dtype=np.int64)
+        self._sizes[1:len(offsets)] = np.diff(offsets)
+        self._count = len(offsets) - 1
+        self._next_id = len(offsets)
+        self._revision = simulation._revision
+        self.born = np.arange(1, len(offsets))
+        """Ids of swarms which appeared in the last update (new swarms and split off parts)."""
+        self.died = np.empty(0, dtype=np.int64)
+        """Ids of swarms which disappeared in the last update (merged to other swarm or left by all bees)."""
+
+    @property
+    def labels(self):
+        """
+        Read-only int32 map with swarm id on bees positions and 0 elsewhere.
+        """
+        view = self._labels.view()
+        view.flags.writeable = False
+        return view
+
+    @property
+    def ids(self):
+        """
+        Sorted numpy array of ids of the current swarms.
+        """
+        return np.flatnonzero(self._sizes)
+
+    @property
+    def sizes(self):
+        """
+        Dictionary of swarm ids and numbers of bees in the swarms.
+        """
+        ids = self.ids
+        return dict(zip(ids.tolist(), self._sizes[ids].tolist()))
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, swarm_id):
+        return 0 < swarm_id < self._next_id and self._sizes[swarm_id] > 0
+
+    def size(self, swarm_id):
+        """
+        Number of bees in the swarm with given id (0 for swarm which does not exist).
+        """
+        return int(self._sizes[swarm_id]) if 0 < swarm_id < self._next_id else 0
+
+    def swarm_at(self, row, column):
+        """
+        Id of the swarm on the position, 0 if there is no bee.
+        """
+        return int(self._labels[row, column])
+
+    def positions(self, swarm_id):
+        """
+        Positions of bees of the swarm as n x 2 numpy array (this scans whole map).
+        """
+        return np.argwhere(self._labels == swarm_id)
+
+    def update(self):
+        """
+        Bring the swarms in sync with the simulation. When only one tick or set_cell was done from
+        the last update, only the changed positions are checked, otherwise the positions of bees are compared
+        with the whole map (for example after run).
+        """
+        simulation = self.simulation
+        if simulation._revision == self._revision:
+            self.born = self.died = np.empty(0, dtype=np.int64)
+            return
+        if simulation._revision == self._revision + 1 and simulation._changed_flat is not None:
+            candidates = simulation._changed_flat
+        else:
+            candidates = None
+        self._revision = simulation._revision
+        self._apply(candidates)
+
+    def sync(self):
+        """
+        Bring the swarms in sync after the map of the simulation was changed directly (not by BeeClust methods).
+        Ids of the swarms are kept.
+        """
+        self._revision = self.simulation._revision
+        self._apply(None)
+
+    def _apply(self, candidates):
+        map = self.simulation.map
+        if self._labels.shape != map.shape:
+            raise ValueError("map of the simulation changed its shape, create new tracker.")
+        if candidates is None:
+            candidates = np.flatnonzero(_bees(map.ravel()) != (self._labels.ravel() != 0))
+        if self._next_id + 4 * len(candidates) >= len(self._sizes):
+            grown = np.zeros(max(2 * len(self._sizes), self._next_id + 4 * len(candidates) + 1), dtype=np.int64)
+            grown[:len(self._sizes)] = self._sizes
+            self._sizes = grown
+        self.born, self.died, change = fast_track_swarms(map, self._labels, self._sizes,
+                                                         candidates.astype(np.int64, copy=False), self._next_id)
+        self._next_id += len(self.born)
+        self._count += change
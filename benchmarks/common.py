@@ -0,0 +1,14 @@
+"""
+Helpers shared by the benchmarks.
+"""
+import numpy
+
+
+def random_map(size, bees=.2, walls=.05, sources=.01, seed=0):
+    """
+    Random square map (int8) with densities of bees (in all directions), walls and sources
+    (half of them heaters and half coolers), the same for the same seed.
+    """
+    random = numpy.random.RandomState(seed)
+    p = [1 - bees - walls - sources] + [bees / 4] * 4 + [walls, sources / 2, sources / 2]
+    return random.choice(len(p), size ** 2, p=p).astype(numpy.int8).reshape((size, size))
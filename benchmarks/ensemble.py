@@ -0,0 +1,49 @@
+"""
+Benchmark of the ensemble of replicas against the loop over BeeClust simulations with the same seeds.
+
+Usage: python benchmarks/ensemble.py [size] [replicas] [ticks]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from beeclust import BeeClust, BeeClustEnsemble  # noqa: E402
+from common import random_map  # noqa: E402
+
+
+def measure_loop(arena, replicas, ticks, dtype):
+    simulations = [BeeClust(arena, seed=seed, dtype=dtype) for seed in range(replicas)]
+    start = time.perf_counter()
+    for b in simulations:
+        b.run(ticks)
+    return time.perf_counter() - start
+
+
+def measure_ensemble(arena, replicas, ticks, dtype, threads):
+    e = BeeClustEnsemble(arena, replicas=replicas, seed=list(range(replicas)), threads=threads, dtype=dtype)
+    start = time.perf_counter()
+    e.run(ticks)
+    return time.perf_counter() - start
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    replicas = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    ticks = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+    arena = random_map(size)
+
+    print('map {0}x{0}, {1} replicas, {2} ticks, {3} cpus'.format(size, replicas, ticks, os.cpu_count()))
+    print('{:>6} {:>8} {:>10} {:>8}'.format('dtype', 'threads', 'run [s]', 'speedup'))
+    for dtype in ('int64', 'int8'):
+        loop = measure_loop(arena, replicas, ticks, dtype)
+        print('{:>6} {:>8} {:>10.3f} {:>8.2f}'.format(dtype, 'loop', loop, 1))
+        threads = 1
+        while threads <= max(1, os.cpu_count()):
+            elapsed = measure_ensemble(arena, replicas, ticks, dtype, threads)
+            print('{:>6} {:>8} {:>10.3f} {:>8.2f}'.format(dtype, threads, elapsed, loop / elapsed))
+            threads *= 2
+
+
+if __name__ == '__main__':
+    main()
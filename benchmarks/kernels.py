@@ -0,0 +1,166 @@
+"""
+Benchmark of the simulation kernels (tick, swarms, heatmap, bees and score) over map sizes,
+bee densities and densities of heaters and coolers. Time per cell, time per bee and peak memory
+(traced by tracemalloc) of every kernel are written to JSON file, two files can be compared.
+
+Usage: python benchmarks/kernels.py run [-o results.json] [--sizes 256 1024] [--bees .05 .4]
+                                        [--sources .01] [--kernels tick heat] [--repeat 3]
+       python benchmarks/kernels.py compare old.json new.json [--threshold 1.2]
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from beeclust import BeeClust  # noqa: E402
+from common import random_map  # noqa: E402
+
+SIZES = (256, 512, 1024, 2048)
+BEES = (.05, .2, .4)
+SOURCES = (.001, .01, .1)
+WALLS = .05
+
+
+def _swarms(b):
+    b.swarm_labels()
+
+
+def _score(b):
+    # score counted again from the map, it is kept by ticks otherwise
+    b.sync_bees()
+    return b.score
+
+
+KERNELS = {
+    'tick': (lambda b: b.tick(), 'raster'),
+    'tick_sparse': (lambda b: b.tick(), 'sparse'),
+    'swarms': (_swarms, 'raster'),
+    'heat': (lambda b: b.recalculate_heat(), 'raster'),
+    'bees': (lambda b: b.bees, 'raster'),
+    'score': (_score, 'raster'),
+}
+"""Benchmarked kernels, function called with the simulation and the engine of the simulation"""
+
+
+def measure(kernel, size, bees, sources, repeat=3):
+    function, engine = KERNELS[kernel]
+    b = BeeClust(random_map(size, bees, WALLS, sources), engine=engine, dtype='int8', seed=0)
+    # first call allocates the buffers, which are reused by the next calls
+    function(b)
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(b)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    function(b)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    bee_count = b.bee_count
+    return {
+        'kernel': kernel,
+        'size': size,
+        'bees': bees,
+        'sources': sources,
+        'bee_count': bee_count,
+        'seconds': best,
+        'ns_per_cell': best * 1e9 / size ** 2,
+        'ns_per_bee': best * 1e9 / bee_count if bee_count else None,
+        'peak_bytes': peak,
+    }
+
+
+def run(sizes=SIZES, bees=BEES, sources=SOURCES, kernels=tuple(KERNELS), repeat=3, verbose=False):
+    results = []
+    for size in sizes:
+        for bee_density in bees:
+            for source_density in sources:
+                for kernel in kernels:
+                    result = measure(kernel, size, bee_density, source_density, repeat)
+                    results.append(result)
+                    if verbose:
+                        print('{kernel:>12} {size:>6} {bees:>6} {sources:>6} {seconds:>10.5f} s '
+                              '{ns_per_cell:>8.2f} ns/cell {:>8.2f} ns/bee {peak_bytes:>12} B'.format(
+                                  result['ns_per_bee'] or 0, **result))
+    return {
+        'machine': {
+            'python': platform.python_version(),
+            'numpy': numpy.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def compare(old, new, threshold=1.2):
+    # rows (key, old seconds, new seconds, time ratio, memory ratio) of measurements in both results
+    # and keys of measurements which are slower or need more memory than threshold times
+    def key(result):
+        return result['kernel'], result['size'], result['bees'], result['sources']
+
+    old = {key(result): result for result in old['results']}
+    rows, regressions = [], []
+    for result in new['results']:
+        before = old.get(key(result))
+        if before is None:
+            continue
+        time_ratio = result['seconds'] / before['seconds'] if before['seconds'] else float('inf')
+        memory_ratio = result['peak_bytes'] / before['peak_bytes'] if before['peak_bytes'] else 1.
+        rows.append((key(result), before['seconds'], result['seconds'], time_ratio, memory_ratio))
+        if time_ratio > threshold or memory_ratio > threshold:
+            regressions.append(key(result))
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark of BeeClust kernels.')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    measure_parser = commands.add_parser('run', help='measure kernels and write results to JSON file')
+    measure_parser.add_argument('-o', '--output', default='benchmark.json')
+    measure_parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    measure_parser.add_argument('--bees', type=float, nargs='+', default=BEES)
+    measure_parser.add_argument('--sources', type=float, nargs='+', default=SOURCES)
+    measure_parser.add_argument('--kernels', nargs='+', choices=KERNELS, default=tuple(KERNELS))
+    measure_parser.add_argument('--repeat', type=int, default=3)
+    compare_parser = commands.add_parser('compare', help='compare two result files')
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=1.2,
+                                help='ratio of new and old time or memory reported as regression')
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        results = run(args.sizes, args.bees, args.sources, args.kernels, args.repeat, verbose=True)
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+        return 0
+
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    rows, regressions = compare(old, new, args.threshold)
+    print('{:>12} {:>6} {:>6} {:>6} {:>10} {:>10} {:>7} {:>7}'.format('kernel', 'size', 'bees', 'sources',
+                                                                    'old [s]', 'new [s]', 'time', 'memory'))
+    for (kernel, size, bees, sources), before, after, time_ratio, memory_ratio in rows:
+        print('{:>12} {:>6} {:>6} {:>6} {:>10.5f} {:>10.5f} {:>7.2f} {:>7.2f}{}'.format(
+            kernel, size, bees, sources, before, after, time_ratio, memory_ratio,
+            ' *' if (kernel, size, bees, sources) in regressions else ''))
+    print('{} regressions of {} measurements'.format(len(regressions), len(rows)))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
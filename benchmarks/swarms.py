@@ -0,0 +1,38 @@
+"""
+Comparison of the swarm engines (breadth-first search and union-find labelling).
+
+Usage: python benchmarks/swarms.py [size] [repeat]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from beeclust import BeeClust  # noqa: E402
+from common import random_map  # noqa: E402
+
+
+def measure(arena, engine, repeat):
+    b = BeeClust(arena, swarm_engine=engine)
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        b.swarm_labels()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 2048
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    print('map {0}x{0}, best of {1}'.format(size, repeat))
+    print('{:>8} '.format('bees') + ' '.join('{:>12}'.format(e) for e in BeeClust.SWARM_ENGINES))
+    for bees in (.05, .3, .6):
+        arena = random_map(size, bees, walls=.1, sources=0)
+        times = [measure(arena, engine, repeat) for engine in BeeClust.SWARM_ENGINES]
+        print('{:>8.2f} '.format(bees) + ' '.join('{:>12.4f}'.format(t) for t in times))
+
+
+if __name__ == '__main__':
+    main()
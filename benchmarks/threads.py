@@ -0,0 +1,43 @@
+"""
+Scaling benchmark of the parallel tick and heatmap calculation against the serial kernels.
+
+Usage: python benchmarks/threads.py [size] [ticks]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from beeclust import BeeClust  # noqa: E402
+from common import random_map  # noqa: E402
+
+
+def measure(arena, ticks, threads):
+    b = BeeClust(arena.copy(), seed=0, threads=threads)
+    start = time.perf_counter()
+    b.run(ticks)
+    run = time.perf_counter() - start
+    start = time.perf_counter()
+    b.recalculate_heat()
+    return run, time.perf_counter() - start
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 2048
+    ticks = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    arena = random_map(size, walls=.05, sources=.4)
+
+    serial, serial_heat = measure(arena, ticks, 1)
+    print('map {0}x{0}, {1} ticks, {2} cpus'.format(size, ticks, os.cpu_count()))
+    print('{:>8} {:>10} {:>8} {:>10} {:>8}'.format('threads', 'run [s]', 'speedup', 'heat [s]', 'speedup'))
+    print('{:>8} {:>10.3f} {:>8.2f} {:>10.3f} {:>8.2f}'.format('serial', serial, 1, serial_heat, 1))
+    threads = 2
+    while threads <= max(2, os.cpu_count()):
+        elapsed, heat = measure(arena, ticks, threads)
+        print('{:>8} {:>10.3f} {:>8.2f} {:>10.3f} {:>8.2f}'.format(threads, elapsed, serial / elapsed,
+                                                                 heat, serial_heat / heat))
+        threads *= 2
+
+
+if __name__ == '__main__':
+    main()
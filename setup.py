@@ -1,7 +1,16 @@
 from setuptools import setup
 from Cython.Build import cythonize
-from setuptools import setup, find_packages
+from setuptools import setup, find_packages, Extension
 import numpy
+import sys
+
+# OpenMP for parallel tick, without it the parallel loops run in one thread
+if sys.platform == 'win32':
+    openmp_compile, openmp_link = ['/openmp'], []
+elif sys.platform == 'darwin':
+    openmp_compile, openmp_link = [], []
+else:
+    openmp_compile, openmp_link = ['-fopenmp'], ['-fopenmp']
 
 with open('README.rst') as f:
     long_description = ''.join(f.readlines())
@@ -17,7 +26,10 @@ setup(
     keywords='Beeclust, clustering',
     url='https://github.com/martilad/beeclust',
     packages=find_packages(),
-    ext_modules=cythonize('beeclust/fastbee.pyx', language_level=3),
+    ext_modules=cythonize([Extension('beeclust.fastbee', ['beeclust/fastbee.pyx'],
+                                     extra_compile_args=openmp_compile,
+                                     extra_link_args=openmp_link)],
+                          language_level=3),
     include_dirs=[numpy.get_include()],
     install_requires=[
         'NumPy',
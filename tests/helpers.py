@@ -9,3 +9,10 @@ def zeros8(*args, **kwargs):
 def full8(*args, **kwargs):
     kwargs.setdefault('dtype', numpy.int8)
     return numpy.full(*args, **kwargs)
+
+
+def random_map(size, seed, bees=.2, walls=.1, sources=.1):
+    """Square map with bees in all directions and half of sources heaters, half coolers"""
+    numpy.random.seed(seed)
+    p = [1 - bees - walls - sources] + [bees / 4] * 4 + [walls, sources / 2, sources / 2]
+    return numpy.random.choice(len(p), size ** 2, p=p).reshape((size, size))
@@ -1,4 +1,7 @@
 from collections import abc
+import numpy
+import pytest
+import tracemalloc
 from helpers import zeros8
 from beeclust import BeeClust
 
@@ -53,3 +56,42 @@ def test_forget_is_callable():
 def test_recalculate_heat_is_callable():
     b = BeeClust(zeros8((2, 2)))
     b.recalculate_heat()
+
+
+def test_map_assignment_is_converted_once():
+    b = BeeClust(zeros8((2, 2)))
+    b.map = zeros8((3, 5))
+    assert b.map.shape == (3, 5)
+    assert b.map.dtype == numpy.int64
+    assert b.map.flags['C_CONTIGUOUS']
+
+
+def test_hot_methods_keep_map_buffer():
+    simple_map = zeros8((4, 6))
+    simple_map[1, 3] = 1
+    b = BeeClust(simple_map)
+    original = b.map
+    b.tick()
+    b.run(3)
+    b.swarms
+    b.recalculate_heat()
+    b.forget()
+    assert b.map is original
+
+
+@pytest.mark.parametrize('engine, threads', [('raster', 1), ('sparse', 1), ('raster', 2)])
+def test_ticks_reuse_buffers(engine, threads):
+    numpy.random.seed(3)
+    b = BeeClust(numpy.random.choice(8, 200 * 200).reshape((200, 200)), engine=engine, threads=threads)
+    b.tick()
+    b.run(2)
+    tracemalloc.start()
+    try:
+        for _ in range(5):
+            b.tick()
+        b.run(5)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    # map has 40000 positions, buffer of the map size would be at least 40 kB
+    assert peak < 20000
@@ -0,0 +1,80 @@
+import csv
+import os
+import subprocess
+import sys
+
+import numpy
+import pytest
+
+from helpers import random_map
+from beeclust import BeeClust
+from beeclust.batch import configurations, run_batch, save_results, simulate, COLUMNS
+from beeclust.io import save_map
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_configurations_are_all_combinations():
+    c = configurations([1, 2], {'k_stay': [10, 20], 'engine': ['raster', 'sparse']})
+    assert len(c) == 8
+    assert c[0] == {'k_stay': 10, 'engine': 'raster', 'seed': 1}
+    assert c[-1] == {'k_stay': 20, 'engine': 'sparse', 'seed': 2}
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_runs_are_same_as_simulations(tmp_path, workers):
+    path = tmp_path / 'map.bcm'
+    save_map(path, random_map(20, 7), {'T_env': 20})
+    columns = run_batch(path, configurations([3, 4], {'k_stay': [10, 30]}), 50, every=20, workers=workers)
+    assert list(columns['k_stay']) == [10, 10, 30, 30]
+    assert list(columns['seed']) == [3, 4, 3, 4]
+    assert columns['moved_per_tick'].shape == (4, 50)
+    assert columns['score_samples'].shape == (4, 3)
+    for i in range(4):
+        b = BeeClust(random_map(20, 7), T_env=20, k_stay=int(columns['k_stay'][i]), seed=int(columns['seed'][i]))
+        moved = b.run(50)
+        assert (columns['moved_per_tick'][i] == moved).all()
+        assert columns['score'][i] == pytest.approx(b.score)
+        assert columns['bees'][i] == b.bee_count
+        assert columns['swarms'][i] == len(b.swarms)
+        assert columns['largest_swarm'][i] == max(map(len, b.swarms))
+
+
+def test_run_stops_on_condition(tmp_path):
+    path = tmp_path / 'map.txt'
+    numpy.savetxt(path, random_map(20, 7), fmt='%d')
+    statistics, moved, scores = simulate(path, {'seed': 1}, 100, every=10, stop_moved=1000)
+    assert statistics['ticks'] == len(moved) == 10
+    assert len(scores) == 1
+    statistics, moved, scores = simulate(path, {'seed': 1}, 100, every=10)
+    assert statistics['ticks'] == 100
+    assert len(scores) == 10
+
+
+def test_results_are_saved_as_columns(tmp_path):
+    path = tmp_path / 'map.bcm'
+    save_map(path, random_map(20, 7))
+    columns = run_batch(path, configurations([1, 2, 3], {'engine': ['sparse']}), 30, stop_score=0, workers=1)
+    assert list(columns['ticks']) == [30, 30, 30]
+    save_results(tmp_path / 'out.csv', columns)
+    with open(tmp_path / 'out.csv') as file:
+        rows = list(csv.DictReader(file))
+    assert list(rows[0]) == ['engine'] + list(COLUMNS)
+    assert [row['seed'] for row in rows] == ['1', '2', '3']
+    save_results(tmp_path / 'out.npz', columns)
+    with numpy.load(tmp_path / 'out.npz') as loaded:
+        assert (loaded['moved_per_tick'] == columns['moved_per_tick']).all()
+
+
+def test_command_does_not_import_qt(tmp_path):
+    path = tmp_path / 'map.bcm'
+    save_map(path, random_map(20, 7))
+    output = tmp_path / 'out.npz'
+    code = ("import runpy, sys; sys.argv = sys.argv[:1] + sys.argv[2:]; "
+            "runpy.run_module('beeclust', run_name='__main__', alter_sys=True); "
+            "assert not any(name.startswith('PyQt5') for name in sys.modules)")
+    subprocess.run([sys.executable, '-c', code, 'beeclust', 'run', str(path), '-o', str(output), '-t', '20',
+                    '-n', '2', '-p', 'k_stay=10,20', '-j', '2'], cwd=ROOT, check=True)
+    with numpy.load(output) as loaded:
+        assert list(loaded['k_stay']) == [10, 10, 20, 20]
+        assert loaded['moved_per_tick'].shape == (4, 20)
@@ -56,3 +56,30 @@ def test_bees_change_after_tick():
     b.tick()
     assert len(b.bees) == 1
     assert sbt(b.bees)[0] != (1, 0)
+
+
+def test_bees_is_array_of_positions():
+    simple_map = zeros8((3, 3))
+    simple_map[2, 1] = -4
+    simple_map[0, 2] = 3
+    b = BeeClust(simple_map)
+    assert b.bees.shape == (2, 2)
+    assert b.bees.tolist() == [[0, 2], [2, 1]]
+
+
+def test_bee_count_follows_changes():
+    simple_map = zeros8((4, 4))
+    simple_map[1, 1] = 2
+    simple_map[2, 3] = -3
+    b = BeeClust(simple_map)
+    assert b.bee_count == 2
+    b.run(5)
+    assert b.bee_count == 2
+    row, column = (int(x) for x in numpy.argwhere(b.map == 0)[0])
+    b.set_cell(row, column, 1)
+    assert b.bee_count == 3
+    b.set_cell(row, column, 5)
+    assert b.bee_count == 2
+    b.map[tuple(numpy.argwhere(b.map == 0)[0])] = -1
+    b.sync_bees()
+    assert b.bee_count == 3
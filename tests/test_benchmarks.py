@@ -0,0 +1,24 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+import kernels  # noqa: E402
+
+
+def test_benchmark_results_are_written_and_compared(tmp_path):
+    path = tmp_path / 'results.json'
+    assert kernels.main(['run', '-o', str(path), '--sizes', '32', '64', '--bees', '.2', '--sources', '.01',
+                         '--repeat', '1']) == 0
+    with open(path) as f:
+        results = json.load(f)
+    assert len(results['results']) == 2 * len(kernels.KERNELS)
+    for result in results['results']:
+        assert result['seconds'] >= 0
+        assert result['ns_per_cell'] == result['seconds'] * 1e9 / result['size'] ** 2
+        assert result['bee_count'] > 0 and result['peak_bytes'] >= 0
+    assert kernels.main(['compare', str(path), str(path)]) == 0
+
+    slower = dict(results, results=[dict(r, seconds=r['seconds'] * 2 + 1) for r in results['results']])
+    rows, regressions = kernels.compare(results, slower)
+    assert len(rows) == len(regressions) == len(results['results'])
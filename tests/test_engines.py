@@ -0,0 +1,144 @@
+import numpy
+import pytest
+
+from helpers import zeros8, random_map
+from beeclust import BeeClust
+
+
+def sbt(bees):
+    """Sanitize bees types"""
+    return sorted(tuple(b) for b in bees)
+
+
+def test_unknown_engine_raises_ValueError():
+    with pytest.raises(ValueError) as excinfo:
+        BeeClust(zeros8((2, 2)), engine='magic')
+    assert 'engine' in str(excinfo.value)
+
+
+def test_sparse_bee_goes_right():
+    simple_map = zeros8((3, 3))
+    simple_map[1, 1] = 2
+    b = BeeClust(simple_map, p_changedir=0, engine='sparse')
+    assert b.tick() == 1
+    assert b.map[1, 2] == 2
+    assert b.map.sum() == 2
+
+
+def test_sparse_two_bees_move_both():
+    b = BeeClust(numpy.array([[0, 0, 0], [1, 0, 1]]), p_changedir=0, engine='sparse')
+    assert b.tick() == 2
+    assert (b.map == [[1, 0, 1], [0, 0, 0]]).all()
+
+
+def test_sparse_bee_hits_bee_waits():
+    b = BeeClust(numpy.array([[0, 0, 2, 4, 0, 0]]), p_changedir=0, p_meet=1, engine='sparse')
+    assert b.tick() == 0
+    assert (b.map == [[0, 0, -3, -3, 0, 0]]).all()
+
+
+def test_sparse_keeps_bees_in_sync():
+    numpy.random.seed(42)
+    p = [.8, .04, .04, .04, .04, .02, .01, .01]
+    simple_map = numpy.random.choice(len(p), 64 * 64, p=p).reshape((64, 64))
+    b = BeeClust(simple_map, engine='sparse')
+    bees = sbt(b.bees)
+    for _ in range(50):
+        b.tick()
+        assert len(b.bees) == len(bees)
+        assert sbt(b._bee_positions) == sbt(b.bees)
+
+
+def test_sparse_sync_after_map_change():
+    b = BeeClust(zeros8((1, 4)), p_changedir=0, engine='sparse')
+    assert b.tick() == 0
+    b.map[0, 0] = 2
+    b.sync_bees()
+    assert b.tick() == 1
+    assert b.map[0, 1] == 2
+
+
+def test_sparse_run():
+    b = BeeClust(numpy.array([[2, 0, 0, 0, 0, 0, 0, 0, 0, 0]]), p_changedir=0, engine='sparse')
+    moved = b.run(12)
+    assert list(moved[:9]) == [1] * 9
+    assert moved[9] == 0
+    assert sbt(b._bee_positions) == sbt(b.bees)
+
+
+def test_threads_with_sparse_raises_ValueError():
+    with pytest.raises(ValueError) as excinfo:
+        BeeClust(zeros8((2, 2)), engine='sparse', threads=2)
+    assert 'threads' in str(excinfo.value)
+
+
+def test_parallel_two_bees_move_both():
+    b = BeeClust(numpy.array([[0, 0, 0], [0, 0, 0], [0, 0, 0], [1, 0, 1]]), p_changedir=0, threads=2)
+    assert b.tick() == 2
+    assert (b.map == [[0, 0, 0], [0, 0, 0], [1, 0, 1], [0, 0, 0]]).all()
+
+
+def test_parallel_keeps_bees_and_geometry():
+    original = random_map(64, 3)
+    b = BeeClust(original.copy(), threads=4)
+    for _ in range(30):
+        b.tick()
+    assert len(b.bees) == len(BeeClust(original).bees)
+    assert ((b.map >= 5) == (original >= 5)).all()
+
+
+@pytest.mark.parametrize('threads', [1, 4])
+def test_parallel_does_not_depend_on_threads(threads):
+    b = BeeClust(random_map(64, 3), seed=9, threads=2)
+    c = BeeClust(random_map(64, 3), seed=9, threads=threads)
+    assert [b.tick() for _ in range(10)] == [c.tick() for _ in range(10)]
+    assert list(b.run(10)) == list(c.run(10))
+    assert (b.map == c.map).all()
+
+
+@pytest.mark.parametrize('dtype', ['int8', 'int16'])
+@pytest.mark.parametrize('engine, threads', [('raster', 1), ('sparse', 1), ('raster', 3)])
+def test_small_dtype_gives_same_results(dtype, engine, threads):
+    wide = BeeClust(random_map(40, 7), engine=engine, threads=threads, seed=11)
+    small = BeeClust(random_map(40, 7), engine=engine, threads=threads, seed=11, dtype=dtype)
+    assert small.map.dtype == dtype
+    for _ in range(20):
+        assert small.tick() == wide.tick()
+        assert (small.map == wide.map).all()
+    assert (small.run(20) == wide.run(20)).all()
+    assert (small.map == wide.map).all()
+    assert small.score == wide.score
+    assert small.swarms == wide.swarms
+    small.set_cell(0, 0, 5)
+    wide.set_cell(0, 0, 5)
+    assert (small.heatmap == wide.heatmap).all()
+
+
+def test_dtype_limits_wait_time():
+    with pytest.raises(ValueError):
+        BeeClust(zeros8((2, 2)), dtype='int32')
+    with pytest.raises(ValueError):
+        BeeClust(zeros8((2, 2)), k_stay=200, dtype='int8')
+    b = BeeClust(zeros8((2, 2)), k_stay=100, dtype='int8')
+    b.k_stay = 1000
+    with pytest.raises(ValueError):
+        b.tick()
+    with pytest.raises(ValueError):
+        b.set_cell(0, 0, -200)
+    with pytest.raises(ValueError):
+        b.map = numpy.full((2, 2), -200)
+
+
+@pytest.mark.parametrize('threads', [1, 3])
+def test_done_marks_overflow_gives_same_results(threads):
+    reference = BeeClust(random_map(40, 7), threads=threads, seed=12)
+    b = BeeClust(random_map(40, 7), threads=threads, seed=12)
+    b.tick()
+    reference.tick()
+    b._workspace.get('stamp', 1, numpy.uint32)[0] = numpy.iinfo(numpy.uint32).max - 2
+    for _ in range(5):
+        assert b.tick() == reference.tick()
+        assert (b.map == reference.map).all()
+    b._workspace.get('stamp', 1, numpy.uint32)[0] = numpy.iinfo(numpy.uint32).max - 2
+    assert (b.run(5) == reference.run(5)).all()
+    assert (b.map == reference.map).all()
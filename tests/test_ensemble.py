@@ -0,0 +1,72 @@
+import math
+import numpy
+import pytest
+
+from helpers import zeros8, random_map
+from beeclust import BeeClust, BeeClustEnsemble
+
+
+def test_replicas_from_2d_map():
+    e = BeeClustEnsemble(random_map(24, 11), replicas=5)
+    assert len(e) == 5
+    assert e.maps.shape == (5, 24, 24)
+    assert e.heatmap.shape == (24, 24)
+
+
+def test_run_returns_moved_for_each_replica():
+    e = BeeClustEnsemble(random_map(24, 11), replicas=3)
+    moved = e.run(10)
+    assert moved.shape == (10, 3)
+    assert e.tick().shape == (3,)
+    assert e.scores.shape == (3,)
+
+
+def test_replica_is_same_as_beeclust_with_seed():
+    seeds = [1, 2, 3]
+    e = BeeClustEnsemble(random_map(24, 11), replicas=3, seed=seeds)
+    moved = e.run(20)
+    for i, seed in enumerate(seeds):
+        b = BeeClust(random_map(24, 11), seed=seed)
+        assert list(moved[:, i]) == list(b.run(20))
+        assert (e.maps[i] == b.map).all()
+        assert math.isclose(e.scores[i], b.score)
+        assert e.bee_counts[i] == len(b.bees)
+
+
+def test_replicas_are_independent():
+    e = BeeClustEnsemble(random_map(24, 11), replicas=2, seed=5)
+    e.run(20)
+    assert (e.maps[0] != e.maps[1]).any()
+
+
+def test_different_geometry_raises_ValueError():
+    maps = numpy.stack([zeros8((3, 3)), zeros8((3, 3))])
+    maps[1, 1, 1] = 5
+    with pytest.raises(ValueError) as excinfo:
+        BeeClustEnsemble(maps)
+    assert 'geometry' in str(excinfo.value)
+
+
+def test_seed_list_length_raises_ValueError():
+    with pytest.raises(ValueError):
+        BeeClustEnsemble(zeros8((3, 3)), replicas=2, seed=[1])
+
+
+@pytest.mark.parametrize('dtype', ['int8', 'int16'])
+@pytest.mark.parametrize('threads', [1, 3])
+def test_narrow_and_parallel_replicas_are_same(dtype, threads):
+    e = BeeClustEnsemble(random_map(24, 11), replicas=4, seed=[1, 2, 3, 4])
+    moved = e.run(20)
+    narrow = BeeClustEnsemble(random_map(24, 11), replicas=4, seed=[1, 2, 3, 4], threads=threads, dtype=dtype)
+    assert narrow.maps.dtype == dtype
+    assert (narrow.run(20) == moved).all()
+    assert (narrow.maps == e.maps).all()
+
+
+def test_long_wait_in_narrow_maps_raises_ValueError():
+    with pytest.raises(ValueError):
+        BeeClustEnsemble(zeros8((3, 3)), replicas=2, k_stay=200, dtype='int8')
+    e = BeeClustEnsemble(zeros8((3, 3)), replicas=2, dtype='int8')
+    e.k_stay = 200
+    with pytest.raises(ValueError):
+        e.run(1)
@@ -0,0 +1,181 @@
+import os
+import time
+
+import numpy
+import pytest
+
+from helpers import zeros8, random_map
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+QtWidgets = pytest.importorskip('PyQt5.QtWidgets')
+from PyQt5 import QtCore, QtGui  # noqa: E402
+from beeclust import BeeClust  # noqa: E402
+from beeclust.beeclustClass import MapConst  # noqa: E402
+from beeclust.gui import App, GridWidget, PICTURES, heat_colors, merge_cells  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def app():
+    return QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+def cells_of(rects):
+    return {(r + i, c + j) for r, c, rows, columns in rects.tolist() for i in range(rows) for j in range(columns)}
+
+
+def cell_color(value, temp, T_env, T_cooler, T_heater, n_colors=9, color_steps=510):
+    # color of one position as it was computed before heat_colors
+    def split(temp, base, minus):
+        split = (int((temp - minus) / ((base - minus) / n_colors)) + 1) * (color_steps / (n_colors + 1))
+        return min(255, int(split)), max(0, int(split) - 255)
+
+    if value == MapConst.HEATER:
+        return 255, 0, 0
+    if value == MapConst.COOLER:
+        return 0, 0, 255
+    if value == MapConst.WALL:
+        return 100, 100, 100
+    if temp == T_env:
+        return 0, 255, 0
+    if temp < T_env:
+        add, remove = split(temp, T_env, T_cooler)
+        return 0, add, 255 - remove
+    add, remove = split(temp, T_heater, T_env)
+    return add, 255 - remove, 0
+
+
+def test_heat_colors_are_same_as_colors_of_positions():
+    b = BeeClust(random_map(40, 4, sources=.02), T_env=22, T_cooler=5, T_heater=40)
+    map, heatmap = b.map, b.heatmap.copy()
+    # positions with zero heat from sources have exactly the environment temperature
+    corner = numpy.zeros(map.shape, dtype=bool)
+    corner[:5, :5] = True
+    heatmap[corner & (map < MapConst.WALL)] = b.T_env
+    assert (heatmap[map == MapConst.WALL] == 9999999).all()
+    colors = heat_colors(map, heatmap, b.T_env, b.T_cooler, b.T_heater)
+    for (row, column), value in numpy.ndenumerate(map):
+        assert tuple(colors[row, column]) == cell_color(value, heatmap[row, column], b.T_env, b.T_cooler,
+                                                        b.T_heater), (row, column)
+
+
+def test_merge_cells_to_rectangles():
+    cells = numpy.array([[0, 1], [0, 2], [0, 3], [1, 1], [1, 2], [1, 3], [1, 7], [4, 0], [5, 0]])
+    rects = merge_cells(cells)
+    assert sorted(rects.tolist()) == [[0, 1, 2, 3], [1, 7, 1, 1], [4, 0, 2, 1]]
+    assert merge_cells(numpy.empty((0, 2))).shape == (0, 4)
+
+
+def test_merged_rectangles_cover_exactly_the_cells():
+    numpy.random.seed(3)
+    mask = numpy.random.random((40, 40)) < .3
+    cells = numpy.argwhere(mask)
+    rects = merge_cells(cells)
+    assert cells_of(rects) == {tuple(cell) for cell in cells.tolist()}
+    assert sum(rows * columns for _, _, rows, columns in rects.tolist()) == len(cells)
+
+
+def test_dirty_region_covers_changed_cells(app):
+    grid = GridWidget(BeeClust(zeros8((50, 50))), {})
+    grid.CELL_SIZE = 10
+    region = grid.dirty_region(numpy.array([[0, 0], [49, 48], [49, 49]]))
+    assert region.rects() == [QtCore.QRect(0, 0, 10, 10), QtCore.QRect(480, 490, 20, 10)]
+    assert grid.dirty_region(None) is None
+    grid.MAX_DIRTY_RECTS = 1
+    assert grid.dirty_region(numpy.array([[0, 0], [2, 2]])) is None
+
+
+def test_only_dirty_rectangles_are_drawn(app, monkeypatch):
+    grid = GridWidget(BeeClust(zeros8((50, 50))), {})
+    grid.CELL_SIZE = 4
+    grid.recalculate_sizes(50, 50)
+    drawn = []
+    monkeypatch.setattr(grid, 'draw_colors', lambda painter, rows, columns, bees: drawn.append((rows, columns)))
+    pixmap = QtGui.QPixmap(grid.size())
+    grid.render(pixmap, QtCore.QPoint(), grid.dirty_region(numpy.array([[0, 0], [49, 48], [49, 49]])))
+    assert sorted(drawn, key=lambda d: d[0].start) == [(range(0, 1), range(0, 1)), (range(49, 50), range(48, 50))]
+
+
+def wait_for(app, condition, timeout=10):
+    end = time.perf_counter() + timeout
+    while not condition() and time.perf_counter() < end:
+        app.processEvents()
+        time.sleep(.001)
+    return condition()
+
+
+def test_play_runs_simulation_in_thread(app):
+    b = BeeClust(random_map(64, 1), seed=1)
+    original = b.map.copy()
+    grid = GridWidget(b, {})
+    grid.play()
+    assert grid.playing
+    assert wait_for(app, lambda: grid.worker.ticks > 0 and (grid.snapshot != original).any())
+    grid.pause()
+    assert not grid.playing
+    assert grid.snapshot is None
+    assert (b.map != original).any()
+    assert b.bee_count == numpy.count_nonzero((original < 0) | ((original >= 1) & (original <= 4)))
+    assert grid.worker.lock.acquire(blocking=False)
+    grid.worker.lock.release()
+
+
+def test_error_in_thread_is_reported(app, monkeypatch):
+    b = BeeClust(random_map(16, 1))
+    grid = GridWidget(b, {})
+    errors = []
+    grid.worker.failed.connect(errors.append)
+
+    def broken(*args):
+        raise RuntimeError('broken')
+
+    monkeypatch.setattr(b, 'run', broken)
+    grid.play()
+    assert wait_for(app, lambda: errors and not grid.playing)
+    assert errors == ['broken']
+    grid.pause()
+
+
+def test_long_wait_widens_narrow_map(app, monkeypatch):
+    b = BeeClust(random_map(16, 1), dtype='int8', seed=1)
+    original = b.map.copy()
+    gui = App.__new__(App)
+    gui.window, gui.bee_clust, gui.grid = None, b, GridWidget(b, {})
+
+    def accept(dialog):
+        dialog.findChild(QtWidgets.QDoubleSpinBox, 'k_stay').setValue(1000)
+        return QtWidgets.QDialog.Accepted
+
+    monkeypatch.setattr(QtWidgets.QDialog, 'exec', accept)
+    gui.change_dialog()
+    assert b.k_stay == 1000
+    assert b.dtype == numpy.int16
+    assert (b.map == original).all()
+    b.run(20)
+    assert b.map.min() < numpy.iinfo(numpy.int8).min
+
+
+def test_sprites_are_rasterized_once_for_cell_size(app, monkeypatch):
+    b = BeeClust(random_map(8, 1), seed=1)
+    grid = GridWidget(b, {name: App.create_as_qt_svg(name + '.svg') for name in PICTURES})
+    rasterized = []
+    rasterize = grid.rasterize
+
+    def counted(image):
+        rasterized.append(grid.CELL_SIZE)
+        return rasterize(image)
+
+    monkeypatch.setattr(grid, 'rasterize', counted)
+    pixmap = QtGui.QPixmap(grid.size())
+    for _ in range(3):
+        grid.render(pixmap)
+    assert rasterized == [40] * len(PICTURES)
+
+    monkeypatch.setattr(QtGui.QGuiApplication, 'keyboardModifiers', lambda: QtCore.Qt.ControlModifier)
+    grid.wheelEvent(QtGui.QWheelEvent(QtCore.QPointF(), QtCore.QPointF(), QtCore.QPoint(), QtCore.QPoint(0, 120),
+                                      QtCore.Qt.NoButton, QtCore.Qt.ControlModifier, QtCore.Qt.NoScrollPhase, False))
+    assert grid.CELL_SIZE == 43
+    pixmap = QtGui.QPixmap(grid.size())
+    for _ in range(3):
+        grid.render(pixmap)
+    assert rasterized == [40] * len(PICTURES) + [43] * len(PICTURES)
+    assert all(sprite.width() == sprite.height() == 43 for sprite in grid.sprites().values())
@@ -188,3 +188,153 @@ def test_score_changes():
     score = b.score
     b.tick()
     assert b.score < score
+
+
+def test_set_cell_bee_keeps_heatmap():
+    simple_map = zeros8((3, 3))
+    simple_map[1, 1] = HEATER
+    b = BeeClust(simple_map)
+    heatmap = b.heatmap
+    b.set_cell(0, 0, 3)
+    assert b.heatmap is heatmap
+    assert b.map[0, 0] == 3
+    assert math.isclose(b.heatmap[0, 0], 38.2)
+
+
+def test_set_cell_heater_updates_heatmap():
+    b = BeeClust(zeros8((3, 3)))
+    b.set_cell(1, 1, HEATER)
+    assert b.heatmap[1, 1] == T_HEATER
+    assert math.isclose(b.heatmap[0, 0], 38.2)
+    b.set_cell(1, 1, 0)
+    assert numpy.isclose(b.heatmap, T_ENV).all()
+
+
+def test_set_cell_wall_stops_heat():
+    simple_map = zeros8((3, 3))
+    simple_map[:, 2] = HEATER
+    b = BeeClust(simple_map)
+    assert b.heatmap[0, 0] > T_ENV
+    b.set_cells([0, 1, 2], [1, 1, 1], WALL)
+    assert math.isclose(b.heatmap[0, 0], T_ENV)
+    assert math.isclose(b.heatmap[2, 0], T_ENV)
+
+
+def test_incremental_heatmap_is_same_as_recalculated():
+    numpy.random.seed(5)
+    p = [.7, .04, .04, .04, .04, .08, .03, .03]
+    simple_map = numpy.random.choice(len(p), 40 * 40, p=p).reshape((40, 40))
+    b = BeeClust(simple_map)
+    for _ in range(300):
+        row, column = numpy.random.randint(40, size=2)
+        b.set_cell(row, column, numpy.random.choice([0, 1, -3, WALL, HEATER, COOLER]))
+        expected = BeeClust(b.map.copy())
+        assert numpy.isclose(b.heatmap, expected.heatmap).all()
+
+
+def test_set_cells_many_recalculates():
+    b = BeeClust(zeros8((20, 20)))
+    b.set_cells(numpy.arange(20), 0, HEATER)
+    assert (b.heatmap[:, 0] == T_HEATER).all()
+    assert math.isclose(b.heatmap[0, 1], 38.2)
+
+
+def test_update_heat_after_temperature_change():
+    simple_map = zeros8((4, 4))
+    simple_map[0, -1] = HEATER
+    simple_map[-1, 0] = COOLER
+    b = BeeClust(simple_map)
+    b.T_cooler, b.T_env, b.T_heater = -20, 0, 20
+    b.update_heat()
+    assert math.isclose(b.heatmap[0, -1], 20)
+    assert math.isclose(b.heatmap[-1, 0], -20)
+    assert math.isclose(b.heatmap[1, -2], 9)
+    b.k_temp = .8
+    b.update_heat()
+    assert math.isclose(b.heatmap[-2, 1], -8)
+
+
+def test_update_heat_is_same_as_recalculated():
+    numpy.random.seed(6)
+    p = [.7, .04, .04, .04, .04, .08, .03, .03]
+    b = BeeClust(numpy.random.choice(len(p), 30 * 30, p=p).reshape((30, 30)))
+    b.T_heater, b.T_cooler, b.k_temp = 60, -5, 0.5
+    b.update_heat()
+    assert (b.heatmap == BeeClust(b.map, T_heater=60, T_cooler=-5, k_temp=0.5).heatmap).all()
+
+
+def test_update_heat_after_new_map():
+    b = BeeClust(zeros8((3, 3)))
+    b.map = full8((2, 2), HEATER)
+    b.update_heat()
+    assert numpy.isclose(b.heatmap, T_HEATER).all()
+
+
+def test_heatmap_for_does_not_change_simulation():
+    simple_map = zeros8((3, 3))
+    simple_map[1, 1] = HEATER
+    b = BeeClust(simple_map)
+    heatmaps = [b.heatmap_for(T_heater=t) for t in (40, 58)]
+    assert math.isclose(heatmaps[0][0, 0], 38.2)
+    assert math.isclose(heatmaps[1][0, 0], 22 + 0.9 * 36)
+    assert math.isclose(b.heatmap[0, 0], 38.2)
+
+
+def brute_score(b):
+    bees = (b.map < 0) | ((1 <= b.map) & (b.map <= 4))
+    return b.heatmap[bees].mean()
+
+
+def test_score_follows_ticks_and_set_cell():
+    numpy.random.seed(8)
+    p = [.4, .1, .1, .1, .1, .1, .05, .05]
+    b = BeeClust(numpy.random.choice(len(p), 20 * 20, p=p).reshape((20, 20)), seed=8)
+    for _ in range(20):
+        b.tick()
+        assert math.isclose(b.score, brute_score(b))
+    b.run(20)
+    assert math.isclose(b.score, brute_score(b))
+    # heater next to bees changes temperature of them too
+    b.set_cell(10, 10, HEATER)
+    b.set_cell(3, 3, WALL)
+    assert math.isclose(b.score, brute_score(b))
+    b.T_heater = 60
+    b.update_heat()
+    assert math.isclose(b.score, brute_score(b))
+
+
+def maze(size):
+    # one long corridor, walls in odd rows have a gap at alternating ends
+    simple_map = zeros8((size, size))
+    for row in range(1, size, 2):
+        simple_map[row, :] = WALL
+        simple_map[row, -1 if row % 4 == 1 else 0] = 0
+    return simple_map
+
+
+def test_long_distances_in_maze():
+    simple_map = maze(400)
+    simple_map[0, 0] = HEATER
+    simple_map[-1, -1] = HEATER
+    b = BeeClust(simple_map)
+    # the longest distance is half of the corridor
+    assert b._dist_heater.dtype == numpy.uint16
+    # the heat must go through the whole corridor now, distances do not fit to uint16
+    b.set_cell(399, 399, 0)
+    assert b._dist_heater.dtype == numpy.uint32
+    assert b._dist_heater[398, 0] == 79800
+    expected = BeeClust(b.map.copy())
+    assert (b.heatmap == expected.heatmap).all()
+    assert math.isclose(b.heatmap[398, 0], T_ENV + 0.9 * (T_HEATER - T_ENV) / 79800)
+
+
+def test_heatmap_by_threads_is_same():
+    numpy.random.seed(9)
+    p = [.6, .04, .04, .04, .04, .14, .05, .05]
+    simple_map = numpy.random.choice(len(p), 50 * 60, p=p).reshape((50, 60))
+    b = BeeClust(simple_map, threads=3)
+    expected = BeeClust(simple_map.copy())
+    assert (b.heatmap == expected.heatmap).all()
+    b.set_cell(3, 4, HEATER)
+    expected.set_cell(3, 4, HEATER)
+    assert (b.heatmap == expected.heatmap).all()
@@ -0,0 +1,98 @@
+import numpy
+import pytest
+
+from helpers import zeros8, random_map
+from beeclust import BeeClust
+from beeclust.io import save_map, load_map, read_header, load_text, convert_text, is_map_file
+
+
+def test_map_is_saved_as_int8_and_memory_mapped(tmp_path):
+    path = tmp_path / 'map.bcm'
+    map = random_map(30, 5, bees=.4)
+    save_map(path, map, {'T_env': 20})
+    assert is_map_file(path)
+    header = read_header(path)
+    assert header['shape'] == map.shape
+    assert header['dtype'] == numpy.int8
+    assert header['offset'] % 64 == 0
+    assert path.stat().st_size == header['offset'] + map.size
+    loaded, parameters = load_map(path)
+    assert isinstance(loaded, numpy.memmap)
+    assert (loaded == map).all()
+    assert parameters == {'T_env': 20}
+    loaded[0, 0] = 7
+    assert (load_map(path, mode=None)[0] == map).all()
+
+
+def test_wide_values_are_kept(tmp_path):
+    path = tmp_path / 'map.bcm'
+    map = zeros8((3, 4)).astype(numpy.int64)
+    map[1, 2] = -1000
+    save_map(path, map)
+    assert read_header(path)['dtype'] == numpy.int16
+    assert (load_map(path)[0] == map).all()
+
+
+def test_simulation_to_file_and_from_file(tmp_path):
+    path = tmp_path / 'map.bcm'
+    b = BeeClust(random_map(30, 5, bees=.4), T_env=20, k_stay=30, engine='sparse', seed=4)
+    b.run(3)
+    b.to_file(path)
+    loaded = BeeClust.from_file(path, seed=5)
+    assert type(loaded.map) is numpy.ndarray
+    assert (loaded.map == b.map).all()
+    assert (loaded.T_env, loaded.k_stay, loaded.engine, loaded.seed) == (20, 30, 'sparse', 5)
+    assert (loaded.heatmap == b.heatmap).all()
+
+
+def test_memmap_is_accepted_as_map(tmp_path):
+    path = tmp_path / 'map.bcm'
+    save_map(path, random_map(30, 5, bees=.4))
+    map, _ = load_map(path, mode='r')
+    b = BeeClust(map)
+    b.tick()
+    assert (map == random_map(30, 5, bees=.4)).all()
+
+
+def test_memmap_is_not_copied(tmp_path):
+    path = tmp_path / 'map.bcm'
+    save_map(path, random_map(30, 5, bees=.4))
+    map, _ = load_map(path, mode='r+')
+    b = BeeClust(map, dtype='int8', seed=1)
+    assert numpy.shares_memory(b.map, map)
+    b.run(5)
+    map.flush()
+    assert (load_map(path, mode=None)[0] == b.map).all()
+    assert not (b.map == random_map(30, 5, bees=.4)).all()
+
+
+def test_text_is_converted(tmp_path):
+    text, binary = tmp_path / 'map.txt', tmp_path / 'map.bcm'
+    map = random_map(30, 5, bees=.4)
+    numpy.savetxt(text, map.astype(numpy.int8))
+    assert not is_map_file(text)
+    assert (load_text(text) == map).all()
+    convert_text(text, binary)
+    assert (load_map(binary)[0] == map).all()
+
+
+def test_wrong_file(tmp_path):
+    path = tmp_path / 'map.txt'
+    path.write_text('0 1 2\n')
+    with pytest.raises(ValueError):
+        load_map(path)
+    path.write_text('0 1.5 2\n')
+    with pytest.raises(ValueError):
+        load_text(path)
+
+
+def test_simulation_from_file_keeps_narrow_map(tmp_path):
+    path = tmp_path / 'map.bcm'
+    BeeClust(random_map(30, 5, bees=.4), dtype='int64').to_file(path)
+    loaded = BeeClust.from_file(path)
+    assert loaded.dtype == numpy.int8
+    # the map is a view of the memory-mapped file, not a copy of it
+    assert isinstance(loaded.map.base, numpy.memmap)
+    assert loaded.map.base._mmap is not None
+    assert BeeClust.from_file(path, k_stay=200).dtype == numpy.int16
+    assert BeeClust.from_file(path, dtype='int64').dtype == numpy.int64
@@ -0,0 +1,44 @@
+import pytest
+
+from helpers import random_map
+from beeclust import BeeClust
+from beeclust.fastbee import rng_state
+
+
+def test_same_seed_same_simulation():
+    for engine in BeeClust.ENGINES:
+        b = BeeClust(random_map(32, 7), seed=42, engine=engine)
+        c = BeeClust(random_map(32, 7), seed=42, engine=engine)
+        assert [b.tick() for _ in range(20)] == [c.tick() for _ in range(20)]
+        assert (b.map == c.map).all()
+
+
+def test_different_seed_different_simulation():
+    b = BeeClust(random_map(32, 7), seed=1)
+    c = BeeClust(random_map(32, 7), seed=2)
+    b.run(20)
+    c.run(20)
+    assert (b.map != c.map).any()
+
+
+def test_run_and_ticks_use_same_stream():
+    b = BeeClust(random_map(32, 7), seed=3)
+    c = BeeClust(random_map(32, 7), seed=3)
+    moved = b.run(15)
+    assert list(moved) == [c.tick() for _ in range(15)]
+    assert (b.map == c.map).all()
+
+
+def test_seed_must_be_int():
+    with pytest.raises(TypeError) as excinfo:
+        BeeClust(random_map(32, 7), seed='impossibru')
+    assert 'seed' in str(excinfo.value)
+
+
+def test_rng_state_streams():
+    assert (rng_state(5) == rng_state(5)).all()
+    assert (rng_state(5) != rng_state(6)).any()
+    streams = rng_state(5, 4)
+    assert streams.shape == (4, 4)
+    assert (streams[0] == rng_state(5)).all()
+    assert len({tuple(s) for s in streams}) == 4
@@ -0,0 +1,94 @@
+import numpy
+import pytest
+
+from helpers import random_map
+from beeclust import BeeClust, TrajectoryRecorder, Trajectory
+
+
+@pytest.mark.parametrize('engine, threads', [('raster', 1), ('sparse', 1), ('raster', 3)])
+def test_frames_are_maps_after_ticks(tmp_path, engine, threads):
+    b = BeeClust(random_map(30, 5, bees=.4), engine=engine, threads=threads, seed=1)
+    path = tmp_path / 'run.rec'
+    snapshots = [b.map.copy()]
+    with TrajectoryRecorder(b, path, keyframe_every=4) as recorder:
+        for _ in range(10):
+            b.tick()
+            snapshots.append(b.map.copy())
+        b.set_cell(0, 0, 6)
+        b.tick()
+        snapshots.append(b.map.copy())
+    assert recorder.closed
+    with Trajectory(path) as trajectory:
+        assert len(trajectory) == len(snapshots)
+        assert trajectory.shape == b.map.shape
+        assert trajectory.parameters['engine'] == engine
+        for t, snapshot in enumerate(snapshots):
+            assert (trajectory[t] == snapshot).all()
+
+
+def test_run_is_recorded_with_callback(tmp_path):
+    b = BeeClust(random_map(30, 5, bees=.4), seed=2)
+    path = tmp_path / 'run.rec'
+    seen = []
+    with TrajectoryRecorder(b, path, keyframe_every=3):
+        b.run(7, callback=lambda beeclust, ticks: seen.append(ticks), every=2)
+        last = b.map.copy()
+    assert seen == [2, 4, 6, 7]
+    with Trajectory(path) as trajectory:
+        assert len(trajectory) == 8
+        assert (trajectory[-1] == last).all()
+
+
+def test_random_access_replay_and_changes(tmp_path):
+    b = BeeClust(random_map(30, 5, bees=.4), seed=3)
+    path = tmp_path / 'run.rec'
+    snapshots = [b.map.copy()]
+    with TrajectoryRecorder(b, path, keyframe_every=5):
+        for _ in range(12):
+            b.tick()
+            snapshots.append(b.map.copy())
+    with Trajectory(path) as trajectory:
+        for t in [7, 2, 12, 0, 5, 6, -1, -13]:
+            assert (trajectory[t] == snapshots[t]).all()
+        with pytest.raises(IndexError):
+            trajectory[13]
+        for t, frame in trajectory.replay(3, 9):
+            assert (frame == snapshots[t]).all()
+        for t in range(1, 13):
+            positions, values = trajectory.changes(t)
+            assert set(map(tuple, positions.tolist())) == \
+                set(map(tuple, numpy.argwhere(snapshots[t] != snapshots[t - 1]).tolist()))
+            assert (values == snapshots[t][tuple(positions.T)]).all()
+
+
+def test_unclosed_file_can_be_read(tmp_path):
+    b = BeeClust(random_map(30, 5, bees=.4), seed=4)
+    path = tmp_path / 'run.rec'
+    recorder = TrajectoryRecorder(b, path, keyframe_every=2)
+    b.run(5)
+    recorder.flush()
+    recorder._file.flush()
+    with Trajectory(path) as trajectory:
+        assert len(trajectory) == 6
+        assert (trajectory[5] == b.map).all()
+    recorder.close()
+
+
+def test_detached_recorder_stops_recording(tmp_path):
+    b = BeeClust(random_map(30, 5, bees=.4), seed=5)
+    path = tmp_path / 'run.rec'
+    recorder = TrajectoryRecorder(b, path)
+    b.tick()
+    recorder.close()
+    b.tick()
+    with pytest.raises(ValueError):
+        b.detach(recorder)
+    with Trajectory(path) as trajectory:
+        assert len(trajectory) == 2
+
+
+def test_wrong_file(tmp_path):
+    path = tmp_path / 'map.txt'
+    path.write_bytes(b'0 1 2\n' * 10)
+    with pytest.raises(ValueError):
+        Trajectory(path)
@@ -1,4 +1,5 @@
 import numpy
+import os
 import pytest
 import time
 from beeclust import BeeClust
@@ -21,6 +22,20 @@ def test_heatmap_is_fast():
         assert b.heatmap.shape
 
 
+# large maps use int8 map and compact distances from heaters and coolers
+LARGE_SIZE = 8192
+
+
+@pytest.mark.timeout(30)
+def test_large_heatmap_is_fast():
+    p = [.35, .05, .05, .05, .05, .05, .2, .2]
+    map = numpy.random.choice(len(p), LARGE_SIZE ** 2, p=p).astype(numpy.int8).reshape((LARGE_SIZE, LARGE_SIZE))
+    b = BeeClust(map, dtype='int8')
+    assert b.heatmap.shape == (LARGE_SIZE, LARGE_SIZE)
+    # distances and BFS queue take 8 bytes per position
+    assert b._workspace.nbytes <= 8 * LARGE_SIZE ** 2
+
+
 # prepare a BeeClust outside of a test
 a_beeclust = BeeClust(random_map())
 # touch the heatmap just for sure
@@ -52,3 +67,17 @@ def test_tick_is_fast():
         nmoved = b_beeclust.tick()
         assert nmoved != moved  # well, it could, but low probability
         moved = nmoved
+
+
+# prepare a parallel BeeClust outside of a test
+c_beeclust = BeeClust(random_map(), threads=max(2, os.cpu_count() or 1))
+
+
+@pytest.mark.timeout(10)
+def test_parallel_tick_is_fast():
+    moved = 0
+    for i in range(20):
+        print(i)
+        nmoved = c_beeclust.tick()
+        assert nmoved != moved  # well, it could, but low probability
+        moved = nmoved
@@ -2,6 +2,7 @@ import numpy
 
 from helpers import zeros8
 from beeclust import BeeClust
+from beeclust.beeclustClass import Swarms
 
 
 def swt(swarms):
@@ -70,3 +71,39 @@ def test_swarms_change_after_tick():
     assert len(b.swarms) == 1
     assert len(swt(b.swarms)[0]) == 1
     assert swt(b.swarms)[0][0] != (1, 0)
+
+
+def test_swarm_labels_arrays():
+    simple_map = numpy.array(
+        [
+            [1, 0, 0, 5],
+            [-1, 0, 2, 3],
+            [0, 0, 0, 6],
+        ], dtype=numpy.int8)
+    b = BeeClust(simple_map)
+    labels, offsets, coords = b.swarm_labels()
+    assert labels.dtype == numpy.int32
+    assert (labels == [[1, 0, 0, 0], [1, 0, 2, 2], [0, 0, 0, 0]]).all()
+    assert list(offsets) == [0, 2, 4]
+    assert sorted(map(tuple, coords[offsets[1]:offsets[2]])) == [(1, 2), (1, 3)]
+
+
+def test_swarms_view_is_list_like():
+    simple_map = zeros8((3, 3))
+    simple_map[1, 0] = -5
+    simple_map[0, 2] = 4
+    b = BeeClust(simple_map)
+    assert b.swarms == [[(0, 2)], [(1, 0)]]
+    assert b.swarms[-1] == [(1, 0)]
+    assert b.swarms[:1] == [[(0, 2)]]
+    assert repr(b.swarms) == '[[(0, 2)], [(1, 0)]]'
+
+
+def test_swarm_engines_find_same_swarms():
+    numpy.random.seed(4)
+    simple_map = numpy.random.choice([0, 1, -2, 5], 50 * 40, p=[.4, .3, .2, .1]).reshape((50, 40))
+    swarms = [BeeClust(simple_map, swarm_engine=engine).swarm_labels() for engine in BeeClust.SWARM_ENGINES]
+    (labels, offsets, coords), (bfs_labels, bfs_offsets, bfs_coords) = swarms
+    assert (labels == bfs_labels).all()
+    assert (offsets == bfs_offsets).all()
+    assert swt(Swarms(labels, offsets, coords)) == swt(Swarms(bfs_labels, bfs_offsets, bfs_coords))
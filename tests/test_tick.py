@@ -269,3 +269,35 @@ def test_forget_direction_waiting():
         b.map[0, -1] = lo[0, -1] = 7
         b.forget()
         assert (b.map == lo).all()
+
+
+def test_run_returns_moved_for_each_tick():
+    b = BeeClust(numpy.array([[2, 0, 0, 0, 0, 0, 0, 0, 0, 0]]), p_changedir=0)
+    moved = b.run(12)
+    assert isinstance(moved, numpy.ndarray)
+    assert list(moved[:9]) == [1] * 9
+    assert moved[9] == 0
+    assert b.map[0, 0] == 0
+
+
+def test_run_is_same_as_ticks():
+    original = numpy.array([[0, 0, 0], [1, 0, 1]])
+    b = BeeClust(original.copy(), p_changedir=0, p_wall=0)
+    moved = b.run(5)
+    c = BeeClust(original.copy(), p_changedir=0, p_wall=0)
+    assert list(moved) == [c.tick() for _ in range(5)]
+    assert (b.map == c.map).all()
+
+
+def test_run_callback_every():
+    calls = []
+    b = BeeClust(zeros8((4, 6)))
+    moved = b.run(10, callback=lambda bc, ticks: calls.append(ticks), every=3)
+    assert len(moved) == 10
+    assert calls == [3, 6, 9, 10]
+
+
+def test_run_callback_stops():
+    b = BeeClust(zeros8((4, 6)))
+    moved = b.run(10, callback=lambda bc, ticks: ticks >= 4, every=2)
+    assert len(moved) == 4
@@ -0,0 +1,118 @@
+import numpy
+import pytest
+
+from helpers import zeros8, random_map
+from beeclust import BeeClust, SwarmTracker
+
+
+def tracked_swarms(tracker):
+    swarms = {}
+    for position in zip(*numpy.nonzero(tracker.labels)):
+        swarms.setdefault(tracker.swarm_at(*position), set()).add(tuple(int(x) for x in position))
+    return swarms
+
+
+def assert_in_sync(tracker, b):
+    swarms = tracked_swarms(tracker)
+    assert sorted(map(sorted, swarms.values())) == sorted(map(sorted, b.swarms))
+    assert tracker.sizes == {swarm_id: len(swarm) for swarm_id, swarm in swarms.items()}
+    assert len(tracker) == len(b.swarms)
+
+
+@pytest.mark.parametrize('engine, threads', [('raster', 1), ('sparse', 1), ('raster', 3)])
+def test_tracker_follows_ticks(engine, threads):
+    b = BeeClust(random_map(30, 5, bees=.4), engine=engine, threads=threads, seed=2)
+    t = SwarmTracker(b)
+    assert_in_sync(t, b)
+    for _ in range(30):
+        b.tick()
+        t.update()
+        assert_in_sync(t, b)
+
+
+def test_tracker_follows_run_and_set_cell():
+    b = BeeClust(random_map(30, 5, bees=.4), seed=3)
+    t = SwarmTracker(b)
+    b.run(5)
+    t.update()
+    assert_in_sync(t, b)
+    b.set_cell(0, 0, 0)
+    b.set_cell(0, 1, -5)
+    t.update()
+    assert_in_sync(t, b)
+
+
+def test_sync_after_direct_change():
+    b = BeeClust(random_map(30, 5, bees=.4), seed=4)
+    t = SwarmTracker(b)
+    b.map[:, :3] = 0
+    t.sync()
+    assert_in_sync(t, b)
+
+
+def test_waiting_swarm_keeps_id():
+    map = zeros8((10, 10))
+    map[1, 1:4] = -100
+    map[8, 5] = 2
+    b = BeeClust(map, p_changedir=0, p_wall=0)
+    t = SwarmTracker(b)
+    swarm_id = t.swarm_at(1, 1)
+    bee_id = t.swarm_at(8, 5)
+    for _ in range(3):
+        b.tick()
+        t.update()
+    assert t.swarm_at(1, 2) == swarm_id
+    assert t.size(swarm_id) == 3
+    # moving bee is still the same swarm
+    assert t.swarm_at(8, 8) == bee_id
+    assert len(t.born) == 0 and len(t.died) == 0
+
+
+def test_merge_keeps_id_of_bigger_swarm():
+    map = zeros8((5, 9))
+    map[2, 0:3] = -100
+    map[2, 4:9] = -100
+    b = BeeClust(map)
+    t = SwarmTracker(b)
+    small, big = t.swarm_at(2, 0), t.swarm_at(2, 4)
+    b.set_cell(2, 3, -100)
+    t.update()
+    assert len(t) == 1
+    assert t.swarm_at(2, 0) == big
+    assert t.size(big) == 9
+    assert list(t.died) == [small]
+    assert small not in t
+
+
+def test_split_gives_new_id_to_smaller_part():
+    map = zeros8((5, 9))
+    map[2, :] = -100
+    b = BeeClust(map)
+    t = SwarmTracker(b)
+    swarm_id = t.swarm_at(2, 0)
+    b.set_cell(2, 3, 0)
+    t.update()
+    assert len(t) == 2
+    assert t.swarm_at(2, 8) == swarm_id
+    assert t.size(swarm_id) == 5
+    assert list(t.born) == [t.swarm_at(2, 0)]
+    assert t.swarm_at(2, 0) != swarm_id
+    assert t.positions(t.swarm_at(2, 0)).tolist() == [[2, 0], [2, 1], [2, 2]]
+
+
+@pytest.mark.parametrize('engine, threads', [('raster', 1), ('sparse', 1), ('raster', 3)])
+def test_changed_cells_contain_all_changes(engine, threads):
+    b = BeeClust(random_map(30, 5, bees=.4), engine=engine, threads=threads, seed=6)
+    for _ in range(5):
+        before = b.map.copy()
+        b.tick()
+        changed = set(map(tuple, b.changed_cells.tolist()))
+        assert set(map(tuple, numpy.argwhere(before != b.map).tolist())) <= changed
+
+
+def test_changed_cells_after_set_cell_and_run():
+    b = BeeClust(random_map(30, 5, bees=.4), seed=7)
+    b.set_cell(3, 4, 5)
+    assert b.changed_cells.tolist() == [[3, 4]]
+    b.run(2)
+    assert b.changed_cells is None